@@ -1,28 +1,44 @@
 # Standard library imports
 import os
-import importlib
 import sys
+import warnings
 
 # Third-party imports
-from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, HTTPException,APIRouter
-from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 
 # Local application imports
 from app.base.logger import logger as _logger
 from app.base.auth.auth import router as authService
-from app.base.utils import log_request_info
-from app.base.module import Module
 from app.base.routing_utils.routing import Routing
+from app.base.openapi import OpenAPICache
+from app.base.routing_utils.radix import RadixDispatcher
+from app.base.routing_utils.module_sync import ModuleSync, ModuleSyncMiddleware, MODULE_SYNC_ENABLED
+from app.base.middleware.request_logging import RequestLoggingMiddleware, REQUEST_LOG_ENABLED
+from app.base.middleware.compression import CompressionMiddleware, COMPRESSION_ENABLED
+from app.base.metrics import MetricsMiddleware, METRICS_ENABLED, collector as metrics_collector
+from app.base.profiler import ProfilingMiddleware, profiler
+from app.base.response_cache import ResponseCache, RESPONSE_CACHE_ENABLED
+from app.base.single_flight import SingleFlight, SINGLE_FLIGHT_ENABLED
+from app.base.loop_lag import BlockingDetector, loop_lag, LOOP_BLOCK_DETECTOR
+from app.base.rate_limit import (
+    LoadShedder, RateLimit, RateLimiter, RateLimitMiddleware,
+    RATE_LIMIT_ENABLED, RATE_LIMIT_CLIENT_RATE, RATE_LIMIT_CLIENT_BURST,
+)
+from app.base.startup import StartupProfileMiddleware, startup_profile
+from app.base.threadpool import AddonThreadPools, ADDON_THREADS_ENABLED
+from app.base.serialization import FastJSON, FastJSONResponse, JSON_MODE
+from app.base.static_pages import DocsPages
+from app.base.settings import settings
 # from app.base.db import get_session
 
-# Miscellaneous
-import urllib3
+# Disable SSL warnings, through the warnings filter so urllib3 is only imported by the addons that use it
+warnings.filterwarnings("ignore", message="Unverified HTTPS request")
 
-# Disable SSL warnings
-urllib3.disable_warnings()
+# 'radix' dispatches requests through a prefix tree of the routes, 'linear' is Starlette's default
+ROUTER_MODE = os.environ.get("ROUTER_MODE", "linear")
 
 class FastAPIWrapper:
 
@@ -34,22 +50,12 @@ class FastAPIWrapper:
 
     def load_env(self):
         """
-        Loads every config file inside config/ in to the environment
+        Loads the config/.config.env and config/.secrets.env files of the app and of every
+        addon in to the settings store, and reloads the changed ones on SIGHUP.
         """
-        addons_dir = os.path.join(os.path.dirname(__file__), '../')
-        for root, dirs, files in os.walk(addons_dir):
-            if 'tests' in dirs:
-                _logger.debug(f"Skipped test dir: {os.path.join(root, 'tests')}")
-                dirs.remove('tests')  # Prevent descending into 'tests' directories
-
-            if os.path.basename(root) == 'config':
-                _logger.debug(f"Inspecting 'config' folder: {root}")
-                
-                # Find all *.env files in this folder
-                for file in files:
-                    if file.endswith('.env'):
-                        env_file_path = os.path.join(root, file)
-                        _logger.info(f"Found .env file: {env_file_path}")
+        namespaces = settings.load()
+        settings.install_signal_handler()
+        _logger.info(f"Loaded the settings of {len(namespaces)} namespaces")
 
 
     def create_app(self):
@@ -59,15 +65,31 @@ class FastAPIWrapper:
             openapi_url=f"/openapi.json",
             docs_url="/docs/",
             description=description,
+            default_response_class=FastJSONResponse if JSON_MODE == 'fast' else JSONResponse,
         )
-        self.load_env()
-
-        self.setup_base_routes(app=fastapi_app)
-        self.setup_addon_routers(app=fastapi_app)
-
-        self.use_route_names_as_operation_ids(app=fastapi_app)
+        with startup_profile.phase('load_env'):
+            self.load_env()
 
-        self.setup_middleware(app=fastapi_app)
+        steps = (
+            self.setup_base_routes,
+            self.setup_json,
+            self.setup_addon_threads,
+            self.setup_response_cache,
+            self.setup_single_flight,
+            self.setup_rate_limit,
+            self.setup_blocking_detector,
+            self.setup_addon_routers,
+            self.use_route_names_as_operation_ids,
+            self.setup_openapi,
+            self.setup_docs_pages,
+            self.setup_router,
+            self.setup_module_sync,
+            self.setup_middleware,
+        )
+        for step in steps:
+            with startup_profile.phase(step.__name__):
+                step(app=fastapi_app)
+        startup_profile.addons = self.routing.load_report
         return fastapi_app
 
     def setup_base_routes(self,app: FastAPI) -> None:
@@ -78,6 +100,62 @@ class FastAPIWrapper:
             tags=["Authentication Service"],
         )
 
+    def setup_json(self,app: FastAPI) -> None:
+        """
+        Encode the responses of the addon routes in one pass in `fast` mode, app-wide with
+        JSON_MODE=fast or per addon with 'json': 'fast' in the manifest. Encoded by orjson,
+        or by the json module when orjson isn't installed.
+        """
+        self.fast_json = FastJSON(self.routing.modules)
+
+    def setup_addon_threads(self,app: FastAPI) -> None:
+        """
+        Limit the threads the sync routes of each addon use at once, from the `threadpool`
+        section of their manifest. Installed first, so cache hits and rejected requests
+        never hold a thread. Disabled with ADDON_THREADS_ENABLED=false.
+        """
+        self.addon_threads = AddonThreadPools(
+            self.routing.modules, collector=metrics_collector if METRICS_ENABLED else None,
+        ) if ADDON_THREADS_ENABLED else None
+
+    def setup_response_cache(self,app: FastAPI) -> None:
+        """
+        Cache the responses of addon routes that ask for it with `cached` or the `cache`
+        section of their manifest. Disabled with RESPONSE_CACHE_ENABLED=false.
+        """
+        self.response_cache = ResponseCache(self.routing.modules) if RESPONSE_CACHE_ENABLED else None
+
+    def setup_single_flight(self,app: FastAPI) -> None:
+        """
+        Let concurrent identical GET requests share one execution on the addon routes that
+        opt in with `single_flight` or their manifest. Disabled with SINGLE_FLIGHT_ENABLED=false.
+        """
+        self.single_flight = SingleFlight(self.routing.modules) if SINGLE_FLIGHT_ENABLED else None
+
+    def setup_rate_limit(self,app: FastAPI) -> None:
+        """
+        Token bucket limits of the addon routes from the `rate_limit` section of their
+        manifest, and load shedding of every request in setup_middleware. Installed outside
+        single-flight and inside the blocking detector, a rejected request never reaches
+        single-flight or the response cache.
+        Disabled with RATE_LIMIT_ENABLED=false.
+        """
+        if not RATE_LIMIT_ENABLED:
+            self.rate_limiter = self.load_shedder = None
+            return
+        self.rate_limiter = RateLimiter(self.routing.modules, collector=metrics_collector if METRICS_ENABLED else None)
+        self.load_shedder = LoadShedder(loop_lag)
+
+    def setup_blocking_detector(self,app: FastAPI) -> None:
+        """
+        Tag the requests of the addon routes so a blocked event loop is pinned on the route
+        and addon that blocked it, see LOOP_BLOCK_DETECTOR. Installed last, the outermost
+        layer covers the time spent in every other one.
+        """
+        self.blocking_detector = BlockingDetector(
+            self.routing.modules, collector=metrics_collector if METRICS_ENABLED else None,
+        ) if LOOP_BLOCK_DETECTOR != 'off' else None
+
     def setup_addon_routers(self,app: FastAPI) -> None:
         """
             Import all routes using dynamic importing (Reflections)
@@ -85,6 +163,38 @@ class FastAPIWrapper:
         self.routing.register_routes(app=app)
 
 
+    def setup_openapi(self,app: FastAPI) -> None:
+        """
+        Serve openapi.json from per-module fragments, with an ETag and precompressed bodies.
+        """
+        self.openapi_cache = OpenAPICache(app, self.routing.modules)
+        self.openapi_cache.install()
+
+    def setup_docs_pages(self,app: FastAPI) -> None:
+        """
+        Serve the Swagger UI and ReDoc pages rendered and compressed once, with an ETag.
+        """
+        self.docs_pages = DocsPages(app)
+        self.docs_pages.install()
+
+
+    def setup_router(self,app: FastAPI) -> None:
+        """
+        With ROUTER_MODE=radix requests are dispatched through a prefix tree of the
+        routes instead of trying every route in order.
+        """
+        if ROUTER_MODE == 'radix':
+            self.dispatcher = RadixDispatcher.install(app, self.routing.modules)
+
+
+    def setup_module_sync(self,app: FastAPI) -> None:
+        """
+        Share module enable/remove between the gunicorn workers through the module state
+        file. Disabled with MODULE_SYNC_ENABLED=false.
+        """
+        self.module_sync = ModuleSync(self.routing, app) if MODULE_SYNC_ENABLED else None
+
+
     def setup_middleware(self,app : FastAPI):
         origins = [
             "http://localhost",
@@ -92,6 +202,22 @@ class FastAPIWrapper:
             "http://localhost:8080",
         ]
 
+        if COMPRESSION_ENABLED:
+            # Innermost, every other middleware sees the response as it is sent
+            app.add_middleware(middleware_class=CompressionMiddleware)
+
+        if self.module_sync is not None:
+            app.add_middleware(middleware_class=ModuleSyncMiddleware, sync=self.module_sync)
+
+        if self.rate_limiter is not None:
+            # Inside CORS, so browsers can read the 429/503 answers
+            app.add_middleware(
+                middleware_class=RateLimitMiddleware,
+                limiter=self.rate_limiter,
+                shedder=self.load_shedder,
+                client_limit=RateLimit(RATE_LIMIT_CLIENT_RATE, RATE_LIMIT_CLIENT_BURST) if RATE_LIMIT_CLIENT_RATE else None,
+            )
+
         app.add_middleware(
             middleware_class=CORSMiddleware,
             allow_credentials=True,
@@ -100,6 +226,24 @@ class FastAPIWrapper:
             allow_headers=["*"],
         )
 
+        app.add_middleware(middleware_class=ProfilingMiddleware, profiler=profiler)
+
+        if METRICS_ENABLED:
+            app.add_middleware(
+                middleware_class=MetricsMiddleware,
+                collector=metrics_collector,
+                registry=self.routing.modules,
+            )
+
+        if REQUEST_LOG_ENABLED:
+            app.add_middleware(
+                middleware_class=RequestLoggingMiddleware,
+                registry=self.routing.modules,
+            )
+
+        if startup_profile.enabled:
+            app.add_middleware(middleware_class=StartupProfileMiddleware, profile=startup_profile)
+
         # app.add_middleware(
         #     # Ensures all trafic to server is ssl encrypted or is rederected to https / wss
         #     middleware_class=HTTPSRedirectMiddleware
@@ -1,19 +1,59 @@
 from fastapi.routing import APIRouter
-from fastapi import HTTPException, Depends
-from typing import Any
-from datetime import timedelta
-
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-import base64
+from fastapi import Depends, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 
 from ..models.auth import User
 
 from app.base.logger import logger as _logger
-import os
+from app.base.auth.passwords import UserStore, verify_password_async
+from app.base.auth.tokens import TokenError, token_service
 
 router = APIRouter()
+users = UserStore()
+
+
+async def verify_token(request: Request) -> dict:
+    """
+    Dependency checking the bearer token of the request. The claims are returned and
+    stored on `request.state.token`. Addons add `require_token` to their `dependency`
+    list to protect every route of their router.
+
+    Raises:
+        HTTPException: 401 when the token is missing or not valid.
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = token_service.verify(token)
+    except TokenError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+    request.state.token = claims
+    return claims
+
+
+require_token = Depends(verify_token)
+
 
 @router.post('/login')
-def login(user: User):
-    return {"access_token": "200"}
\ No newline at end of file
+async def login(user: User):
+    account = users.get(user.username)
+    # The password is checked in the threadpool, also for unknown users so both take as long
+    valid = await verify_password_async(user.password, account.get('password_hash') if account else None)
+    if not valid:
+        _logger.info(f"Failed login of '{user.username}' from '{user.hostname}'")
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    token, claims = token_service.issue(user.username, host=user.hostname, scopes=account.get('scopes', []))
+    return {"access_token": token, "token_type": "bearer", "expires_in": claims['exp'] - claims['iat']}
+
+
+@router.post('/logout')
+async def logout(claims: dict = require_token):
+    """ Revoke the token of the request in every worker. """
+    await run_in_threadpool(token_service.revoke, claims)
+    return {"status": "success"}
+
+
+@router.get('/stats')
+async def stats():
+    return token_service.stats()
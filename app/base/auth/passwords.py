@@ -0,0 +1,128 @@
+# Standard library imports
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sys
+
+# Third-party imports
+import anyio
+
+# Local application imports
+from app.base.logger import logger as _logger, ROOT_DIR
+
+# scrypt cost, every hash stores its own parameters so raising it keeps old hashes valid
+AUTH_SCRYPT_N = int(os.environ.get("AUTH_SCRYPT_N", 2 ** 14))
+AUTH_SCRYPT_R = int(os.environ.get("AUTH_SCRYPT_R", 8))
+AUTH_SCRYPT_P = int(os.environ.get("AUTH_SCRYPT_P", 1))
+# Hashes computed at the same time, more would only take CPU time away from the event loop
+AUTH_HASH_CONCURRENCY = int(os.environ.get("AUTH_HASH_CONCURRENCY", os.cpu_count() or 1))
+# {"username": {"password_hash": "scrypt$...", "scopes": [...]}}, hashes come from `python -m app.base.auth.passwords`
+AUTH_USERS_PATH = os.environ.get("AUTH_USERS_PATH", os.path.join(ROOT_DIR, 'config', 'users.json'))
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # 128 * n * r bytes of memory, allow twice that for the other buffers of scrypt
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 2 ** 20, dklen=32)
+
+
+def hash_password(password: str) -> str:
+    """
+    Hash a password with scrypt, takes tens of milliseconds of CPU on purpose.
+
+    Returns:
+        str: `scrypt$n$r$p$salt$hash`, salt and hash in base64.
+    """
+    salt = secrets.token_bytes(16)
+    digest = _scrypt(password, salt, AUTH_SCRYPT_N, AUTH_SCRYPT_R, AUTH_SCRYPT_P)
+    return f"scrypt${AUTH_SCRYPT_N}${AUTH_SCRYPT_R}${AUTH_SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    try:
+        scheme, n, r, p, salt, digest = password_hash.split('$')
+        if scheme != 'scrypt':
+            return False
+        expected = base64.b64decode(digest)
+        return hmac.compare_digest(_scrypt(password, base64.b64decode(salt), int(n), int(r), int(p)), expected)
+    except (ValueError, TypeError):
+        _logger.error("Malformed password hash")
+        return False
+
+
+# Checked for unknown users, so a login takes as long whether the user exists or not.
+# Made on first use, hashing at import would slow down the startup
+_dummy_hash = None
+
+
+def _get_dummy_hash() -> str:
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_urlsafe(16))
+    return _dummy_hash
+
+
+_hash_limiter = None
+
+
+async def _run_hashing(func, *args):
+    # Its own limiter instead of the shared threadpool, so a burst of logins queues here
+    # without starving the event loop or the sync endpoints
+    global _hash_limiter
+    if _hash_limiter is None:
+        _hash_limiter = anyio.CapacityLimiter(AUTH_HASH_CONCURRENCY)
+    return await anyio.to_thread.run_sync(func, *args, limiter=_hash_limiter)
+
+
+async def hash_password_async(password: str) -> str:
+    """ `hash_password` in a worker thread, scrypt would block the event loop for its whole duration. """
+    return await _run_hashing(hash_password, password)
+
+
+async def verify_password_async(password: str, password_hash: str = None) -> bool:
+    """ `verify_password` in a worker thread. Without a hash a dummy one is checked and False returned. """
+    if password_hash is None:
+        await _run_hashing(lambda: verify_password(password, _get_dummy_hash()))
+        return False
+    return await _run_hashing(verify_password, password, password_hash)
+
+
+class UserStore:
+    """
+    The accounts allowed to log in, read from AUTH_USERS_PATH and reloaded when the file changes.
+    """
+
+    def __init__(self, path: str = AUTH_USERS_PATH):
+        self.path = path
+        self.users = {}
+        self._signature = None
+
+    def get(self, username: str) -> dict:
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        if signature != self._signature:
+            self._signature = signature
+            self.users = self._read() if signature is not None else {}
+        return self.users.get(username)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            _logger.error(f"Could not read the users file {self.path}: {e}")
+            return {}
+
+
+if __name__ == "__main__":
+    # python -m app.base.auth.passwords <password>, prints the hash to put in the users file
+    print(hash_password(sys.argv[1]))
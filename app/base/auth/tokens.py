@@ -0,0 +1,292 @@
+# Standard library imports
+import base64
+import fcntl
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Local application imports
+from app.base.logger import logger as _logger, ROOT_DIR
+
+# Signing key of the tokens. Every worker must use the same one, without AUTH_SECRET the
+# first worker generates it into AUTH_SECRET_PATH and the others read it from there
+AUTH_SECRET = os.environ.get("AUTH_SECRET")
+AUTH_SECRET_PATH = os.environ.get("AUTH_SECRET_PATH", os.path.join(ROOT_DIR, 'cache', 'auth_secret'))
+# Lifetime of an issued token in seconds
+AUTH_TOKEN_TTL = int(os.environ.get("AUTH_TOKEN_TTL", 3600))
+# Verified tokens kept per worker, and for how long at most before they are checked again
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", 10000))
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", 300))
+# Revoked token ids shared by the workers, checked for changes at most every AUTH_REVOCATION_INTERVAL seconds
+AUTH_REVOCATION_PATH = os.environ.get("AUTH_REVOCATION_PATH", os.path.join(ROOT_DIR, 'cache', 'revoked_tokens.json'))
+AUTH_REVOCATION_INTERVAL = float(os.environ.get("AUTH_REVOCATION_INTERVAL", 1.0))
+
+
+class TokenError(Exception):
+    """ The token is malformed, badly signed, expired or revoked. """
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def load_secret(path: str = AUTH_SECRET_PATH) -> bytes:
+    """ Read the signing key from `path`, creating it if no worker did yet. """
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    secret = secrets.token_bytes(32)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another worker won the race, use its key
+        with open(path, 'rb') as f:
+            return f.read()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(secret)
+    _logger.warning(f"AUTH_SECRET is not set, generated a signing key in {path}")
+    return secret
+
+
+class TokenSigner:
+    """
+    HS256 JSON Web Tokens made and checked with the standard library.
+
+    Only tokens with the exact header this signer writes are accepted, so the algorithm
+    can't be picked by whoever sends the token.
+    """
+
+    HEADER = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(',', ':')).encode())
+
+    def __init__(self, secret: bytes):
+        self.secret = secret
+
+    def _signature(self, signing_input: bytes) -> str:
+        return _b64encode(hmac.new(self.secret, signing_input, hashlib.sha256).digest())
+
+    def encode(self, claims: dict) -> str:
+        signing_input = f"{self.HEADER}.{_b64encode(json.dumps(claims, separators=(',', ':')).encode())}"
+        return f"{signing_input}.{self._signature(signing_input.encode())}"
+
+    def decode(self, token: str, now: float = None) -> dict:
+        """
+        Returns:
+            dict: The claims of a well signed and unexpired token.
+
+        Raises:
+            TokenError: Otherwise.
+        """
+        try:
+            header, payload, signature = token.split('.')
+        except ValueError:
+            raise TokenError("Malformed token")
+        if header != self.HEADER:
+            raise TokenError("Unsupported token header")
+        # Bytes, compare_digest raises TypeError for str with non-ASCII characters
+        expected = self._signature(f"{header}.{payload}".encode()).encode()
+        if not hmac.compare_digest(signature.encode(), expected):
+            raise TokenError("Invalid token signature")
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            raise TokenError("Malformed token payload")
+        if not isinstance(claims, dict) or not isinstance(claims.get('exp'), (int, float)):
+            raise TokenError("Malformed token payload")
+        if claims['exp'] <= (time.time() if now is None else now):
+            raise TokenError("Token expired")
+        return claims
+
+
+class VerifiedTokenCache:
+    """
+    LRU of verified tokens with a TTL, skips the signature check of tokens seen recently.
+
+    An entry never outlives the token: it expires after `ttl` seconds or at the token's
+    `exp`, whichever comes first.
+    """
+
+    def __init__(self, max_size: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str, now: float) -> dict:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, claims: dict, now: float):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (claims, min(now + self.ttl, claims['exp']))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard_jti(self, jti: str):
+        with self._lock:
+            for token in [token for token, (claims, _) in self._entries.items() if claims.get('jti') == jti]:
+                del self._entries[token]
+
+    def stats(self) -> dict:
+        return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+
+class RevocationList:
+    """
+    Ids (`jti`) of the revoked tokens, shared by the workers through one JSON file:
+
+        {"a1b2c3": 1767225600}
+
+    mapping each id to the expiry of its token, after which it is dropped. Writes take an
+    flock and replace the file atomically, readers only stat() it at most every `interval`
+    seconds and re-read it when it changed. Without a path the list is local to the process.
+    """
+
+    def __init__(self, path: str = AUTH_REVOCATION_PATH, interval: float = AUTH_REVOCATION_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.revoked = {}
+        self._signature = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            _logger.error(f"Unreadable revocation file {self.path}: {e}")
+            return {}
+
+    def _refresh(self):
+        now = time.monotonic()
+        if not self.path or now < self._next_check:
+            return
+        with self._lock:
+            self._next_check = now + self.interval
+            signature = self._stat()
+            if signature != self._signature:
+                self._signature = signature
+                self.revoked = self._read()
+
+    def is_revoked(self, jti: str) -> bool:
+        self._refresh()
+        return jti in self.revoked
+
+    def revoke(self, jti: str, expires: float):
+        if not self.path:
+            with self._lock:
+                self.revoked[jti] = expires
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(f"{self.path}.lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                revoked = {key: exp for key, exp in self._read().items() if exp > now}
+                revoked[jti] = expires
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(revoked, f)
+                os.replace(tmp_path, self.path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        with self._lock:
+            self.revoked = revoked
+            self._signature = self._stat()
+
+
+class TokenService:
+    """
+    Issues, verifies and revokes the access tokens.
+
+    `verify` costs one dict lookup for a token seen in the last AUTH_CACHE_TTL seconds,
+    otherwise a base64/JSON decode and an HMAC. The revocation list is checked on every
+    call, cache hit or not, so a revoked token stops working in every worker within
+    AUTH_REVOCATION_INTERVAL seconds.
+    """
+
+    def __init__(self, secret: bytes = None, ttl: int = AUTH_TOKEN_TTL, cache: VerifiedTokenCache = None,
+                 revocations: RevocationList = None):
+        self._secret = secret
+        self._signer = None
+        self.ttl = ttl
+        self.cache = cache if cache is not None else VerifiedTokenCache()
+        self.revocations = revocations if revocations is not None else RevocationList()
+
+    @property
+    def signer(self) -> TokenSigner:
+        # The key is read on first use, importing the auth router doesn't touch the disk
+        if self._signer is None:
+            secret = self._secret or (AUTH_SECRET.encode() if AUTH_SECRET else load_secret())
+            self._signer = TokenSigner(secret)
+        return self._signer
+
+    def issue(self, subject: str, **claims) -> tuple:
+        """
+        Returns:
+            tuple: The token and its claims.
+        """
+        now = int(time.time())
+        claims = {**claims, 'sub': subject, 'iat': now, 'exp': now + self.ttl, 'jti': secrets.token_urlsafe(12)}
+        return self.signer.encode(claims), claims
+
+    def verify(self, token: str) -> dict:
+        """
+        Returns:
+            dict: The claims of the token.
+
+        Raises:
+            TokenError: When the token is not valid.
+        """
+        now = time.time()
+        claims = self.cache.get(token, now)
+        if claims is None:
+            claims = self.signer.decode(token, now)
+            self.cache.put(token, claims, now)
+        if self.revocations.is_revoked(claims.get('jti')):
+            raise TokenError("Token revoked")
+        return claims
+
+    def revoke(self, claims: dict):
+        self.revocations.revoke(claims['jti'], claims['exp'])
+        self.cache.discard_jti(claims['jti'])
+
+    def stats(self) -> dict:
+        return {'cache': self.cache.stats(), 'revoked': len(self.revocations.revoked)}
+
+
+token_service = TokenService()
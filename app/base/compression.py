@@ -0,0 +1,143 @@
+# Standard library imports
+import gzip
+import hashlib
+import zlib
+
+# Third-party imports
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Brotli is a dependency, without it in the environment only gzip variants are produced
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def compress(body: bytes, encoding: str, fast: bool = False) -> bytes:
+    """
+    Compress `body` with `encoding` ('gzip' or 'br').
+
+    Args:
+        fast (bool): Favour speed over ratio, for bodies compressed per request.
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=4 if fast else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=5 if fast else GZIP_LEVEL, mtime=0)
+
+
+class StreamCompressor:
+    """
+    Compresses a body sent in several chunks, each chunk is flushed so the client can use
+    it without waiting for the rest of the stream.
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=4)
+        else:
+            self._compressor = zlib.compressobj(5, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def available_encodings() -> tuple:
+    """ The content codings this process can produce, most preferred first. """
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress_variants(body: bytes) -> dict:
+    """ Compress `body` once with every available encoding, for responses served from memory. """
+    return {encoding: compress(body, encoding) for encoding in available_encodings()}
+
+
+def negotiate_encoding(accept_encoding: str, available) -> str:
+    """
+    Pick the content coding to use for a request.
+
+    Args:
+        accept_encoding (str): The Accept-Encoding header of the request.
+        available: Encodings that can be produced, most preferred first.
+
+    Returns:
+        str: The chosen encoding, or None for the identity coding.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.lower().split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip()] = q
+    wildcard = accepted.get('*', 0.0)
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def make_etag(body: bytes, encoding: str = None) -> str:
+    """
+    A strong ETag derived from the uncompressed body.
+
+    Args:
+        encoding (str): Content coding of the variant served, each variant has its own tag.
+    """
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """ Weak comparison of an If-None-Match header against `etag`, as used for GET/HEAD. """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return any(tag.removeprefix('W/') == etag.removeprefix('W/') for tag in candidates)
+
+
+class PrecompressedBody:
+    """
+    A response body kept in memory together with its compressed variants. Every variant
+    has its own strong ETag, they are different byte sequences.
+    """
+
+    def __init__(self, body: bytes, media_type: str):
+        self.body = body
+        self.media_type = media_type
+        self.etag = make_etag(body)
+        self.variants = compress_variants(body)
+        self.etags = {encoding: make_etag(body, encoding) for encoding in self.variants}
+        self.etags[None] = self.etag
+
+    def response(self, request: Request) -> Response:
+        """ Serve the best accepted encoding for `request`, 304 when the ETag of that variant matches. """
+        encoding = negotiate_encoding(request.headers.get('accept-encoding'), tuple(self.variants))
+        headers = {'ETag': self.etags[encoding], 'Vary': 'Accept-Encoding'}
+        if etag_matches(request.headers.get('if-none-match'), headers['ETag']):
+            return Response(status_code=304, headers=headers)
+        if encoding is None:
+            return Response(self.body, media_type=self.media_type, headers=headers)
+        headers['Content-Encoding'] = encoding
+        return Response(self.variants[encoding], media_type=self.media_type, headers=headers)
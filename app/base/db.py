@@ -1,16 +1,162 @@
-from typing import Generator, Any
-from app.base.logger import logger as _logger
-from sqlmodel import create_engine, SQLModel, Session
+from typing import Annotated, AsyncGenerator, Generator, Any
 import os
 
+from fastapi import Depends, Request
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlmodel import create_engine, SQLModel, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.base.logger import logger as _logger
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+# Engine settings, read from the process environment when this module is imported
 DATABASE_URL = os.environ.get("DATABASE_URL")
-engine = create_engine(DATABASE_URL, echo=True)
+# Defaults to DATABASE_URL with the async driver of its dialect, e.g. postgresql+asyncpg
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL")
+DB_ECHO = _env_bool("DB_ECHO", False)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 500))
+
+ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "sqlite": "aiosqlite",
+    "mysql": "aiomysql",
+}
+
+_engine = None
+_async_engine = None
+_async_session_factory = None
+
+
+def async_url(url: str) -> str:
+    """ Return `url` with the async driver of its dialect, unless it already names a driver. """
+    parsed = make_url(url)
+    if "+" in parsed.drivername:
+        return url
+    driver = ASYNC_DRIVERS.get(parsed.drivername)
+    if driver is None:
+        raise ValueError(f"No async driver known for database dialect '{parsed.drivername}', set ASYNC_DATABASE_URL")
+    return parsed.set(drivername=f"{parsed.drivername}+{driver}").render_as_string(hide_password=False)
+
+
+def engine_options(url: str) -> dict:
+    """ Keyword arguments for create_engine/create_async_engine from the DB_* settings. """
+    options = {
+        "echo": DB_ECHO,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "query_cache_size": DB_STATEMENT_CACHE_SIZE,
+    }
+    backend = make_url(url).get_backend_name()
+    if backend != "sqlite":
+        # SQLite uses a single connection or a per-thread pool, sizing doesn't apply
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    if make_url(url).get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+def get_engine() -> Engine:
+    """ The synchronous engine, created on first use. """
+    global _engine
+    if _engine is None:
+        if not DATABASE_URL:
+            raise RuntimeError("DATABASE_URL is not set")
+        _engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+    return _engine
+
+
+def get_async_engine() -> AsyncEngine:
+    """ The async engine, created on first use. """
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        url = ASYNC_DATABASE_URL or (DATABASE_URL and async_url(DATABASE_URL))
+        if not url:
+            raise RuntimeError("DATABASE_URL or ASYNC_DATABASE_URL is not set")
+        _async_engine = create_async_engine(url, **engine_options(url))
+        _async_session_factory = async_sessionmaker(_async_engine, class_=AsyncSession, expire_on_commit=False)
+    return _async_engine
+
+
+def dispose_engines(close: bool = True) -> None:
+    """
+    Drop both engines, they are created again on next use.
+
+    Args:
+        close (bool): Close the pooled connections. Pass False in a forked child, where the
+            connections belong to the parent and must only be forgotten.
+    """
+    global _engine, _async_engine, _async_session_factory
+    if _engine is not None:
+        _engine.dispose(close=close)
+    if _async_engine is not None:
+        _async_engine.sync_engine.dispose(close=close)
+    _engine = None
+    _async_engine = None
+    _async_session_factory = None
+
+
+def __getattr__(name: str):
+    # `from app.base.db import engine` keeps working, without creating an engine on import
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def init_db() -> None:
-    SQLModel.metadata.create_all(engine)
+    SQLModel.metadata.create_all(get_engine())
+
+
+async def init_async_db() -> None:
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
 
 
 def get_session() -> Generator[Session, Any, None]:
-    with Session(engine) as session:
-        yield session
\ No newline at end of file
+    with Session(get_engine()) as session:
+        yield session
+
+
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    get_async_engine()
+    async with _async_session_factory() as session:
+        yield session
+
+
+def async_session() -> AsyncSession:
+    """
+    A new AsyncSession the caller closes, for work that outlives the request dependencies,
+    like a streamed response: the sessions of `get_async_session` are closed before the
+    body of the response is sent.
+    """
+    get_async_engine()
+    return _async_session_factory()
+
+
+async def attach_async_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Router level dependency that opens an AsyncSession for the request and stores it on
+    `request.state.db`. Addons add `use_async_session` to their `dependency` list to get
+    a session in every route without touching the engine.
+    """
+    async for session in get_async_session():
+        request.state.db = session
+        yield session
+
+
+SessionDep = Annotated[Session, Depends(get_session)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+use_async_session = Depends(attach_async_session)
@@ -1,14 +1,153 @@
+import atexit
+import json
 import logging
-import os 
+import logging.handlers
+import os
+import queue
+import sys
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-logging.basicConfig(filename=f'{ROOT_DIR}/logs/application.log',  # log to a file named 'app.log'
-                    filemode='a',  # append to the log file if it exists, otherwise create it
-                    level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s',
-                    datefmt='%Y-%m-%d %H:%M:%S'
-                    )
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_DIR = os.environ.get("LOG_DIR", os.path.join(ROOT_DIR, 'logs'))
+LOG_FILE = os.environ.get("LOG_FILE", "application.log")
+# 'file' writes to LOG_DIR/LOG_FILE, 'stderr'/'stdout' are safe to share between worker processes
+LOG_SINK = os.environ.get("LOG_SINK", "file")
+# Give every process its own file (application.<pid>.log) so rotation never races between workers
+LOG_FILE_PER_WORKER = os.environ.get("LOG_FILE_PER_WORKER", "false").lower() in ("1", "true", "yes", "on")
+# 'text' or 'json' (one JSON object per line)
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+# 'none', 'size' (LOG_MAX_BYTES) or 'time' (LOG_WHEN / LOG_INTERVAL)
+LOG_ROTATION = os.environ.get("LOG_ROTATION", "none")
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 50 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", 5))
+LOG_WHEN = os.environ.get("LOG_WHEN", "midnight")
+LOG_INTERVAL = int(os.environ.get("LOG_INTERVAL", 1))
+# Records arriving while the queue is full are dropped instead of blocking the caller
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class JSONFormatter(logging.Formatter):
+    """ One JSON object per record, structured request fields are kept as fields. """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record, DATE_FORMAT),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'message': record.getMessage(),
+        }
+        request = getattr(record, 'request', None)
+        if request is not None:
+            data['request'] = request
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """ QueueHandler that counts and drops records when the queue is full instead of waiting. """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def log_file_path() -> str:
+    if LOG_FILE_PER_WORKER:
+        name, ext = os.path.splitext(LOG_FILE)
+        return os.path.join(LOG_DIR, f"{name}.{os.getpid()}{ext}")
+    return os.path.join(LOG_DIR, LOG_FILE)
+
+
+def build_sink_handler() -> logging.Handler:
+    """ The handler doing the actual writes, it only runs on the listener thread. """
+    if LOG_SINK == 'stderr':
+        handler = logging.StreamHandler(sys.stderr)
+    elif LOG_SINK == 'stdout':
+        handler = logging.StreamHandler(sys.stdout)
+    else:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        path = log_file_path()
+        if LOG_ROTATION == 'size':
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+        elif LOG_ROTATION == 'time':
+            handler = logging.handlers.TimedRotatingFileHandler(path, when=LOG_WHEN, interval=LOG_INTERVAL,
+                                                                backupCount=LOG_BACKUP_COUNT)
+        else:
+            handler = logging.FileHandler(path, mode='a')
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT))
+    return handler
+
+
+class LogPipeline:
+    """
+    Root logging setup: callers only put records on a bounded queue, a background
+    QueueListener formats and writes them, so a log call never waits on disk.
+    """
+
+    def __init__(self):
+        self.queue = None
+        self.handler = None
+        self.listener = None
+
+    def start(self):
+        root = logging.getLogger()
+        self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        root.addHandler(self.handler)
+        root.setLevel(LOG_LEVEL)
+        self.listener = logging.handlers.QueueListener(self.queue, build_sink_handler(), respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        """ Flush the queued records and close the sink. """
+        if self.listener is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+        if self.handler is not None:
+            logging.getLogger().removeHandler(self.handler)
+            self.handler = None
+
+    def restart(self):
+        """
+        Start a fresh queue and listener, to be called in a forked worker: the listener
+        thread of the parent doesn't exist in the child and per-worker files need the new pid.
+        """
+        if self.handler is not None:
+            logging.getLogger().removeHandler(self.handler)
+        self.listener = None
+        self.handler = None
+        self.start()
+
+    def metrics(self) -> dict:
+        return {
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'capacity': LOG_QUEUE_SIZE,
+            'dropped': self.handler.dropped if self.handler is not None else 0,
+        }
+
+
+pipeline = LogPipeline()
+pipeline.start()
+atexit.register(pipeline.stop)
 logging.captureWarnings(True)
 
 logger = logging.getLogger(__name__)
@@ -0,0 +1,239 @@
+# Standard library imports
+import asyncio
+import os
+import threading
+import time
+import traceback
+import weakref
+from asyncio import events
+from collections import deque
+
+# Third-party imports
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Local application imports
+from app.base.logger import logger as _logger
+from app.base.module_index import ADDONS_PATH
+from app.base.profiler import current_frames
+from app.base.routing_utils.registry import ModuleRecord, ModuleRegistry
+
+# Seconds between two measurements of the event loop lag
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", 0.1))
+# off, watchdog (a thread notices a blocked loop and records what it runs, no cost per
+# callback) or debug (also times every callback of the loop)
+LOOP_BLOCK_DETECTOR = os.environ.get("LOOP_BLOCK_DETECTOR", "watchdog").lower()
+# The loop counts as blocked when a callback runs longer than this many seconds
+LOOP_BLOCK_THRESHOLD = float(os.environ.get("LOOP_BLOCK_THRESHOLD", 0.1))
+# Blocking events kept per worker for /loop/stats
+LOOP_BLOCK_KEEP = int(os.environ.get("LOOP_BLOCK_KEEP", 50))
+# Frames kept of the stack of a blocking event
+LOOP_BLOCK_STACK_DEPTH = 12
+
+_ADDONS_PREFIX = os.path.join(os.path.abspath(ADDONS_PATH), '')
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop runs its callbacks.
+
+    A task sleeps `interval` seconds in a loop, the time it wakes up after its deadline is
+    the lag: the time the ready callbacks before it took. `current` also counts a pending
+    wake up that is already overdue, so a loop that is falling behind is seen before the
+    measurement comes back. The task is started by the first `current` call of each event
+    loop and costs one wake up per interval.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._loop = None
+        self._task = None
+        self._due = None
+
+    def _ensure_started(self, loop: asyncio.AbstractEventLoop):
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._due = loop.time() + self.interval
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - self._due)
+            self.max_lag = max(self.max_lag, self.lag)
+
+    def current(self) -> float:
+        """ The lag of the running event loop in seconds. """
+        loop = asyncio.get_running_loop()
+        self._ensure_started(loop)
+        return max(self.lag, loop.time() - self._due)
+
+    def stats(self) -> dict:
+        return {'lag_ms': round(self.lag * 1000, 3), 'max_lag_ms': round(self.max_lag * 1000, 3)}
+
+
+def _addon_of_stack(stack: list) -> str:
+    """ The addon whose code is the innermost in `stack`, from the path of its files. """
+    for frame in reversed(stack):
+        if frame.filename.startswith(_ADDONS_PREFIX):
+            return frame.filename[len(_ADDONS_PREFIX):].split(os.sep, 1)[0]
+    return None
+
+
+class TaggedRouteApp:
+    """ Wraps the ASGI app of an addon route, so the detector knows which route a task serves. """
+
+    def __init__(self, app: ASGIApp, detector: "BlockingDetector", technical_name: str, path: str):
+        self.app = app
+        self.detector = detector
+        self.label = (technical_name, path)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        task = asyncio.current_task()
+        self.detector.ensure_started(task.get_loop())
+        # Kept until the task is gone, a block is reported after the callback that did it returned
+        self.detector.tasks[task] = self.label
+        await self.app(scope, receive, send)
+
+
+class BlockingDetector:
+    """
+    Finds what blocks the event loop and pins it on the addon route that did it.
+
+    Every request task of an addon route is tagged with the route (a route layer of the
+    module registry). In `watchdog` mode a thread posts a callback to the loop every
+    `threshold` seconds; when it doesn't run within `threshold`, the loop is blocked and
+    the thread records the stack of the loop thread and the route of its current task,
+    then waits for the loop to come back to know how long it was blocked. Code that isn't
+    in a tagged task is attributed to the addon whose files are on the stack.
+
+    `debug` mode also wraps the callbacks of asyncio and times every one of them, which
+    catches shorter blocks exactly but costs a little on every callback.
+    """
+
+    def __init__(self, registry: ModuleRegistry, collector=None, mode: str = LOOP_BLOCK_DETECTOR,
+                 threshold: float = LOOP_BLOCK_THRESHOLD, keep: int = LOOP_BLOCK_KEEP):
+        self.mode = mode
+        self.threshold = threshold
+        self.collector = collector
+        self.tasks = weakref.WeakKeyDictionary()
+        self.events = deque(maxlen=keep)
+        self.by_addon = {}
+        self._loop = None
+        self._pid = None
+        self._original_run = None
+        if collector is not None:
+            collector.describe("app_loop_blocked_total", "Times the event loop was blocked, per addon.")
+            collector.describe("app_loop_blocked_seconds_total", "Time the event loop was blocked, per addon.")
+        registry.add_route_layer(self._wrap_route)
+        if mode == 'debug':
+            self._time_callbacks()
+
+    def _wrap_route(self, record: ModuleRecord, route):
+        if hasattr(route, 'app'):
+            route.app = TaggedRouteApp(route.app, self, record.technical_name, route.path)
+
+    def ensure_started(self, loop: asyncio.AbstractEventLoop):
+        # Threads don't survive a fork, and every loop (tests) needs its own watchdog
+        if self._loop is loop and self._pid == os.getpid():
+            return
+        self._loop = loop
+        self._pid = os.getpid()
+        threading.Thread(target=self._watch, args=(loop, threading.get_ident()),
+                         name="loop-watchdog", daemon=True).start()
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread: int):
+        beat = threading.Event()
+        while self._loop is loop and not loop.is_closed():
+            beat.clear()
+            start = time.monotonic()
+            try:
+                loop.call_soon_threadsafe(beat.set)
+            except RuntimeError:
+                return  # The loop was closed
+            if beat.wait(self.threshold):
+                # A block that starts now is seen at most 1.5 thresholds later
+                time.sleep(self.threshold / 2)
+                continue
+            # Blocked: record what it runs now, then wait for it to come back
+            frame = current_frames().get(loop_thread)
+            stack = traceback.extract_stack(frame, limit=LOOP_BLOCK_STACK_DEPTH) if frame is not None else []
+            task = asyncio.current_task(loop)
+            label = self.tasks.get(task) if task is not None else None
+            while not beat.wait(1.0):
+                if loop.is_closed() or not loop.is_running():
+                    return
+            self._record(label, stack, time.monotonic() - start, source='watchdog', count=self.mode != 'debug')
+
+    def _time_callbacks(self):
+        detector = self
+        original_run = self._original_run = events.Handle._run
+
+        def _run(handle):
+            start = time.perf_counter()
+            try:
+                return original_run(handle)
+            finally:
+                duration = time.perf_counter() - start
+                if duration > detector.threshold:
+                    detector._slow_callback(handle, duration)
+
+        events.Handle._run = _run
+
+    def close(self):
+        """ Stop the watchdog and restore the callbacks of asyncio. """
+        self._loop = None
+        if self._original_run is not None:
+            events.Handle._run = self._original_run
+            self._original_run = None
+
+    def _slow_callback(self, handle, duration: float):
+        # Task steps are bound to their task
+        task = getattr(handle._callback, '__self__', None)
+        label = self.tasks.get(task) if isinstance(task, asyncio.Task) else None
+        if isinstance(task, asyncio.Task):
+            code = task.get_coro().cr_code if hasattr(task.get_coro(), 'cr_code') else None
+            stack = [traceback.FrameSummary(code.co_filename, code.co_firstlineno, code.co_name)] if code else []
+        else:
+            stack = []
+        self._record(label, stack, duration, source='callback', callback=repr(handle))
+
+    def _record(self, label: tuple, stack: list, duration: float, source: str, count: bool = True, callback: str = None):
+        technical_name, path = label if label is not None else (_addon_of_stack(stack), None)
+        addon = technical_name or ''
+        event = {
+            'addon': addon,
+            'route': path,
+            'duration_ms': round(duration * 1000, 3),
+            'source': source,
+            'at': time.time(),
+            'stack': [f"{frame.filename}:{frame.lineno} in {frame.name}" for frame in stack],
+        }
+        if callback is not None:
+            event['callback'] = callback
+        self.events.append(event)
+        if count:
+            stats = self.by_addon.setdefault(addon, {'count': 0, 'seconds': 0.0})
+            stats['count'] += 1
+            stats['seconds'] += duration
+            if self.collector is not None:
+                self.collector.increment("app_loop_blocked_total", addon=addon)
+                self.collector.increment("app_loop_blocked_seconds_total", duration, addon=addon)
+        where = f"{addon or 'unknown code'}{f' {path}' if path else ''}"
+        _logger.warning(f"Event loop blocked for {duration * 1000:.0f} ms by {where} ({source})"
+                        + "".join(f"\n    {line}" for line in event['stack'][-4:]))
+
+    def stats(self) -> dict:
+        return {
+            'mode': self.mode,
+            'threshold_ms': self.threshold * 1000,
+            'by_addon': {addon: {'count': stats['count'], 'seconds': round(stats['seconds'], 3)}
+                         for addon, stats in self.by_addon.items()},
+            'events': list(self.events),
+        }
+
+
+loop_lag = LoopLagMonitor()
@@ -0,0 +1,346 @@
+# Standard library imports
+import glob
+import json
+import os
+import threading
+import time
+
+# Third-party imports
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Local application imports
+from app.base.logger import logger as _logger, pipeline as log_pipeline
+from app.base.routing_utils.registry import ModuleRegistry
+
+# Shared directory where every worker writes its metrics, needed to aggregate across gunicorn workers
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Label used for requests that didn't match a route, to keep the label set bounded
+UNMATCHED = "<unmatched>"
+
+# File holding the totals of the workers that exited, summed with the live ones
+RETAINED_FILE = "metrics.retained.json"
+
+
+class RouteStats:
+    __slots__ = ('count', 'errors', 'total', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        # One counter per bucket plus +Inf, not cumulative
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, duration: float, error: bool):
+        self.count += 1
+        self.total += duration
+        if error:
+            self.errors += 1
+        for i, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+
+class MetricsCollector:
+    """
+    Request count, error count and latency histogram per (addon, route, method).
+
+    Each worker records in memory. With METRICS_DIR set, a background thread writes the
+    worker's totals to METRICS_DIR/metrics.<pid>.json every METRICS_FLUSH_INTERVAL seconds
+    and scrapes sum the files of every worker, so any worker can answer for all of them.
+    """
+
+    def __init__(self, metrics_dir: str = METRICS_DIR, flush_interval: float = METRICS_FLUSH_INTERVAL):
+        self.metrics_dir = metrics_dir
+        self.flush_interval = flush_interval
+        self.stats = {}
+        # Labelled counters of the other subsystems, e.g. requests rejected by the rate limiter
+        self.counters = {}
+        self.counter_help = {}
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+
+    def observe(self, addon: str, route: str, method: str, duration: float, error: bool):
+        key = (addon or "", route, method)
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = RouteStats()
+            stats.observe(duration, error)
+        if self.metrics_dir and self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def describe(self, name: str, help: str):
+        """ Register a counter, rendered as `name` with `help` even before it is first incremented. """
+        self.counter_help[name] = help
+
+    def increment(self, name: str, value: int = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        if self.metrics_dir and self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [
+                [addon, route, method, s.count, s.errors, s.total, list(s.buckets)]
+                for (addon, route, method), s in self.stats.items()
+            ]
+
+    def counters_snapshot(self) -> list:
+        with self._lock:
+            return [[name, [list(label) for label in labels], value] for (name, labels), value in self.counters.items()]
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.metrics_dir, f"metrics.{pid}.json")
+
+    def _start_flusher(self):
+        # Threads don't survive a fork, every worker starts its own
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name="metrics-flusher", daemon=True).start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            self.flush()
+            time.sleep(self.flush_interval)
+
+    def flush(self):
+        """ Write this worker's totals to the shared metrics directory. """
+        if not self.metrics_dir:
+            return
+        path = self._path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump({'pid': os.getpid(), 'stats': self.snapshot(), 'counters': self.counters_snapshot(),
+                           'log': log_pipeline.metrics()}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            _logger.warning(f"Could not write metrics file {path}: {e}")
+
+    def reset(self):
+        """ Remove the files of a previous run, e.g. from gunicorn's on_starting hook. """
+        if not self.metrics_dir:
+            return
+        for path in glob.glob(os.path.join(self.metrics_dir, "metrics.*.json*")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def remove_worker(self, pid: int):
+        """
+        Fold the totals of a worker that exited into the retained file and remove its own
+        file, e.g. from gunicorn's child_exit hook. The summed counters never go down when
+        a worker is replaced.
+        """
+        if not self.metrics_dir:
+            return
+        path = self._path(pid)
+        snapshots = []
+        for snapshot_path in (os.path.join(self.metrics_dir, RETAINED_FILE), path):
+            try:
+                with open(snapshot_path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        if not snapshots:
+            return
+        merged, log = self.collect(snapshots)
+        counters = self.collect_counters(snapshots)
+        retained = {
+            'pid': None,
+            'stats': [[addon, route, method, s.count, s.errors, s.total, s.buckets]
+                      for (addon, route, method), s in merged.items()],
+            'counters': [[name, [list(label) for label in labels], value] for (name, labels), value in counters.items()],
+            # The queue of an exited worker is gone, only its drops still count
+            'log': {'queued': 0, 'dropped': log['dropped']},
+        }
+        retained_path = os.path.join(self.metrics_dir, RETAINED_FILE)
+        tmp_path = f"{retained_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(retained, f)
+            os.replace(tmp_path, retained_path)
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            _logger.warning(f"Could not retain the metrics of worker {pid}: {e}")
+
+    def _snapshots(self) -> list:
+        if not self.metrics_dir:
+            return [{'stats': self.snapshot(), 'counters': self.counters_snapshot(), 'log': log_pipeline.metrics()}]
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.metrics_dir, "metrics.*.json")):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def collect(self, snapshots: list = None) -> tuple:
+        """
+        Totals of every worker.
+
+        Returns:
+            tuple: ({(addon, route, method): RouteStats}, {'queued': .., 'dropped': ..}) summed over workers.
+        """
+        if snapshots is None:
+            snapshots = self._snapshots()
+        merged = {}
+        log = {'queued': 0, 'dropped': 0}
+        for snapshot in snapshots:
+            for addon, route, method, count, errors, total, buckets in snapshot['stats']:
+                stats = merged.get((addon, route, method))
+                if stats is None:
+                    stats = merged[(addon, route, method)] = RouteStats()
+                stats.count += count
+                stats.errors += errors
+                stats.total += total
+                stats.buckets = [a + b for a, b in zip(stats.buckets, buckets)]
+            for key in log:
+                log[key] += snapshot.get('log', {}).get(key, 0)
+        return merged, log
+
+    def collect_counters(self, snapshots: list = None) -> dict:
+        """
+        Returns:
+            dict: {(name, ((label, value), ...)): total} summed over workers.
+        """
+        if snapshots is None:
+            snapshots = self._snapshots()
+        counters = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot.get('counters', ()):
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+        return counters
+
+    def module_stats(self, technical_name: str) -> dict:
+        """ Per-route totals of one addon, for the module endpoints. """
+        merged, _ = self.collect()
+        routes = {}
+        for (addon, route, method), stats in merged.items():
+            if addon == technical_name:
+                routes[f"{method} {route}"] = {
+                    'count': stats.count,
+                    'errors': stats.errors,
+                    'mean_ms': round(stats.total / stats.count * 1000, 3) if stats.count else 0.0,
+                }
+        return routes
+
+    def render_prometheus(self) -> str:
+        """ All metrics in the Prometheus text exposition format. """
+        snapshots = self._snapshots()
+        merged, log = self.collect(snapshots)
+        counters = self.collect_counters(snapshots)
+        lines = [
+            "# HELP app_requests_total Requests handled, per addon route.",
+            "# TYPE app_requests_total counter",
+        ]
+        ordered = sorted(merged.items())
+        for (addon, route, method), stats in ordered:
+            lines.append(f"app_requests_total{_labels(addon, route, method)} {stats.count}")
+        lines += [
+            "# HELP app_request_errors_total Requests answered with a 5xx status, per addon route.",
+            "# TYPE app_request_errors_total counter",
+        ]
+        for (addon, route, method), stats in ordered:
+            lines.append(f"app_request_errors_total{_labels(addon, route, method)} {stats.errors}")
+        lines += [
+            "# HELP app_request_duration_seconds Request latency, per addon route.",
+            "# TYPE app_request_duration_seconds histogram",
+        ]
+        for (addon, route, method), stats in ordered:
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float('inf'),), stats.buckets):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"app_request_duration_seconds_bucket{_labels(addon, route, method, le=le)} {cumulative}")
+            lines.append(f"app_request_duration_seconds_sum{_labels(addon, route, method)} {stats.total}")
+            lines.append(f"app_request_duration_seconds_count{_labels(addon, route, method)} {stats.count}")
+        lines += [
+            "# HELP app_log_queue_records Log records waiting to be written.",
+            "# TYPE app_log_queue_records gauge",
+            f"app_log_queue_records {log['queued']}",
+            "# HELP app_log_dropped_total Log records dropped because the log queue was full.",
+            "# TYPE app_log_dropped_total counter",
+            f"app_log_dropped_total {log['dropped']}",
+        ]
+        for name, help in sorted(self.counter_help.items()):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+            for (counter, labels), value in sorted(counters.items()):
+                if counter == name:
+                    label_text = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels)
+                    lines.append(f"{name}{{{label_text}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(addon: str, route: str, method: str, **extra) -> str:
+    labels = {'addon': addon, 'route': route, 'method': method, **extra}
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request and records it under the route template and owning addon.
+    """
+
+    def __init__(self, app: ASGIApp, collector: MetricsCollector, registry: ModuleRegistry = None):
+        self.app = app
+        self.collector = collector
+        self.registry = registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            record = self.registry.owner_of(route) if self.registry is not None and route is not None else None
+            if route is not None:
+                label = route.path
+            elif "endpoint" in scope:
+                # Plain Starlette routes (docs, openapi.json) don't set scope["route"]
+                label = f"<{getattr(scope['endpoint'], '__name__', 'endpoint')}>"
+            else:
+                label = UNMATCHED
+            self.collector.observe(
+                record.technical_name if record is not None else "",
+                label,
+                scope["method"],
+                time.perf_counter() - start,
+                status >= 500,
+            )
+
+
+collector = MetricsCollector()
@@ -0,0 +1,109 @@
+# Standard library imports
+import os
+
+# Third-party imports
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Local application imports
+from app.base.compression import StreamCompressor, available_encodings, compress, negotiate_encoding
+
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+# Bodies smaller than this many bytes are sent as is, compressing them saves less than it costs
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+# Content types that are compressed, an entry ending with '/' allows every subtype
+COMPRESSION_TYPES = tuple(
+    media_type.strip().lower()
+    for media_type in os.environ.get(
+        "COMPRESSION_TYPES",
+        "application/json,application/x-ndjson,application/javascript,application/xml,image/svg+xml,text/",
+    ).split(",")
+    if media_type.strip()
+)
+
+
+def compressible(media_type: str, allowed=COMPRESSION_TYPES) -> bool:
+    media_type = media_type.split(";", 1)[0].strip().lower()
+    return any(media_type.startswith(entry) if entry.endswith("/") else media_type == entry for entry in allowed)
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies with the best encoding the client accepts (brotli when
+    available, else gzip). Only bodies of an allowed content type and at least
+    `min_size` bytes are compressed; streamed bodies are compressed chunk by chunk.
+    Responses that already have a Content-Encoding, like the precompressed pages, or
+    ask for `Cache-Control: no-transform` are sent as they are.
+
+    A strong ETag of a compressed response is made weak, it no longer matches the bytes
+    sent but still validates the same content.
+    """
+
+    def __init__(self, app: ASGIApp, min_size: int = COMPRESSION_MIN_SIZE, media_types=COMPRESSION_TYPES):
+        self.app = app
+        self.min_size = min_size
+        self.media_types = media_types
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                headers = Headers(raw=start["headers"])
+                if (start["status"] < 200 or start["status"] in (204, 304) or "content-encoding" in headers
+                        or "no-transform" in headers.get("cache-control", "")
+                        or not compressible(headers.get("content-type", ""), self.media_types)):
+                    passthrough = True
+                    await send(start)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body and len(body) < self.min_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                headers["Content-Encoding"] = encoding
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+                if not more_body:
+                    body = compress(body, encoding, fast=True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                compressor = StreamCompressor(encoding)
+                await send(start)
+            chunk = compressor.compress(body) if body else b""
+            if not more_body:
+                chunk += compressor.finish()
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
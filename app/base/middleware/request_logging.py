@@ -0,0 +1,153 @@
+# Standard library imports
+import logging
+import os
+import random
+import time
+
+# Third-party imports
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Local application imports
+from app.base.logger import logger as _logger
+from app.base.routing_utils.registry import ModuleRegistry
+
+REQUEST_LOG_ENABLED = os.environ.get("REQUEST_LOG_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get("REQUEST_LOG_SAMPLE_RATE", 1.0))
+REQUEST_LOG_REDACT_HEADERS = frozenset(
+    header.strip().lower()
+    for header in os.environ.get(
+        "REQUEST_LOG_REDACT_HEADERS",
+        "authorization,proxy-authorization,cookie,set-cookie,x-api-key",
+    ).split(",")
+    if header.strip()
+)
+
+REDACTED = "[redacted]"
+
+request_logger = logging.getLogger("app.requests")
+
+
+class RequestLogConfig:
+    """
+    Request logging settings of one addon, from the `request_logging` key of its manifest:
+
+        'request_logging': {'enabled': True, 'sample_rate': 0.1, 'include_headers': False}
+
+    Requests answered with a 5xx status are always logged while logging is enabled.
+    """
+
+    __slots__ = ('enabled', 'sample_rate', 'include_headers')
+
+    def __init__(self, enabled=True, sample_rate=REQUEST_LOG_SAMPLE_RATE, include_headers=False):
+        self.enabled = bool(enabled)
+        self.sample_rate = float(sample_rate)
+        self.include_headers = bool(include_headers)
+
+    @classmethod
+    def from_manifest(cls, manifest: dict):
+        """
+        The config of an addon. Unknown keys and invalid values are logged and ignored,
+        the defaults apply instead.
+        """
+        options = manifest.get('request_logging') or {}
+        name = manifest.get('technical_name')
+        if not isinstance(options, dict):
+            _logger.warning(f"Ignoring 'request_logging' of module {name}: expected a dict, got {options!r}")
+            return cls()
+        unknown = sorted(str(key) for key in options if key not in cls.__slots__)
+        if unknown:
+            _logger.warning(f"Ignoring unknown 'request_logging' keys of module {name}: {unknown}")
+        try:
+            return cls(**{key: value for key, value in options.items() if key in cls.__slots__})
+        except (TypeError, ValueError) as e:
+            _logger.warning(f"Ignoring invalid 'request_logging' of module {name}: {e}")
+            return cls()
+
+
+DEFAULT_CONFIG = RequestLogConfig()
+
+
+class RequestLoggingMiddleware:
+    """
+    Logs one record per HTTP request with method, path, status, latency and owning addon
+    in the `request` attribute of the record, so formatters can output them as fields.
+
+    Nothing is measured or formatted while the `app.requests` logger is disabled for INFO.
+    Sampling is decided once the response status is known, headers are only collected
+    for addons that ask for them and sensitive ones are redacted.
+    """
+
+    def __init__(self, app: ASGIApp, registry: ModuleRegistry = None, logger: logging.Logger = request_logger,
+                 redact_headers=REQUEST_LOG_REDACT_HEADERS):
+        self.app = app
+        self.registry = registry
+        self.logger = logger
+        self.redact_headers = redact_headers
+        self._configs = {}
+        if registry is not None:
+            # The config of a module is built and validated when it is registered, not per request
+            for record in registry:
+                self._on_module_change(record, (), ())
+            registry.subscribe(self._on_module_change)
+
+    def _on_module_change(self, record, removed, added):
+        self._configs[record.technical_name] = RequestLogConfig.from_manifest(record.manifest)
+
+    def config_for(self, record) -> RequestLogConfig:
+        if record is None:
+            return DEFAULT_CONFIG
+        config = self._configs.get(record.technical_name)
+        if config is None:
+            config = self._configs[record.technical_name] = RequestLogConfig.from_manifest(record.manifest)
+        return config
+
+    def headers_of(self, scope: Scope) -> dict:
+        return {
+            name.decode("latin-1"): REDACTED if name.decode("latin-1") in self.redact_headers else value.decode("latin-1")
+            for name, value in scope["headers"]
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.logger.isEnabledFor(logging.INFO):
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.log(scope, status, time.perf_counter() - start)
+
+    def log(self, scope: Scope, status: int, duration: float):
+        route = scope.get("route")
+        record = self.registry.owner_of(route) if self.registry is not None and route is not None else None
+        config = self.config_for(record)
+        if not config.enabled:
+            return
+        if status < 500 and config.sample_rate < 1.0 and random.random() >= config.sample_rate:
+            return
+
+        fields = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": getattr(route, "path", None),
+            "status": status,
+            "duration_ms": round(duration * 1000, 3),
+            "addon": record.technical_name if record is not None else None,
+            "client": scope["client"][0] if scope.get("client") else None,
+            "sample_rate": config.sample_rate,
+        }
+        if config.include_headers:
+            fields["headers"] = self.headers_of(scope)
+        self.logger.info(
+            "%s %s %s %.1fms", fields["method"], fields["path"], status, fields["duration_ms"],
+            extra={"request": fields},
+        )
@@ -0,0 +1,262 @@
+# Standard library imports
+import copy
+import json
+import os
+import sys
+import time
+from os.path import join as opj, normpath
+
+# Local application imports
+from app.base.logger import logger as _logger
+from app.base.module import Module, MANIFEST_NAMES, README_NAMES
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ADDONS_PATH = os.environ.get("ADDONS_PATH", normpath(opj(ROOT_DIR, '../addons')))
+INDEX_PATH = os.environ.get("ADDONS_INDEX_PATH", opj(ROOT_DIR, 'cache', 'addons_index.json'))
+
+# Bump when the layout of an index entry changes, old files are then ignored
+INDEX_VERSION = 1
+
+SKIPPED_DIRS = ('tests', 'config')
+
+
+def _stat_key(path):
+    """ Returns the (mtime_ns, size) pair used to detect changes of `path`, or None if it is gone. """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+class ModuleIndex:
+    """
+    On-disk index of every addon found in the addons directory.
+
+    Each addon's manifest is parsed once and stored together with the python files
+    that make up the addon. An entry is reused as long as the manifest, README and
+    the directories of the addon keep the same mtime and size, so a warm start only
+    costs a handful of `os.stat` calls per addon instead of a full walk and parse.
+    """
+
+    def __init__(self, addons_dir: str = ADDONS_PATH, index_path: str = INDEX_PATH):
+        self.addons_dir = normpath(addons_dir)
+        self.index_path = index_path
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+
+    def load(self):
+        """ Load the index from disk, a missing or outdated file just gives an empty index. """
+        try:
+            with open(self.index_path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            _logger.warning(f"Ignoring unreadable addon index {self.index_path}: {e}")
+            return {}
+
+        if data.get('version') != INDEX_VERSION or data.get('addons_dir') != self.addons_dir:
+            _logger.info(f"Addon index {self.index_path} is outdated, it will be rebuilt")
+            return {}
+        return data.get('addons', {})
+
+    def save(self):
+        """ Write the index atomically so concurrent workers never read a partial file. """
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    'version': INDEX_VERSION,
+                    'addons_dir': self.addons_dir,
+                    'addons': self.entries,
+                }, f)
+            os.replace(tmp_path, self.index_path)
+            self.dirty = False
+        except OSError as e:
+            _logger.warning(f"Could not write addon index {self.index_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def is_fresh(self, entry: dict) -> bool:
+        """ Check an entry against the file system without reading any file. """
+        for path, key in entry['stats'].items():
+            if _stat_key(path) != key:
+                return False
+        for path, mtime_ns in entry['dirs'].items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def build_entry(self, addon_root: str, technical_name: str) -> dict:
+        """ Parse the manifest of one addon and collect its python files. """
+        manifest = Module(addon_root).load_manifest(technical_name, mod_path=addon_root)
+        if not manifest:
+            raise ValueError(f"no readable manifest in {addon_root}")
+
+        stats = {}
+        for name in MANIFEST_NAMES + README_NAMES:
+            path = opj(addon_root, name)
+            key = _stat_key(path)
+            if key is not None:
+                stats[path] = key
+
+        dirs = {}
+        files = []
+        for root, subdirs, filenames in os.walk(addon_root):
+            for skipped in SKIPPED_DIRS:
+                if skipped in subdirs:
+                    subdirs.remove(skipped)
+            subdirs.sort()
+            dirs[root] = os.stat(root).st_mtime_ns
+            for file in sorted(filenames):
+                if file.endswith('.py') and not file.startswith('__'):
+                    module_path = opj(root, file)
+                    files.append({
+                        'path': module_path,
+                        'module_name': os.path.relpath(module_path, self.addons_dir)[:-3].replace(os.sep, '.'),
+                    })
+
+        return {
+            'technical_name': technical_name,
+            'manifest': manifest,
+            'files': files,
+            'stats': stats,
+            'dirs': dirs,
+        }
+
+    def scan(self, use_cache: bool = True) -> list:
+        """
+        Return the index entries of all addons, sorted by technical name.
+
+        Only addons whose files changed since the last scan are parsed again.
+        The index is written back to disk when anything changed.
+
+        Args:
+            use_cache (bool): Ignore the on-disk index and parse every addon when False.
+        """
+        start = time.perf_counter()
+        cached = self.load() if use_cache else {}
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            candidates = sorted(os.scandir(self.addons_dir), key=lambda e: e.name)
+        except FileNotFoundError:
+            _logger.warning(f"Addons directory not found: {self.addons_dir}")
+            candidates = []
+
+        for dir_entry in candidates:
+            if not dir_entry.is_dir() or dir_entry.name.startswith(('.', '_')):
+                continue
+            addon_root = normpath(dir_entry.path)
+            if not any(os.path.isfile(opj(addon_root, name)) for name in MANIFEST_NAMES):
+                continue
+
+            entry = cached.get(dir_entry.name)
+            if entry is not None and self.is_fresh(entry):
+                self.hits += 1
+            else:
+                try:
+                    entry = self.build_entry(addon_root, dir_entry.name)
+                except Exception as e:
+                    _logger.error(f"Error indexing addon '{dir_entry.name}': {e}")
+                    continue
+                self.misses += 1
+            self.entries[dir_entry.name] = entry
+
+        if self.misses or set(self.entries) != set(cached):
+            self.dirty = True
+        self.flush()
+
+        _logger.info(
+            f"Addon index: {len(self.entries)} addons, {self.hits} cache hits, "
+            f"{self.misses} misses in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+        return [self.entries[name] for name in sorted(self.entries)]
+
+    def get(self, technical_name: str):
+        """
+        Return the up to date index entry of a single addon, or None if it doesn't exist.
+        Only that addon is checked against the file system.
+        """
+        if not technical_name or technical_name.startswith(('.', '_')) or os.sep in technical_name:
+            return None
+        if not self.entries:
+            self.entries = self.load()
+        addon_root = normpath(opj(self.addons_dir, technical_name))
+        if not any(os.path.isfile(opj(addon_root, name)) for name in MANIFEST_NAMES):
+            if self.entries.pop(technical_name, None) is not None:
+                self.dirty = True
+                self.flush()
+            return None
+
+        entry = self.entries.get(technical_name)
+        if entry is None or not self.is_fresh(entry):
+            entry = self.build_entry(addon_root, technical_name)
+            self.dirty = True
+        self.entries[technical_name] = entry
+        self.flush()
+        return entry
+
+    def rebuild(self) -> list:
+        """ Drop the on-disk index and parse every addon again. """
+        return self.scan(use_cache=False)
+
+    def flush(self):
+        """ Write the index if anything was changed since it was last saved. """
+        if self.dirty:
+            self.save()
+
+    def route_stub(self, file: dict):
+        """
+        Return the routes recorded for an addon python file the last time it was imported,
+        or None when nothing was recorded or the file changed since.
+        """
+        routes = file.get('routes')
+        if routes is None or _stat_key(file['path']) != file.get('stat'):
+            return None
+        return routes
+
+    def record_routes(self, technical_name: str, module_path: str, routes: list):
+        """
+        Store the route table of an imported addon python file as its route stub.
+
+        Args:
+            technical_name (str): The addon the file belongs to.
+            module_path (str): Path of the python file.
+            routes (list): One dict per route with `path`, `name`, `methods` and `tags`.
+        """
+        entry = self.entries.get(technical_name)
+        if entry is None:
+            return
+        for file in entry['files']:
+            if file['path'] == module_path:
+                stat = _stat_key(module_path)
+                if file.get('routes') != routes or file.get('stat') != stat:
+                    file['routes'] = routes
+                    file['stat'] = stat
+                    self.dirty = True
+                return
+
+    @staticmethod
+    def manifest_of(entry: dict) -> dict:
+        """ Return a private copy of the manifest stored in `entry`, safe to mutate. """
+        return copy.deepcopy(entry['manifest'])
+
+
+if __name__ == '__main__':
+    # python -m app.base.module_index [--rebuild]
+    index = ModuleIndex()
+    entries = index.rebuild() if '--rebuild' in sys.argv[1:] else index.scan()
+    for entry in entries:
+        print(f"{entry['technical_name']}: {len(entry['files'])} file(s)")
+    print(f"{len(entries)} addons indexed ({index.hits} hits, {index.misses} misses) -> {index.index_path}")
@@ -0,0 +1,156 @@
+# Standard library imports
+import json
+import threading
+
+# Third-party imports
+from fastapi import FastAPI
+from fastapi.openapi.utils import get_openapi
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+# Local application imports
+from app.base.compression import PrecompressedBody
+from app.base.logger import logger as _logger
+from app.base.routing_utils.registry import ModuleRegistry
+
+
+class OpenAPICache:
+    """
+    Builds the OpenAPI document from one cached fragment per addon.
+
+    The routes that don't belong to an addon form the base fragment, every active
+    module gets its own fragment with its paths and component schemas. When the
+    registry reports a change only the fragment of that module is dropped, the
+    document is then merged again from the cached fragments.
+
+    The serialized document is kept together with its ETag and gzip/brotli variants
+    and served by `endpoint`, which answers 304 when the client already has it.
+    """
+
+    def __init__(self, app: FastAPI, registry: ModuleRegistry):
+        self.app = app
+        self.registry = registry
+        self._base = None
+        self._fragments = {}
+        self._schema = None
+        self._body = None
+        self._lock = threading.Lock()
+        registry.subscribe(self._on_module_change)
+
+    def install(self):
+        """ Serve the app's openapi_url from the cache and make `app.openapi()` use it. """
+        self.app.openapi = self.schema
+        openapi_url = self.app.openapi_url
+        if not openapi_url:
+            return
+        routes = [route for route in self.app.router.routes if getattr(route, 'path', None) != openapi_url]
+        routes.insert(0, Route(openapi_url, self.endpoint, include_in_schema=False))
+        self.app.router.routes = routes
+
+    def _on_module_change(self, record, removed, added):
+        self.invalidate(record.technical_name)
+
+    def invalidate(self, technical_name: str = None):
+        """
+        Drop the cached fragment of one module, or every fragment when no name is given.
+        """
+        with self._lock:
+            if technical_name is None:
+                self._base = None
+                self._fragments = {}
+            else:
+                self._fragments.pop(technical_name, None)
+            self._schema = None
+            self._body = None
+            self.app.openapi_schema = None
+
+    def _generate(self, routes, **extra) -> dict:
+        return get_openapi(
+            title=self.app.title,
+            version=self.app.version,
+            openapi_version=self.app.openapi_version,
+            routes=routes,
+            separate_input_output_schemas=self.app.separate_input_output_schemas,
+            **extra,
+        )
+
+    def _base_fragment(self) -> dict:
+        if self._base is None:
+            app = self.app
+            self._base = self._generate(
+                [route for route in app.routes if self.registry.owner_of(route) is None],
+                summary=app.summary,
+                description=app.description,
+                terms_of_service=app.terms_of_service,
+                contact=app.contact,
+                license_info=app.license_info,
+                webhooks=app.webhooks.routes,
+                tags=app.openapi_tags,
+                servers=app.servers,
+            )
+        return self._base
+
+    def _module_fragment(self, record) -> dict:
+        fragment = self._fragments.get(record.technical_name)
+        if fragment is None:
+            generated = self._generate(record.routes)
+            fragment = {
+                'paths': generated.get('paths', {}),
+                'schemas': generated.get('components', {}).get('schemas', {}),
+            }
+            self._fragments[record.technical_name] = fragment
+        return fragment
+
+    def schema(self) -> dict:
+        """ The merged OpenAPI document, only regenerating fragments that were invalidated. """
+        with self._lock:
+            if self._schema is not None and self.app.openapi_schema is self._schema:
+                return self._schema
+
+            base = self._base_fragment()
+            schema = {key: value for key, value in base.items() if key not in ('paths', 'components')}
+            paths = {path: dict(operations) for path, operations in base.get('paths', {}).items()}
+            components = {key: dict(value) for key, value in base.get('components', {}).items()}
+            schemas = components.setdefault('schemas', {})
+
+            for record in self.registry:
+                if not record.active:
+                    continue
+                fragment = self._module_fragment(record)
+                for path, operations in fragment['paths'].items():
+                    paths.setdefault(path, {}).update(operations)
+                for name, definition in fragment['schemas'].items():
+                    if name in schemas and schemas[name] != definition:
+                        _logger.warning(f"OpenAPI schema '{name}' of module {record.technical_name} overrides another definition")
+                    schemas[name] = definition
+
+            schema['paths'] = paths
+            if schemas:
+                schema['components'] = components
+            else:
+                components.pop('schemas')
+                if components:
+                    schema['components'] = components
+
+            self._schema = schema
+            self._body = None
+            self.app.openapi_schema = schema
+            return schema
+
+    def body(self) -> PrecompressedBody:
+        """ The serialized document with its ETag and compressed variants. """
+        schema = self.schema()
+        body = self._body
+        if body is None:
+            body = PrecompressedBody(
+                json.dumps(schema, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8"),
+                media_type="application/json",
+            )
+            with self._lock:
+                if self._schema is schema:
+                    self._body = body
+        return body
+
+    async def endpoint(self, request: Request) -> Response:
+        return self.body().response(request)
@@ -0,0 +1,33 @@
+# Standard library imports
+import gc
+
+# Local application imports
+from app.base.logger import logger as _logger, pipeline as log_pipeline
+from app.base import db
+
+
+def freeze():
+    """
+    Move every object of the loaded app to the permanent GC generation, to be called in
+    the master right before the workers are forked.
+
+    The collector then never visits those objects again, so it doesn't write to their
+    pages and the workers keep sharing them copy-on-write with the master.
+    """
+    gc.collect()
+    gc.freeze()
+    _logger.info(f"Preloaded app frozen for fork: {gc.get_freeze_count()} objects in the permanent generation")
+
+
+def after_fork():
+    """
+    Re-create in a forked worker what can't be shared with the master: the log listener
+    thread (threads don't survive a fork, per-worker log files need the new pid) and the
+    pooled database connections, which still belong to the master and are only dropped.
+
+    The metrics flusher, the SQLite response cache and the profiler check the pid
+    themselves and need nothing here.
+    """
+    log_pipeline.restart()
+    db.dispose_engines(close=False)
+    gc.enable()
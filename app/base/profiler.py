@@ -0,0 +1,233 @@
+# Standard library imports
+import asyncio
+import gc
+import os
+import signal
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+
+# Third-party imports
+from fastapi import HTTPException
+from starlette.types import ASGIApp, Receive, Scope, Send
+from starlette.routing import Match
+
+# Local application imports
+from app.base.logger import logger as _logger
+
+# Seconds between two samples, and the longest profile one request may ask for
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.005))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", 60))
+
+# Leaf frames of a thread that is waiting rather than working (event loop select, idle
+# threadpool workers, the log listener), left out of profiles unless idle samples are asked for
+IDLE_FRAMES = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('queue.py', 'get'),
+}
+
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def current_frames() -> dict:
+    """ `sys._current_frames()`, safe to call from a signal handler or a watchdog thread. """
+    # A collection while sys._current_frames() holds the interpreter's thread list lock
+    # can deadlock on it (CPython gh-106883), keep the GC off around the call
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return sys._current_frames()
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+class ProfileSession:
+    """ The samples of one profile run and the filters deciding which stacks are kept. """
+
+    def __init__(self, addon_dir: str = None, idle: bool = False, loop=None, loop_thread: int = None, routes=None):
+        self.addon_dir = addon_dir + os.sep if addon_dir else None
+        self.idle = idle
+        self.loop = loop
+        self.loop_thread = loop_thread
+        # Request mode: only requests matching `routes` are profiled, their tasks are tagged in `tasks`
+        self.routes = routes
+        self.tasks = weakref.WeakSet() if routes is not None else None
+        self.stacks = Counter()
+        self.samples = 0
+
+    def in_addon(self, code) -> bool:
+        return code.co_filename.startswith(self.addon_dir)
+
+    def record(self, thread_id: int, frame, thread_name: str):
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        if not codes:
+            return
+        if not self.idle and (os.path.basename(codes[0].co_filename), codes[0].co_name) in IDLE_FRAMES:
+            return
+
+        if self.tasks is not None:
+            # Request mode: the event loop counts while a tagged request task runs on it,
+            # other threads (the threadpool of sync endpoints) when they run addon code
+            if thread_id == self.loop_thread:
+                if asyncio.current_task(self.loop) not in self.tasks:
+                    return
+            elif self.addon_dir is None or not any(self.in_addon(code) for code in codes):
+                return
+        elif self.addon_dir is not None and not any(self.in_addon(code) for code in codes):
+            return
+
+        self.samples += 1
+        self.stacks[(thread_name,) + tuple(_frame_label(code) for code in reversed(codes))] += 1
+
+    def collapsed(self) -> str:
+        """ Brendan Gregg's collapsed stack format, `root;...;leaf count` per line. """
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler of the current worker process.
+
+    When the event loop runs in the main thread (uvicorn and gunicorn workers) a profile
+    arms ITIMER_PROF: every PROFILE_INTERVAL seconds of CPU time SIGPROF interrupts the
+    loop thread, whose handler records its own frame and the stacks of the other threads.
+    Otherwise a daemon thread samples `sys._current_frames()`, which can only run when
+    the loop releases the GIL and so sees the loop mostly in `select`.
+
+    No timer, thread or hook exists outside a profile, and only one profile runs per
+    worker at a time.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.session = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _thread_names() -> dict:
+        return {thread.ident: thread.name for thread in threading.enumerate()}
+
+    @staticmethod
+    def _sample_once(session: ProfileSession, own_id: int, own_frame=None, names: dict = None):
+        if names is None:
+            names = SamplingProfiler._thread_names()
+        if own_frame is not None:
+            session.record(own_id, own_frame, f"thread:{names.get(own_id, own_id)}")
+        for thread_id, frame in current_frames().items():
+            if thread_id != own_id:
+                session.record(thread_id, frame, f"thread:{names.get(thread_id, thread_id)}")
+
+    def _sample_thread(self, session: ProfileSession, seconds: float):
+        own = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self._sample_once(session, own)
+            time.sleep(self.interval)
+
+    async def _run_timer(self, session: ProfileSession, seconds: float):
+        own = threading.get_ident()
+        # threading.enumerate() takes a lock the interrupted code may be holding, so the
+        # handler only reads this map and the loop refreshes it between two samples
+        names = self._thread_names()
+
+        def on_timer(signum, frame):
+            # Runs between two bytecodes of whatever the loop is doing, it must never raise into it
+            try:
+                self._sample_once(session, own, frame, names)
+            except Exception:
+                pass
+
+        previous = signal.signal(signal.SIGPROF, on_timer)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        try:
+            deadline = time.monotonic() + seconds
+            while (remaining := deadline - time.monotonic()) > 0:
+                await asyncio.sleep(min(0.05, remaining))
+                names.update(self._thread_names())
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, previous)
+
+    async def _run_thread(self, session: ProfileSession, seconds: float):
+        thread = threading.Thread(target=self._sample_thread, args=(session, seconds), name="profiler", daemon=True)
+        thread.start()
+        # Wait without blocking the loop, the requests being profiled run on it meanwhile
+        while thread.is_alive():
+            await asyncio.sleep(min(0.05, seconds or 0.05))
+
+    async def run(self, seconds: float, addon_dir: str = None, idle: bool = False, routes: list = None) -> ProfileSession:
+        """
+        Sample the worker for `seconds` and return the session holding the stacks.
+
+        Args:
+            seconds (float): Duration of the profile, capped at PROFILE_MAX_SECONDS.
+            addon_dir (str): Only keep stacks that run code from this addon directory.
+            idle (bool): Keep the samples of threads that are only waiting.
+            routes (list): Request mode, only sample requests to these routes (tagged by ProfilingMiddleware).
+
+        Raises:
+            HTTPException: 409 when a profile is already running in this worker.
+        """
+        seconds = max(0.0, min(seconds, PROFILE_MAX_SECONDS))
+        if not self._lock.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail=f"A profile is already running in worker {os.getpid()}")
+        try:
+            session = ProfileSession(
+                addon_dir=addon_dir,
+                idle=idle,
+                loop=asyncio.get_running_loop(),
+                loop_thread=threading.get_ident(),
+                routes=routes,
+            )
+            self.session = session
+            use_timer = hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+            _logger.info(f"Profiling worker {os.getpid()} for {seconds}s ({'timer' if use_timer else 'thread'} sampling)")
+            if use_timer:
+                await self._run_timer(session, seconds)
+            else:
+                await self._run_thread(session, seconds)
+            return session
+        finally:
+            self.session = None
+            self._lock.release()
+
+
+class ProfilingMiddleware:
+    """
+    Tags the tasks of requests to the routes being profiled in request mode.
+
+    Outside a request mode profile the only cost is one attribute check per request.
+    """
+
+    def __init__(self, app: ASGIApp, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        session = self.profiler.session
+        if session is None or session.tasks is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if not any(route.matches(scope)[0] == Match.FULL for route in session.routes):
+            await self.app(scope, receive, send)
+            return
+
+        task = asyncio.current_task()
+        session.tasks.add(task)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session.tasks.discard(task)
+
+
+profiler = SamplingProfiler()
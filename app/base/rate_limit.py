@@ -0,0 +1,360 @@
+# Standard library imports
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Third-party imports
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Local application imports
+from app.base.logger import logger as _logger
+from app.base.loop_lag import LoopLagMonitor
+from app.base.routing_utils.registry import ModuleRecord, ModuleRegistry
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+# Requests per second allowed to one client over every route, 0 disables the global client limit
+RATE_LIMIT_CLIENT_RATE = float(os.environ.get("RATE_LIMIT_CLIENT_RATE", 0))
+RATE_LIMIT_CLIENT_BURST = float(os.environ.get("RATE_LIMIT_CLIENT_BURST", 0)) or None
+# Identify clients by this header (e.g. x-forwarded-for behind a proxy) instead of the peer address
+RATE_LIMIT_CLIENT_HEADER = os.environ.get("RATE_LIMIT_CLIENT_HEADER", "").lower()
+# Proxies in front of the app appending to that header, the client is the address the
+# outermost one saw: the N-th entry from the right. The entries left of it are sent by the
+# client and can't be trusted.
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", 1))
+# Per-client buckets kept per worker, the least recently used are dropped first
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get("RATE_LIMIT_MAX_CLIENTS", 10000))
+# Shed load with a 503 when this many requests are in flight in the worker, 0 disables
+SHED_MAX_INFLIGHT = int(os.environ.get("SHED_MAX_INFLIGHT", 1000))
+# Shed load with a 503 when the event loop runs its callbacks this many seconds late, 0 disables
+SHED_MAX_LAG = float(os.environ.get("SHED_MAX_LAG", 0.5))
+SHED_RETRY_AFTER = int(os.environ.get("SHED_RETRY_AFTER", 1))
+# Paths never shed, so the worker can still be observed while overloaded
+SHED_EXEMPT_PATHS = tuple(path for path in os.environ.get("SHED_EXEMPT_PATHS", "/metrics").split(",") if path)
+
+
+class RateLimit:
+    """
+    Token bucket parameters.
+
+    Args:
+        rate (float): Requests per second in the long run.
+        burst (float): Requests allowed at once, defaults to `rate` (at least 1).
+
+    Raises:
+        ValueError: When `rate` is not positive.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = float(rate)
+        if not self.rate > 0:
+            raise ValueError(f"Rate limits need a positive rate, got {rate!r}")
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+
+    @classmethod
+    def from_config(cls, config) -> "RateLimit":
+        if config is None or isinstance(config, RateLimit):
+            return config
+        return cls(config['rate'], config.get('burst'))
+
+
+class RateLimitPolicy:
+    """
+    Limits of an addon or a route: `limit` is shared by every client, `per_client` applies
+    to each client on its own. Either can be None.
+    """
+
+    def __init__(self, limit: RateLimit = None, per_client: RateLimit = None):
+        self.limit = limit
+        self.per_client = per_client
+
+    @classmethod
+    def from_config(cls, config) -> "RateLimitPolicy":
+        if isinstance(config, RateLimitPolicy):
+            return config
+        limit = RateLimit(config['rate'], config.get('burst')) if 'rate' in config else None
+        return cls(limit, RateLimit.from_config(config.get('per_client')))
+
+
+def rate_limit(rate: float = None, burst: float = None, per_client: dict = None):
+    """
+    Rate limit an addon route:
+
+        @router.post("/orders")
+        @rate_limit(rate=50, per_client={'rate': 2, 'burst': 5})
+        async def create_order(): ...
+    """
+    policy = RateLimitPolicy(RateLimit(rate, burst) if rate else None, RateLimit.from_config(per_client))
+
+    def decorator(endpoint):
+        endpoint.__rate_limit__ = policy
+        return endpoint
+
+    return decorator
+
+
+def addon_policy(manifest: dict) -> RateLimitPolicy:
+    """
+    The limits of a whole addon, from the `rate_limit` section of its manifest:
+
+        'rate_limit': {
+            'rate': 200, 'burst': 400,                  # every client together, all routes
+            'per_client': {'rate': 10, 'burst': 20},    # each client, all routes
+            'routes': {'route2': {'rate': 5}},          # per route name or path
+        }
+    """
+    config = manifest.get('rate_limit') or {}
+    policy = RateLimitPolicy.from_config({key: value for key, value in config.items() if key != 'routes'})
+    return policy if policy.limit or policy.per_client else None
+
+
+def policy_for(manifest: dict, route) -> RateLimitPolicy:
+    """ The limits of one route: its `rate_limit` decorator, else its entry in the manifest `routes`. """
+    policy = getattr(getattr(route, 'endpoint', None), '__rate_limit__', None)
+    if policy is not None:
+        return policy
+    routes = (manifest.get('rate_limit') or {}).get('routes') or {}
+    for key in (getattr(route, 'name', None), route.path):
+        if key in routes:
+            return RateLimitPolicy.from_config(routes[key])
+    return None
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, limit: RateLimit, now: float):
+        self.rate = limit.rate
+        self.burst = limit.burst
+        self.tokens = limit.burst
+        self.updated = now
+
+    def wait(self, now: float) -> float:
+        """ Seconds until a token is available, 0 when one is available now. """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class BucketTable:
+    """
+    Token buckets by key. The per-client buckets are bounded, the least recently used are
+    dropped beyond `max_size`. The shared ones (one per limited addon or route) are not,
+    so a flood of new clients can't refill them.
+    """
+
+    def __init__(self, max_size: int = RATE_LIMIT_MAX_CLIENTS):
+        self.max_size = max_size
+        self._shared = {}
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, checks: list, now: float) -> tuple:
+        """
+        Take one token from the bucket of every (key, limit, per_client) in `checks`, only
+        when all of them have one.
+
+        Returns:
+            tuple: The seconds until the request could go on (0 when it may go on now) and
+                the index in `checks` of the limit that blocks it.
+        """
+        with self._lock:
+            buckets = []
+            for key, limit, per_client in checks:
+                table = self._clients if per_client else self._shared
+                bucket = table.get(key)
+                if bucket is None:
+                    bucket = table[key] = TokenBucket(limit, now)
+                elif per_client:
+                    table.move_to_end(key)
+                buckets.append(bucket)
+            waits = [bucket.wait(now) for bucket in buckets]
+            wait = max(waits)
+            if wait == 0:
+                for bucket in buckets:
+                    bucket.tokens -= 1
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+            return wait, waits.index(wait)
+
+    def discard(self, technical_name: str):
+        with self._lock:
+            for table in (self._shared, self._clients):
+                for key in [key for key in table if key[1] == technical_name]:
+                    del table[key]
+
+    def __len__(self):
+        return len(self._shared) + len(self._clients)
+
+
+def client_id(scope: Scope, trusted_proxies: int = RATE_LIMIT_TRUSTED_PROXIES) -> str:
+    if RATE_LIMIT_CLIENT_HEADER:
+        value = Headers(scope=scope).get(RATE_LIMIT_CLIENT_HEADER)
+        if value:
+            addresses = [address.strip() for address in value.split(",")]
+            if trusted_proxies > 0 and len(addresses) >= trusted_proxies:
+                return addresses[-trusted_proxies]
+            # Fewer entries than proxies: the request didn't come through them, use the peer
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _reject(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse({"detail": detail}, status_code=status_code,
+                        headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+class RateLimitedApp:
+    """ Wraps the ASGI app of a rate limited route, answers 429 when one of its buckets is empty. """
+
+    def __init__(self, app: ASGIApp, limiter: "RateLimiter", technical_name: str, checks: list):
+        self.app = app
+        self.limiter = limiter
+        self.technical_name = technical_name
+        # (key, limit, per_client, kind), the client is appended to the key of per-client limits
+        self.checks = checks
+        self.per_client = any(per_client for _, _, per_client, _ in checks)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        client = client_id(scope) if self.per_client else None
+        checks = [(key + (client,) if per_client else key, limit, per_client) for key, limit, per_client, _ in self.checks]
+        wait, blocked = self.limiter.buckets.acquire(checks, time.monotonic())
+        if wait:
+            self.limiter.rejected(self.technical_name, self.checks[blocked][3])
+            await _reject(429, "Too many requests", wait)(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+class RateLimiter:
+    """
+    Token bucket rate limits of the addon routes, installed as a route layer of the module
+    registry so the owning addon of a request is known. Limits come from the `rate_limit`
+    section of the manifest or the `rate_limit` decorator, see `addon_policy`.
+
+    Everything lives in the memory of the worker: with N workers a client can get up to N
+    times a limit when its requests are spread over all of them.
+    """
+
+    def __init__(self, registry: ModuleRegistry, collector=None, max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.buckets = BucketTable(max_clients)
+        self.collector = collector
+        self.counts = {'rejected': {}, 'shed': {}}
+        if collector is not None:
+            collector.describe("app_rate_limited_total", "Requests answered 429 by the rate limiter, per addon and limit.")
+            collector.describe("app_shed_total", "Requests answered 503 by the load shedder, per reason.")
+        registry.subscribe(self._on_module_change)
+        registry.add_route_layer(self._wrap_route)
+
+    def _on_module_change(self, record: ModuleRecord, removed, added):
+        # A reloaded manifest may change the limits, start over with full buckets
+        self.buckets.discard(record.technical_name)
+
+    def _wrap_route(self, record: ModuleRecord, route):
+        if not hasattr(route, 'app'):
+            return
+        name = record.technical_name
+        checks = []
+        for policy, key, kind in ((addon_policy(record.manifest), ('addon', name), 'addon'),
+                                  (policy_for(record.manifest, route), ('route', name, route.path), 'route')):
+            if policy is None:
+                continue
+            if policy.limit is not None:
+                checks.append((key, policy.limit, False, kind))
+            if policy.per_client is not None:
+                checks.append((key, policy.per_client, True, f"{kind}_client"))
+        if checks:
+            route.app = RateLimitedApp(route.app, self, name, checks)
+
+    def rejected(self, technical_name: str, kind: str):
+        counts = self.counts['rejected'].setdefault(technical_name, {})
+        counts[kind] = counts.get(kind, 0) + 1
+        if self.collector is not None:
+            self.collector.increment("app_rate_limited_total", addon=technical_name, limit=kind)
+
+    def shed(self, reason: str):
+        self.counts['shed'][reason] = self.counts['shed'].get(reason, 0) + 1
+        if self.collector is not None:
+            self.collector.increment("app_shed_total", reason=reason)
+
+
+class LoadShedder:
+    """
+    Decides when a worker is overloaded: SHED_MAX_INFLIGHT requests already in flight, or
+    an event loop running its callbacks more than SHED_MAX_LAG seconds late.
+    """
+
+    def __init__(self, monitor: LoopLagMonitor, max_inflight: int = SHED_MAX_INFLIGHT, max_lag: float = SHED_MAX_LAG):
+        self.monitor = monitor
+        self.max_inflight = max_inflight
+        self.max_lag = max_lag
+        self.inflight = 0
+
+    def reason(self) -> str:
+        """ Why the next request should be shed, None when it can be served. """
+        if self.max_inflight and self.inflight >= self.max_inflight:
+            return "inflight"
+        if self.max_lag and self.monitor.current() > self.max_lag:
+            return "loop_lag"
+        return None
+
+    def stats(self) -> dict:
+        return {
+            'inflight': self.inflight,
+            'max_inflight': self.max_inflight,
+            'max_lag_ms': self.max_lag * 1000,
+            **self.monitor.stats(),
+        }
+
+
+class RateLimitMiddleware:
+    """
+    Load shedding and the global per-client limit, in front of every request.
+
+    An overloaded worker (see LoadShedder) answers 503 with Retry-After right away, so it
+    fails fast instead of queueing requests until they all time out. Then, with a
+    `client_limit`, the client must have a token in its bucket or gets a 429.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter, shedder: LoadShedder, client_limit: RateLimit = None,
+                 exempt_paths=SHED_EXEMPT_PATHS):
+        self.app = app
+        self.limiter = limiter
+        self.shedder = shedder
+        self.client_limit = client_limit
+        self.exempt_paths = frozenset(exempt_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        reason = self.shedder.reason()
+        if reason is not None:
+            self.limiter.shed(reason)
+            count = self.limiter.counts['shed'][reason]
+            if count == 1 or count % 1000 == 0:
+                _logger.warning(f"Shedding load ({reason}, {count} requests so far): {self.shedder.inflight} "
+                                f"requests in flight, loop lag {self.shedder.monitor.current() * 1000:.0f} ms")
+            await _reject(503, "Server overloaded", SHED_RETRY_AFTER)(scope, receive, send)
+            return
+
+        if self.client_limit is not None:
+            wait, _ = self.limiter.buckets.acquire([(('client', '', client_id(scope)), self.client_limit, True)],
+                                                   time.monotonic())
+            if wait:
+                self.limiter.rejected('', 'client')
+                await _reject(429, "Too many requests", wait)(scope, receive, send)
+                return
+
+        self.shedder.inflight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.shedder.inflight -= 1
@@ -0,0 +1,461 @@
+# Standard library imports
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+
+# Third-party imports
+import anyio
+from fastapi.routing import APIRoute
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Local application imports
+from app.base.compression import etag_matches, make_etag
+from app.base.logger import logger as _logger, ROOT_DIR
+from app.base.routing_utils.registry import ModuleRecord, ModuleRegistry
+
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+# 'memory' keeps a cache per worker, 'sqlite' shares one file between the workers (put it
+# on a tmpfs such as /dev/shm to keep it in shared memory)
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", os.path.join(ROOT_DIR, 'cache', 'response_cache.sqlite3'))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Larger responses are streamed through without being stored
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRY_BYTES", 1024 * 1024))
+
+# Fixed cost counted per entry on top of the body and headers
+ENTRY_OVERHEAD = 256
+# Cache hits of the sqlite backend whose LRU timestamps are written in one transaction
+SQLITE_ACCESS_BATCH = 100
+
+
+class CachePolicy:
+    """
+    How the responses of one route are cached.
+
+    Args:
+        ttl (float): Seconds an entry stays valid.
+        vary_query: True to key on the whole query string, a list of parameter names to
+            key on those only, False to ignore the query string.
+        vary_headers: Request headers that are part of the key.
+    """
+
+    def __init__(self, ttl: float = 60, vary_query=True, vary_headers=()):
+        self.ttl = float(ttl)
+        self.vary_query = vary_query if isinstance(vary_query, bool) else tuple(vary_query)
+        self.vary_headers = tuple(header.lower() for header in vary_headers)
+
+    @classmethod
+    def from_config(cls, config) -> "CachePolicy":
+        if isinstance(config, CachePolicy):
+            return config
+        if isinstance(config, (int, float)) and not isinstance(config, bool):
+            return cls(ttl=config)
+        return cls(**config)
+
+
+def cached(ttl: float = 60, vary_query=True, vary_headers=()):
+    """
+    Cache the responses of an addon route, for use under the router decorator:
+
+        @router.get("/route1")
+        @cached(ttl=30, vary_headers=["accept-language"])
+        async def route1(): ...
+
+    The endpoint itself is returned unchanged, the policy is read when the route is mounted.
+    """
+    policy = CachePolicy(ttl, vary_query, vary_headers)
+
+    def decorator(endpoint):
+        endpoint.__response_cache__ = policy
+        return endpoint
+
+    return decorator
+
+
+def policy_for(manifest: dict, route) -> CachePolicy:
+    """
+    The cache policy of a route: the `cached` decorator of its endpoint, else the entry for
+    the route name or path in the `cache` section of the addon manifest, e.g.
+
+        'cache': {'route1': {'ttl': 30, 'vary_query': ['page']}, '/test/route2': 300}
+    """
+    policy = getattr(route.endpoint, '__response_cache__', None)
+    if policy is not None:
+        return policy
+    config = manifest.get('cache') or {}
+    for key in (route.name, route.path):
+        if key in config:
+            return CachePolicy.from_config(config[key])
+    return None
+
+
+class CachedResponse:
+    __slots__ = ('status', 'headers', 'body', 'etag', 'created', 'expires', 'size')
+
+    def __init__(self, status: int, headers: list, body: bytes, etag: str, created: float, expires: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.created = created
+        self.expires = expires
+        self.size = len(body) + sum(len(name) + len(value) for name, value in headers) + ENTRY_OVERHEAD
+
+
+class MemoryCacheStore:
+    """ LRU of cached responses bounded by their total size, expired entries are dropped on access. """
+
+    # Cheap enough to be used from the event loop
+    blocking = False
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires <= time.time():
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: str, entry: CachedResponse):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self.entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self.entries)))
+
+    def _pop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def invalidate(self, prefix: str = ""):
+        with self._lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                self._pop(key)
+
+    def stats(self) -> dict:
+        return {'backend': 'memory', 'entries': len(self.entries), 'bytes': self.size,
+                'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+class SQLiteCacheStore:
+    """
+    Cached responses in an SQLite file shared by every worker of the host.
+
+    WAL mode lets workers read while another one writes. The LRU order is kept in the
+    `accessed` column, hits are written in batches of SQLITE_ACCESS_BATCH (and before any
+    eviction), so the order is approximate between two batches. The total size is kept by
+    triggers in the `cache_size` row and the oldest entries are deleted when it is exceeded.
+    Every call does file I/O, CachedRouteApp runs them in a worker thread.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._accessed = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self) -> 'sqlite3.Connection':
+        # Imported here, the memory backend doesn't need sqlite3 at startup
+        import sqlite3
+
+        # A connection must not cross a fork, every worker opens its own
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            # The rows deleted by INSERT OR REPLACE fire the delete trigger too
+            conn.execute("PRAGMA recursive_triggers=ON")
+            conn.executescript(
+                "BEGIN IMMEDIATE;"
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, status INTEGER, headers TEXT, body BLOB, etag TEXT, "
+                "created REAL, expires REAL, size INTEGER, accessed REAL);"
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);"
+                "CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER);"
+                "INSERT OR IGNORE INTO cache_size SELECT 0, COALESCE(SUM(size), 0) FROM responses;"
+                "CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses "
+                "BEGIN UPDATE cache_size SET total = total + new.size; END;"
+                "CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses "
+                "BEGIN UPDATE cache_size SET total = total - old.size; END;"
+                "COMMIT;"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+            self._accessed = {}
+        return self._conn
+
+    def _flush_accessed(self, conn):
+        if self._accessed:
+            accessed, self._accessed = self._accessed, {}
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                                 [(when, key) for key, when in accessed.items()])
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT status, headers, body, etag, created, expires FROM responses WHERE key = ? AND expires > ?",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._accessed[key] = now
+            if len(self._accessed) >= SQLITE_ACCESS_BATCH:
+                self._flush_accessed(conn)
+            self.hits += 1
+        status, headers, body, etag, created, expires = row
+        return CachedResponse(status, [tuple(header) for header in json.loads(headers)], body, etag, created, expires)
+
+    def set(self, key: str, entry: CachedResponse):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, entry.status, json.dumps(entry.headers), entry.body, entry.etag,
+                 entry.created, entry.expires, entry.size, time.time()),
+            )
+            total = conn.execute("SELECT total FROM cache_size").fetchone()[0]
+            if total > self.max_bytes:
+                self._flush_accessed(conn)
+                conn.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+                rows = conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+                total = sum(size for _, size in rows)
+                evicted = []
+                for old_key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((old_key,))
+                    total -= size
+                conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def invalidate(self, prefix: str = ""):
+        with self._lock:
+            self._connection().execute("DELETE FROM responses WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._connection()
+            self._flush_accessed(conn)
+            entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            size = conn.execute("SELECT total FROM cache_size").fetchone()[0]
+        return {'backend': 'sqlite', 'path': self.path, 'entries': entries, 'bytes': size,
+                'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+def build_store():
+    if RESPONSE_CACHE_BACKEND == 'sqlite':
+        return SQLiteCacheStore()
+    if RESPONSE_CACHE_BACKEND != 'memory':
+        _logger.warning(f"Unknown RESPONSE_CACHE_BACKEND '{RESPONSE_CACHE_BACKEND}', using the in-memory cache")
+    return MemoryCacheStore()
+
+
+def private_response(headers: Headers) -> bool:
+    """ Whether a response with `headers` belongs to one client and must not be shared. """
+    cache_control = headers.get("cache-control", "").lower()
+    return "set-cookie" in headers or "no-store" in cache_control or "private" in cache_control
+
+
+def _with_vary(headers: list, vary_headers: tuple) -> list:
+    """ `headers` with a single Vary header listing its previous values and `vary_headers`. """
+    names = []
+    kept = []
+    for name, value in headers:
+        if name.lower() == "vary":
+            names += [item.strip() for item in value.split(",") if item.strip()]
+        else:
+            kept.append((name, value))
+    lowered = {name.lower() for name in names}
+    names += [header for header in vary_headers if header not in lowered]
+    return kept + [("vary", ", ".join(names))] if names else kept
+
+
+class CachedRouteApp:
+    """
+    Wraps the ASGI app of a cached route. GET and HEAD requests are answered from the
+    store when possible, 200 responses of GET requests are stored with an ETag and a Vary
+    header listing the policy's headers, and a matching If-None-Match gets a 304 in both
+    cases. Requests with credentials (Authorization or Cookie) bypass the cache unless
+    the policy varies on that header.
+    """
+
+    def __init__(self, app: ASGIApp, store, policy: CachePolicy, prefix: str):
+        self.app = app
+        self.store = store
+        self.policy = policy
+        self.prefix = prefix
+
+    async def _get(self, key: str):
+        if self.store.blocking:
+            return await anyio.to_thread.run_sync(self.store.get, key)
+        return self.store.get(key)
+
+    async def _set(self, key: str, entry: CachedResponse):
+        if self.store.blocking:
+            await anyio.to_thread.run_sync(self.store.set, key, entry)
+        else:
+            self.store.set(key, entry)
+
+    def shared(self, headers: Headers) -> bool:
+        """ Whether the response to a request with `headers` may come from the shared cache. """
+        return all(name not in headers or name in self.policy.vary_headers for name in ("authorization", "cookie"))
+
+    def cache_key(self, scope: Scope, headers: Headers) -> str:
+        policy = self.policy
+        query = ""
+        if policy.vary_query:
+            params = parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+            if policy.vary_query is not True:
+                params = [(name, value) for name, value in params if name in policy.vary_query]
+            query = "&".join(f"{name}={value}" for name, value in sorted(params))
+        varying = "\n".join(f"{name}:{headers.get(name, '')}" for name in policy.vary_headers)
+        digest = hashlib.sha1(f"{scope['path']}?{query}\n{varying}".encode()).hexdigest()
+        return f"{self.prefix}{digest}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        method = scope["method"]
+        headers = Headers(scope=scope)
+        if method not in ("GET", "HEAD") or not self.shared(headers):
+            # Never share the response of an authenticated request unless keyed on the credentials
+            await self.app(scope, receive, send)
+            return
+
+        key = self.cache_key(scope, headers)
+        entry = await self._get(key)
+        if entry is not None:
+            await self.send_entry(entry, headers, send, head=method == "HEAD", hit=True)
+            return
+        if method == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        await self.fill(key, scope, receive, send, headers)
+
+    async def send_entry(self, entry: CachedResponse, request_headers: Headers, send: Send, head: bool, hit: bool):
+        now = time.time()
+        extra = [
+            (b"etag", entry.etag.encode("latin-1")),
+            (b"x-cache", b"HIT" if hit else b"MISS"),
+        ]
+        if hit:
+            extra.append((b"age", str(int(now - entry.created)).encode("latin-1")))
+        stored = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in entry.headers]
+        if etag_matches(request_headers.get("if-none-match"), entry.etag):
+            keep = [(name, value) for name, value in stored if name in (b"cache-control", b"vary", b"expires")]
+            await send({"type": "http.response.start", "status": 304, "headers": keep + extra})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": entry.status, "headers": stored + extra})
+        await send({"type": "http.response.body", "body": b"" if head else entry.body})
+
+    async def fill(self, key: str, scope: Scope, receive: Receive, send: Send, request_headers: Headers):
+        start = None
+        chunks = []
+        size = 0
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, size, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                if message["status"] != 200 or private_response(Headers(raw=message["headers"])):
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > RESPONSE_CACHE_MAX_ENTRY_BYTES:
+                # Too large to keep, stream the rest through
+                passthrough = True
+                await send(start)
+                await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": message.get("more_body", False)})
+                return
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            response_headers = _with_vary([
+                (name.decode("latin-1"), value.decode("latin-1"))
+                for name, value in start["headers"]
+                if name.lower() not in (b"etag", b"date", b"x-cache")
+            ], self.policy.vary_headers)
+            etag = Headers(raw=start["headers"]).get("etag") or make_etag(body)
+            now = time.time()
+            entry = CachedResponse(200, response_headers, body, etag, now, now + self.policy.ttl)
+            await self._set(key, entry)
+            await self.send_entry(entry, request_headers, send, head=False, hit=False)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class ResponseCache:
+    """
+    Response caching of addon routes, installed as a route layer of the module registry.
+
+    Routes with a policy get their ASGI app wrapped in a CachedRouteApp, other routes are
+    untouched. Entries are keyed under the owning module, so its whole cache is dropped
+    when the registry reports that the module was removed, enabled or reloaded.
+    """
+
+    def __init__(self, registry: ModuleRegistry, store=None):
+        self.store = store if store is not None else build_store()
+        registry.subscribe(self._on_module_change)
+        registry.add_route_layer(self._wrap_route)
+
+    @staticmethod
+    def prefix(technical_name: str) -> str:
+        return f"{technical_name}:"
+
+    def _wrap_route(self, record: ModuleRecord, route):
+        if not isinstance(route, APIRoute):
+            return
+        policy = policy_for(record.manifest, route)
+        if policy is not None:
+            route.app = CachedRouteApp(route.app, self.store, policy, self.prefix(record.technical_name))
+
+    def _on_module_change(self, record: ModuleRecord, removed, added):
+        self.invalidate(record.technical_name)
+
+    def invalidate(self, technical_name: str = None):
+        """ Drop the cached responses of one module, or of every module. """
+        self.store.invalidate(self.prefix(technical_name) if technical_name else "")
@@ -0,0 +1,100 @@
+# Standard library imports
+import threading
+
+# Third-party imports
+from fastapi import FastAPI, HTTPException
+from starlette._utils import get_route_path
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import BaseRoute, Match, NoMatchFound, compile_path
+from starlette.types import Receive, Scope, Send
+
+# Local application imports
+from app.base.logger import logger as _logger
+
+
+class LazyModuleLoader:
+    """
+    Imports one addon python file the first time one of its routes is hit.
+
+    The import runs in the threadpool under a lock, so concurrent first requests
+    wait for a single import instead of executing the module several times.
+    """
+
+    def __init__(self, routing, app: FastAPI, manifest: dict, module_name: str, module_path: str):
+        self.routing = routing
+        self.app = app
+        self.manifest = manifest
+        self.module_name = module_name
+        self.module_path = module_path
+        self.routes = []
+        self.loaded = False
+        self.mounted = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.loaded:
+                return
+            _logger.info(f"Lazy loading module: {self.module_name}")
+            mod = self.routing.import_module(self.module_name, self.module_path)
+            routes = self.routing.mount_module(self.app, self.manifest, mod, self.module_name, self.module_path,
+                                               replace=self.routes)
+            if routes is None:
+                # The file no longer defines a router, drop the placeholders so they stop matching
+                modules = self.routing.modules
+                modules.add_routes(self.app, modules.register(self.manifest), [], replace=self.routes)
+            self.routing.index.flush()
+            self.mounted = routes is not None
+            self.loaded = True
+
+    async def ensure_loaded(self):
+        if self.loaded:
+            return
+        try:
+            await run_in_threadpool(self.load)
+        except Exception as e:
+            _logger.error(f"Error lazy loading module '{self.module_name}': {e}")
+            raise HTTPException(status_code=503, detail=f"Module '{self.module_name}' could not be loaded")
+
+
+class LazyRoute(BaseRoute):
+    """
+    Placeholder for an addon route whose module has not been imported yet.
+
+    It matches exactly like the real route would, using the path and methods from
+    the route stub, and on the first request imports the module, swaps itself for
+    the real routes and dispatches the request again through the router.
+    Lazy routes are not part of the OpenAPI schema until their module is loaded.
+    """
+
+    def __init__(self, loader: LazyModuleLoader, path: str, name: str, methods: list, tags: list):
+        self.loader = loader
+        self.path = path
+        self.name = name
+        self.methods = set(methods)
+        self.tags = tags
+        self.include_in_schema = False
+        self.path_regex, self.path_format, self.param_convertors = compile_path(path)
+
+    def matches(self, scope: Scope):
+        if scope["type"] == "http":
+            match = self.path_regex.match(get_route_path(scope))
+            if match:
+                if scope["method"] not in self.methods:
+                    return Match.PARTIAL, {}
+                return Match.FULL, {}
+        return Match.NONE, {}
+
+    def url_path_for(self, name: str, /, **path_params):
+        # Not loaded routes can't build URLs, let the router try the other routes
+        raise NoMatchFound(name, path_params)
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.loader.ensure_loaded()
+        if not self.loader.mounted:
+            raise HTTPException(status_code=404, detail=f"Module '{self.loader.module_name}' has no routes")
+        # The real routes replaced this one, dispatch the request again
+        await self.loader.app.router(scope, receive, send)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(path={self.path!r}, name={self.name!r}, methods={sorted(self.methods)!r})"
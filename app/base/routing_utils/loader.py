@@ -0,0 +1,184 @@
+# Standard library imports
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Third-party imports
+from fastapi import FastAPI
+
+# Local application imports
+from app.base.logger import logger as _logger, ROOT_DIR
+from app.base.module_index import ModuleIndex
+
+ADDONS_LOAD_WORKERS = int(os.environ.get("ADDONS_LOAD_WORKERS", min(8, os.cpu_count() or 1)))
+ADDONS_LOAD_REPORT = os.environ.get("ADDONS_LOAD_REPORT", os.path.join(ROOT_DIR, 'logs', 'addon_load_report.json'))
+
+
+def resolve_load_order(manifests: dict):
+    """
+    Group addons in to levels using the `depends` key of their manifest.
+
+    Every addon only depends on addons of earlier levels, so all addons of one level
+    can be imported at the same time. Names are sorted inside a level to keep the
+    order deterministic.
+
+    Args:
+        manifests (dict): technical_name -> manifest of the addons to load.
+
+    Returns:
+        tuple: (levels, errors) where levels is a list of lists of technical names and
+        errors maps every addon that can't be loaded to the reason why.
+    """
+    errors = {}
+    for name, manifest in manifests.items():
+        missing = [dep for dep in manifest.get('depends', []) if dep not in manifests]
+        if missing:
+            errors[name] = f"missing dependencies {missing}"
+
+    # Anything depending on a broken addon is broken as well
+    changed = True
+    while changed:
+        changed = False
+        for name, manifest in manifests.items():
+            if name in errors:
+                continue
+            broken = [dep for dep in manifest.get('depends', []) if dep in errors]
+            if broken:
+                errors[name] = f"depends on addons that can't be loaded {broken}"
+                changed = True
+
+    pending = {
+        name: {dep for dep in manifest.get('depends', [])}
+        for name, manifest in manifests.items() if name not in errors
+    }
+    levels = []
+    while pending:
+        level = sorted(name for name, deps in pending.items() if not deps)
+        if not level:
+            for name in pending:
+                errors[name] = f"dependency cycle between {sorted(pending)}"
+            break
+        levels.append(level)
+        for name in level:
+            del pending[name]
+        for deps in pending.values():
+            deps.difference_update(level)
+    return levels, errors
+
+
+class AddonLoader:
+    """
+    Loads the addons of the index level by level in dependency order.
+
+    The python files of all addons in one level are executed concurrently in a thread
+    pool, their routers are then included one addon at a time in the order of
+    `resolve_load_order`, so the route table is the same on every start.
+    """
+
+    def __init__(self, routing, max_workers: int = ADDONS_LOAD_WORKERS, report_path: str = ADDONS_LOAD_REPORT):
+        self.routing = routing
+        self.max_workers = max(1, max_workers)
+        self.report_path = report_path
+        self.report = {}
+
+    def _import_file(self, module_name: str, module_path: str):
+        start = time.perf_counter()
+        try:
+            mod = self.routing.import_module(module_name, module_path)
+        except Exception as e:
+            return None, e, time.perf_counter() - start
+        return mod, None, time.perf_counter() - start
+
+    def load(self, app: FastAPI, entries: list, lazy_default: bool = False) -> dict:
+        """
+        Import and mount every installable addon in `entries`.
+
+        Returns:
+            dict: The timing report, technical_name -> import/include times and route count.
+        """
+        start = time.perf_counter()
+        manifests = {}
+        files = {}
+        for entry in entries:
+            manifest = ModuleIndex.manifest_of(entry)
+            if not manifest.get("installable", True):
+                _logger.info(f"Skipping non-installable module: {entry['technical_name']}")
+                continue
+            manifests[entry['technical_name']] = manifest
+            files[entry['technical_name']] = entry['files']
+
+        levels, errors = resolve_load_order(manifests)
+        for name, error in sorted(errors.items()):
+            _logger.error(f"Not loading module '{name}': {error}")
+
+        self.report = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='addon-loader') as pool:
+            for level in levels:
+                futures = {}
+                for name in level:
+                    lazy = manifests[name].get('lazy', lazy_default)
+                    for file in files[name]:
+                        stub = self.routing.index.route_stub(file) if lazy else None
+                        if stub is None:
+                            futures[file['path']] = pool.submit(self._import_file, file['module_name'], file['path'])
+
+                for name in level:
+                    self.report[name] = self._mount_addon(app, manifests[name], files[name], futures, lazy_default)
+
+        for name, error in errors.items():
+            self.report[name] = {'error': error}
+        self.write_report(time.perf_counter() - start)
+        return self.report
+
+    def _mount_addon(self, app: FastAPI, manifest: dict, files: list, futures: dict, lazy_default: bool) -> dict:
+        stats = {'import_ms': 0.0, 'include_ms': 0.0, 'routes': 0, 'files': len(files),
+                 'lazy': bool(manifest.get('lazy', lazy_default))}
+        for file in files:
+            module_name = file['module_name']
+            module_path = file['path']
+            try:
+                include_start = time.perf_counter()
+                if module_path not in futures:
+                    self.routing.mount_lazy(app, manifest, module_name, module_path, self.routing.index.route_stub(file))
+                else:
+                    mod, error, import_time = futures[module_path].result()
+                    stats['import_ms'] += import_time * 1000
+                    if error is not None:
+                        raise error
+                    include_start = time.perf_counter()
+                    self.routing.mount_module(app, manifest, mod, module_name, module_path)
+                stats['include_ms'] += (time.perf_counter() - include_start) * 1000
+            except ModuleNotFoundError as e:
+                _logger.error(f"Module not found: {module_name}, error: {e}")
+            except AttributeError as e:
+                _logger.error(f"Error in module '{module_name}': {e}")
+            except Exception as e:
+                _logger.error(f"Error loading module '{module_name}': {e}")
+        record = self.routing.modules.get(manifest['technical_name'])
+        stats['routes'] = len(record.routes) if record else 0
+        stats['import_ms'] = round(stats['import_ms'], 3)
+        stats['include_ms'] = round(stats['include_ms'], 3)
+        return stats
+
+    def write_report(self, total_time: float):
+        """ Log the slowest addons and write the full report as JSON. """
+        slowest = sorted(
+            ((name, stats) for name, stats in self.report.items() if 'error' not in stats),
+            key=lambda item: item[1]['import_ms'] + item[1]['include_ms'],
+            reverse=True,
+        )[:5]
+        _logger.info(
+            f"Loaded {len(self.report)} addons in {total_time * 1000:.1f} ms, slowest: "
+            + ", ".join(f"{name} ({stats['import_ms'] + stats['include_ms']:.1f} ms)" for name, stats in slowest)
+        )
+        try:
+            os.makedirs(os.path.dirname(self.report_path), exist_ok=True)
+            with open(self.report_path, 'w') as f:
+                json.dump({
+                    'pid': os.getpid(),
+                    'total_ms': round(total_time * 1000, 3),
+                    'addons': self.report,
+                }, f, indent=2, sort_keys=True)
+        except OSError as e:
+            _logger.warning(f"Could not write addon load report {self.report_path}: {e}")
@@ -0,0 +1,194 @@
+# Standard library imports
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Third-party imports
+from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Local application imports
+from app.base.logger import logger as _logger, ROOT_DIR
+
+MODULE_SYNC_ENABLED = os.environ.get("MODULE_SYNC_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+# State shared by the workers of one gunicorn master, created by gunicorn.conf.py when it starts
+MODULE_STATE_PATH = os.environ.get("MODULE_STATE_PATH", os.path.join(ROOT_DIR, 'cache', 'module_state.json'))
+# Seconds between two checks of the state file by a worker
+MODULE_SYNC_INTERVAL = float(os.environ.get("MODULE_SYNC_INTERVAL", 1.0))
+
+
+class ModuleStateStore:
+    """
+    Enable/remove decisions shared by the worker processes through one JSON file:
+
+        {"server": 4242, "generation": 3, "modules": {"shop": {"active": false, "generation": 3}}}
+
+    `server` is the pid of the gunicorn master that created the file, workers only use a
+    file created by their own master, so a file left by an earlier run or written by a
+    single process server is never applied.
+
+    Every change takes an exclusive flock on a lock file next to it, bumps the global
+    generation and stamps the module entry with it. The file is replaced atomically, so
+    readers never need the lock and a stat() tells them whether anything changed.
+    """
+
+    def __init__(self, path: str = MODULE_STATE_PATH):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def signature(self):
+        """ Identity of the current file, it changes with every write. """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'server': None, 'generation': 0, 'modules': {}}
+        except ValueError as e:
+            _logger.error(f"Unreadable module state file {self.path}: {e}")
+            return {'server': None, 'generation': 0, 'modules': {}}
+
+    def _write(self, state: dict):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def publish(self, server: int, technical_name: str, active: bool):
+        """
+        Record that a module was enabled or removed.
+
+        Returns:
+            int: The generation of the change, None when the file doesn't belong to `server`.
+        """
+        with self._locked():
+            state = self.read()
+            if state.get('server') != server:
+                return None
+            generation = state['generation'] + 1
+            state['generation'] = generation
+            state['modules'][technical_name] = {'active': active, 'generation': generation}
+            self._write(state)
+        return generation
+
+    def reset(self, server: int):
+        """ Start an empty state for the workers of the master `server`. """
+        with self._locked():
+            self._write({'server': server, 'generation': 0, 'modules': {}})
+
+
+class ModuleSync:
+    """
+    Keeps the route table of this worker in line with the shared module state.
+
+    `check` is cheap when nothing changed (one stat() at most every MODULE_SYNC_INTERVAL
+    seconds). When the file changed, the modules stamped with a generation this worker
+    hasn't applied yet are enabled or removed through Routing, in generation order. Each
+    module is swapped in with one assignment of the route table, so requests see a
+    module either entirely before or entirely after the change.
+    """
+
+    def __init__(self, routing, app: FastAPI, store: ModuleStateStore = None, interval: float = MODULE_SYNC_INTERVAL,
+                 server: int = None):
+        self.routing = routing
+        self.app = app
+        self.store = store if store is not None else ModuleStateStore()
+        self.interval = interval
+        # The gunicorn master, read when used since a preloaded app is created before the fork
+        self._server = server
+        self.generation = 0
+        self.signature = None
+        self.next_check = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def server(self) -> int:
+        return self._server if self._server is not None else os.getppid()
+
+    def due(self) -> bool:
+        return time.monotonic() >= self.next_check
+
+    def check(self) -> list:
+        """
+        Apply the changes other workers published since the last check.
+
+        Returns:
+            list: The (technical_name, active) changes applied.
+        """
+        with self._lock:
+            self.next_check = time.monotonic() + self.interval
+            signature = self.store.signature()
+            if signature == self.signature:
+                return []
+            state = self.store.read()
+            self.signature = signature
+            if state.get('server') != self.server:
+                return []
+            pending = sorted(
+                (entry['generation'], technical_name, entry['active'])
+                for technical_name, entry in state['modules'].items()
+                if entry['generation'] > self.generation
+            )
+            applied = []
+            for generation, technical_name, active in pending:
+                try:
+                    self.apply(technical_name, active)
+                    applied.append((technical_name, active))
+                except Exception as e:
+                    _logger.error(f"Could not {'enable' if active else 'remove'} module {technical_name} "
+                                  f"from the shared state (generation {generation}): {e}")
+            self.generation = max(self.generation, state['generation'])
+            if applied:
+                _logger.info(f"Module state generation {self.generation} applied in worker {os.getpid()}: {applied}")
+            return applied
+
+    def apply(self, technical_name: str, active: bool):
+        if active:
+            # enable_module also reloads a module whose files changed, like on the worker that published it
+            self.routing.enable_module(self.app, technical_name)
+            return
+        record = self.routing.modules.get(technical_name)
+        if record is not None and record.active:
+            self.routing.remove_module(self.app, technical_name)
+
+    def publish(self, technical_name: str, active: bool):
+        """ Share a change made by this worker with the other workers. """
+        with self._lock:
+            generation = self.store.publish(self.server, technical_name, active)
+            if generation is not None and generation == self.generation + 1:
+                # Nothing else changed in between, this worker is up to date
+                self.generation = generation
+
+
+class ModuleSyncMiddleware:
+    """ Runs `ModuleSync.check` before a request when the check interval has passed. """
+
+    def __init__(self, app: ASGIApp, sync: ModuleSync):
+        self.app = app
+        self.sync = sync
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "lifespan" and self.sync.due():
+            # Enabling a module may import addon code, keep it off the event loop
+            await run_in_threadpool(self.sync.check)
+        await self.app(scope, receive, send)
@@ -0,0 +1,225 @@
+# Standard library imports
+import threading
+
+# Third-party imports
+from fastapi import FastAPI
+from starlette._utils import get_route_path
+from starlette.datastructures import URL
+from starlette.responses import RedirectResponse
+from starlette.routing import Match
+from starlette.types import Receive, Scope, Send
+
+# Local application imports
+from app.base.routing_utils.registry import ModuleRegistry
+
+
+def _segments(path: str) -> list:
+    return path.split('/')
+
+
+def _is_param(segment: str) -> bool:
+    return '{' in segment
+
+
+class _Node:
+    __slots__ = ('static', 'param', 'routes')
+
+    def __init__(self):
+        self.static = {}
+        self.param = None
+        self.routes = {}
+
+
+class RouteTree:
+    """
+    Prefix tree over the path segments of the app's routes.
+
+    Static segments are dict lookups, a segment with a `{param}` goes to the single
+    parameter child of the node. Routes that can't be placed in the tree (mounts,
+    `{name:path}` parameters spanning several segments) are always candidates.
+
+    Every route gets a sequence key that sorts like its position in the route table,
+    so the candidates of a path are tried in the same order Starlette would try them.
+    Keys are tuples: a route inserted in place of another one gets the key of that
+    route extended with its own index, which keeps the order without renumbering.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self.fallback = {}
+        self.keys = {}
+        self.counter = 0
+        self.source = None
+        self.size = 0
+
+    @staticmethod
+    def is_indexable(route) -> bool:
+        path = getattr(route, 'path', None)
+        if not isinstance(path, str) or not path.startswith('/') or not hasattr(route, 'path_regex'):
+            return False
+        # Mounts match every path below them, their path attribute is a prefix only
+        if hasattr(route, 'routes') and not hasattr(route, 'endpoint'):
+            return False
+        return ':path}' not in path
+
+    def build(self, routes: list):
+        self.__init__()
+        for route in routes:
+            self.insert(route, (self.counter,))
+            self.counter += 1
+        self.source = routes
+        self.size = len(routes)
+
+    def insert(self, route, key: tuple):
+        if id(route) in self.keys:
+            return
+        self.keys[id(route)] = key
+        if not self.is_indexable(route):
+            self.fallback[id(route)] = (key, route)
+            return
+        node = self.root
+        for segment in _segments(route.path):
+            if _is_param(segment):
+                if node.param is None:
+                    node.param = _Node()
+                node = node.param
+            else:
+                node = node.static.setdefault(segment, _Node())
+        node.routes[id(route)] = (key, route)
+
+    def remove(self, route):
+        if self.keys.pop(id(route), None) is None:
+            return
+        if self.fallback.pop(id(route), None) is not None:
+            return
+        node = self.root
+        for segment in _segments(route.path):
+            node = node.param if _is_param(segment) else node.static.get(segment)
+            if node is None:
+                return
+        node.routes.pop(id(route), None)
+
+    def apply(self, removed: list, added: list, routes: list):
+        """
+        Apply a change of the route table made by ModuleRegistry.swap_routes.
+
+        The added routes took the place of the first removed one, or were appended.
+        When the table also changed in some other way the tree is marked stale instead.
+        """
+        known = [route for route in removed if id(route) in self.keys]
+        if self.size - len(known) + len(added) != len(routes):
+            self.source = None
+            return
+        base = min((self.keys[id(route)] for route in known), default=None)
+        for route in removed:
+            self.remove(route)
+        for index, route in enumerate(added):
+            if base is None:
+                self.insert(route, (self.counter,))
+                self.counter += 1
+            else:
+                self.insert(route, base + (index,))
+        self.source = routes
+        self.size = len(routes)
+
+    def candidates(self, path: str) -> list:
+        """ The routes that may match `path`, in route table order. """
+        found = list(self.fallback.values())
+        stack = [(self.root, 0)]
+        segments = _segments(path)
+        last = len(segments)
+        while stack:
+            node, depth = stack.pop()
+            if depth == last:
+                found.extend(node.routes.values())
+                continue
+            child = node.static.get(segments[depth])
+            if child is not None:
+                stack.append((child, depth + 1))
+            # An empty segment never matches a parameter, like Starlette's `[^/]+`
+            if node.param is not None and segments[depth]:
+                stack.append((node.param, depth + 1))
+        found.sort(key=lambda item: item[0])
+        return [route for _, route in found]
+
+
+class RadixDispatcher:
+    """
+    Replacement for the dispatch loop of the app's router.
+
+    Installed as `app.router.middleware_stack`, it only calls `matches` on the routes
+    the tree returns for the request path instead of every route of the app. Full and
+    partial matches, redirect_slashes and the 404 default behave like Starlette's Router.
+    The tree follows module enable/remove through the registry and is rebuilt whenever
+    the route table was changed some other way.
+    """
+
+    def __init__(self, app: FastAPI, registry: ModuleRegistry = None):
+        self.router = app.router
+        self.tree = RouteTree()
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.subscribe(self._on_module_change)
+
+    @classmethod
+    def install(cls, app: FastAPI, registry: ModuleRegistry = None):
+        dispatcher = cls(app, registry)
+        app.router.middleware_stack = dispatcher
+        return dispatcher
+
+    def _on_module_change(self, record, removed, added):
+        with self._lock:
+            if self.tree.source is None:
+                return
+            self.tree.apply(removed, added, self.router.routes)
+
+    def _current_tree(self) -> RouteTree:
+        routes = self.router.routes
+        tree = self.tree
+        if tree.source is not routes or tree.size != len(routes):
+            with self._lock:
+                if tree.source is not routes or tree.size != len(routes):
+                    tree.build(routes)
+        return tree
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.router.app(scope, receive, send)
+            return
+
+        if "router" not in scope:
+            scope["router"] = self.router
+
+        tree = self._current_tree()
+        route_path = get_route_path(scope)
+        partial = None
+        for route in tree.candidates(route_path):
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                scope.update(child_scope)
+                await route.handle(scope, receive, send)
+                return
+            elif match == Match.PARTIAL and partial is None:
+                partial = route
+                partial_scope = child_scope
+
+        if partial is not None:
+            scope.update(partial_scope)
+            await partial.handle(scope, receive, send)
+            return
+
+        if scope["type"] == "http" and self.router.redirect_slashes and route_path != "/":
+            redirect_scope = dict(scope)
+            if route_path.endswith("/"):
+                redirect_scope["path"] = redirect_scope["path"].rstrip("/")
+            else:
+                redirect_scope["path"] = redirect_scope["path"] + "/"
+
+            for route in tree.candidates(get_route_path(redirect_scope)):
+                match, child_scope = route.matches(redirect_scope)
+                if match != Match.NONE:
+                    response = RedirectResponse(url=str(URL(scope=redirect_scope)))
+                    await response(scope, receive, send)
+                    return
+
+        await self.router.default(scope, receive, send)
@@ -0,0 +1,230 @@
+# Third-party imports
+from fastapi import FastAPI, HTTPException
+from starlette.routing import BaseRoute
+
+
+class ModuleRecord:
+    """
+    A loaded addon and the route objects it owns in the app.
+
+    `routes` keeps the exact objects that are (or were, while the module is removed)
+    part of `app.router.routes`, so nothing has to be searched by path and method.
+    """
+
+    def __init__(self, manifest: dict):
+        self.manifest = manifest
+        self.technical_name = manifest['technical_name']
+        self.routes = []
+        self.active = True
+
+    @property
+    def name(self):
+        return self.manifest.get('name', self.technical_name)
+
+    def route_info(self) -> list:
+        return [
+            {
+                route.path: {
+                    'path': str(route.path),
+                    'name': str(getattr(route, 'name', '')),
+                    'methods': sorted(getattr(route, 'methods', None) or []),
+                }
+            }
+            for route in self.routes
+        ]
+
+    def as_dict(self) -> dict:
+        """ The manifest as served by the module endpoints, with the current routes and state. """
+        return {**self.manifest, 'routes': self.route_info(), 'active': self.active}
+
+
+class ModuleRegistry:
+    """
+    Index of the loaded addons: technical_name -> ModuleRecord -> owned routes.
+
+    Lookups by technical name, display name or route object are dict lookups.
+    Every change to the app's route table goes through `swap_routes`, which builds
+    the new table and assigns it in one step so requests in flight keep iterating
+    over a consistent list. Subscribers are told about every change afterwards.
+    """
+
+    def __init__(self):
+        self._records = {}
+        self._by_name = {}
+        self._owners = {}
+        self._listeners = []
+        self._layers = []
+
+    def subscribe(self, listener):
+        """
+        Call `listener(record, removed, added)` after the routes of a module changed.
+        `removed` and `added` are the routes taken out of and put in to the app.
+        """
+        self._listeners.append(listener)
+
+    def add_route_layer(self, layer):
+        """
+        Call `layer(record, route)` for every route owned by a module, now and for every
+        route object a module gets later. Layers wrap `route.app` to add per route behaviour
+        (caching, limits) that only costs something on the routes that use it; the layer
+        added last is the outermost one.
+        """
+        self._layers.append(layer)
+        for record in self._records.values():
+            for route in record.routes:
+                self._apply_layers(record, route)
+
+    def _apply_layers(self, record: ModuleRecord, route):
+        # A route object is wrapped once per layer, even when it is mounted again
+        applied = route.__dict__.setdefault('_route_layers', [])
+        for layer in self._layers:
+            if layer not in applied:
+                layer(record, route)
+                applied.append(layer)
+
+    def _own(self, record: ModuleRecord, routes):
+        for route in routes:
+            self._owners[id(route)] = record
+            self._apply_layers(record, route)
+
+    def _notify(self, record: ModuleRecord, removed, added):
+        for listener in self._listeners:
+            listener(record, list(removed), list(added))
+
+    def __iter__(self):
+        return iter(self._records.values())
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, technical_name):
+        return technical_name in self._records
+
+    def get(self, technical_name: str):
+        return self._records.get(technical_name)
+
+    def get_by_name(self, name: str):
+        """ Find a record by its manifest `name`, falling back to the technical name. """
+        return self._records.get(self._by_name.get(name, name))
+
+    def owner_of(self, route: BaseRoute):
+        """ Return the ModuleRecord owning `route`, or None for base routes. """
+        return self._owners.get(id(route))
+
+    def manifests(self) -> list:
+        return [record.as_dict() for record in self._records.values()]
+
+    def register(self, manifest: dict) -> ModuleRecord:
+        """ Return the record of the module described by `manifest`, creating it if needed. """
+        record = self._records.get(manifest['technical_name'])
+        if record is None:
+            record = ModuleRecord(manifest)
+            self._records[record.technical_name] = record
+            self._by_name[record.name] = record.technical_name
+        return record
+
+    def swap_routes(self, app: FastAPI, remove=(), add=()):
+        """
+        Replace `remove` by `add` in the app's route table with a single list assignment.
+        The new routes take the place of the first removed route, or are appended.
+        """
+        current = app.router.routes
+        if not remove:
+            app.router.routes = current + list(add)
+            return
+        remove_ids = {id(route) for route in remove}
+        if not add:
+            app.router.routes = [route for route in current if id(route) not in remove_ids]
+            return
+        routes = []
+        inserted = False
+        for route in current:
+            if id(route) in remove_ids:
+                if not inserted:
+                    routes.extend(add)
+                    inserted = True
+                continue
+            routes.append(route)
+        if not inserted:
+            routes.extend(add)
+        app.router.routes = routes
+
+    def add_routes(self, app: FastAPI, record: ModuleRecord, routes: list, replace=()):
+        """
+        Mount `routes` for `record`, taking the place of the `replace` routes it owned before.
+        Routes of an inactive module are only recorded and get mounted by `enable`.
+        """
+        replace_ids = {id(route) for route in replace}
+        owned = []
+        inserted = not routes
+        for route in record.routes:
+            if id(route) in replace_ids:
+                self._owners.pop(id(route), None)
+                if not inserted:
+                    owned.extend(routes)
+                    inserted = True
+                continue
+            owned.append(route)
+        if not inserted:
+            owned.extend(routes)
+        record.routes = owned
+        self._own(record, routes)
+        if record.active:
+            self.swap_routes(app, remove=replace, add=routes)
+            self._notify(record, replace, routes)
+
+    def reload(self, app: FastAPI, record: ModuleRecord, routes: list, manifest: dict = None):
+        """
+        Replace every route of `record` by `routes` in one assignment and mark the module active.
+
+        Args:
+            manifest (dict): New manifest of the module, when it changed on disk.
+        """
+        old_routes = record.routes
+        removed = old_routes if record.active else ()
+        if manifest is not None:
+            self._by_name.pop(record.name, None)
+            record.manifest = manifest
+            self._by_name[record.name] = record.technical_name
+        for route in old_routes:
+            self._owners.pop(id(route), None)
+        self._own(record, routes)
+        self.swap_routes(app, remove=removed, add=routes)
+        record.routes = list(routes)
+        record.active = True
+        self._notify(record, removed, routes)
+
+    def remove(self, app: FastAPI, technical_name: str) -> list:
+        """
+        Unmount every route of a module. The record and its routes are kept so the
+        module can be enabled again without importing it.
+
+        Returns:
+            list: The removed routes.
+        """
+        record = self._records.get(technical_name)
+        if record is None:
+            raise HTTPException(status_code=404, detail=f"Module '{technical_name}' not found")
+        if not record.active:
+            return []
+        self.swap_routes(app, remove=record.routes)
+        record.active = False
+        self._notify(record, record.routes, ())
+        return list(record.routes)
+
+    def enable(self, app: FastAPI, technical_name: str) -> list:
+        """
+        Mount the routes of a removed module again.
+
+        Returns:
+            list: The mounted routes, empty when the module was already active.
+        """
+        record = self._records.get(technical_name)
+        if record is None:
+            raise HTTPException(status_code=404, detail=f"Module '{technical_name}' not found")
+        if record.active:
+            return []
+        self.swap_routes(app, add=record.routes)
+        record.active = True
+        self._notify(record, (), record.routes)
+        return list(record.routes)
@@ -1,208 +1,203 @@
 # Standard library imports
 import os
-import importlib
-import sys
+import importlib.util
+import time
 
 # Third-party imports
-from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, HTTPException,APIRouter
-from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
-from fastapi.routing import APIRoute
-from starlette.middleware.cors import CORSMiddleware
+from fastapi import FastAPI, HTTPException, APIRouter
 
 # Local application imports
 from app.base.logger import logger as _logger
-from app.base.auth.auth import router as authService
-from app.base.utils import log_request_info
-from app.base.module import Module
+from app.base.module_index import ModuleIndex, ADDONS_PATH
+from app.base.routing_utils.lazy import LazyModuleLoader, LazyRoute
+from app.base.routing_utils.loader import AddonLoader
+from app.base.routing_utils.registry import ModuleRegistry
 # from app.base.db import get_session
 
-import ast
+
+# Set ADDONS_LOAD_MODE=lazy to import addon code on the first request to one of its routes
+ADDONS_LOAD_MODE = os.environ.get("ADDONS_LOAD_MODE", "eager")
+
 
 class Routing():
 
-    def __init__(self):
-        self.modules = []
+    def __init__(self, addons_dir: str = ADDONS_PATH):
+        self.modules = ModuleRegistry()
+        self.index = ModuleIndex(addons_dir)
+        self.load_report = {}
 
 
     def register_routes(self,app: FastAPI):
         """
-        Loop through all Python files in the addons/ directory, load each module's manifest,
-        and register routes in the FastAPI app.
+        Load every addon listed in the addon index and register the routers found
+        in its python files in the FastAPI app, in the dependency order given by the
+        `depends` key of the manifests.
+
+        In lazy mode (ADDONS_LOAD_MODE=lazy or `'lazy': True` in the manifest) files with
+        a route stub in the index only get placeholder routes, the file itself is imported
+        on the first request. Files without a stub are imported right away to generate one.
+        """
+        self.load_report = AddonLoader(self).load(app, self.index.scan(), lazy_default=ADDONS_LOAD_MODE == 'lazy')
+        self.index.flush()
+
+    def import_module(self, module_name: str, module_path: str):
+        """ Execute an addon python file and return the resulting module object. """
+        spec = importlib.util.spec_from_file_location(f"addons.{module_name}", module_path)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        return mod
+
+    def staging_router(self, app: FastAPI) -> APIRouter:
+        """
+        Return an empty router configured like `app.router`.
+
+        Routes are included in it first and then moved in to the app in one assignment,
+        so requests in flight never see a partially registered module.
+        """
+        return APIRouter(
+            dependencies=list(app.router.dependencies),
+            default_response_class=app.router.default_response_class,
+            dependency_overrides_provider=app.router.dependency_overrides_provider,
+            generate_unique_id_function=app.router.generate_unique_id_function,
+        )
+
+    def build_routes(self, app: FastAPI, mod, module_name: str):
         """
-        addons_dir = os.path.join(os.path.dirname(__file__), '../../addons')
-        base_module = 'addons'
-        for root, dirs, files in os.walk(addons_dir):
-            if 'tests' in dirs:
-                _logger.info(f"Skipped test dir: {os.path.join(root, 'tests')}")
-                dirs.remove('tests')
-            if 'config' in dirs:
-                _logger.info(f"Skipped config dir: {os.path.join(root, 'tests')}")
-                dirs.remove('config')
-            for file in files:
-                if file.endswith('.py') and not file.startswith('__'):
-                    module_path = os.path.join(root, file)
-                    module_name = os.path.relpath(module_path, addons_dir).replace(os.sep, '.').rstrip('.py')
-                    # Create a Module instance
-                    module = Module(root)
-                    try:
-                        # Load the module's manifest
-                        manifest = module.load_manifest(module_name)
-                        if not manifest.get("installable", True):
-                            _logger.info(f"Skipping non-installable module: {module_name}")
-                            continue
-                        # Import the module dynamically
-                        spec = importlib.util.spec_from_file_location(f"{base_module}.{module_name}", module_path)
-                        mod = importlib.util.module_from_spec(spec)
-                        spec.loader.exec_module(mod)
-                        # Check for and register the router
-                        if hasattr(mod, 'router') and hasattr(mod, 'dependency'):
-                            if isinstance(mod.router, APIRouter):
-                                app.include_router(
-                                    router=mod.router,
-                                    dependencies=mod.dependency + [
-                                        Depends(log_request_info),
-                                        # Depends(get_session),
-                                    ],
-                                )
-                                for route in mod.router.routes:
-                                    manifest['routes'].append({
-                                        route.path : {
-                                            'path' : str(route.path),
-                                            'name' : str(route.name),
-                                            'methods' : str(route.methods),
-                                        }
-                                })
-                                self.modules.append(manifest)
-                                _logger.info(f"Registered router from module: {module_name} with dependencies {mod.dependency}")
-                            else:
-                                _logger.error(f"Imported route is not of type {mod.router} != {APIRouter}")
-                        else:
-                            _logger.warning(f"Module '{module_name}' does not have 'router' or 'dependency' attributes.")
-                    except ModuleNotFoundError as e:
-                        _logger.error(f"Module not found: {module_name}, error: {e}")
-                    except AttributeError as e:
-                        _logger.error(f"Error in module '{module_name}': {e}")
-                    except Exception as e:
-                        _logger.error(f"Error loading module '{module_name}': {e}")
-
-
-    def enable_module(self, app: FastAPI, base_module: str):
+        Include the router of an imported addon file in a staging router and return the
+        resulting routes, or None when the file doesn't define a router.
         """
-        Dynamically import and register routes from Python modules in the specified base folder.
+        if not (hasattr(mod, 'router') and hasattr(mod, 'dependency')):
+            _logger.warning(f"Module '{module_name}' does not have 'router' or 'dependency' attributes.")
+            return None
+        if not isinstance(mod.router, APIRouter):
+            _logger.error(f"Imported route is not of type {mod.router} != {APIRouter}")
+            return None
+
+        staging = self.staging_router(app)
+        staging.include_router(
+            router=mod.router,
+            dependencies=mod.dependency,
+        )
+        return staging.routes
+
+    def record_stub(self, technical_name: str, module_path: str, mod):
+        """ Store the route table of an imported addon file in the index for lazy mode. """
+        self.index.record_routes(technical_name, module_path, [
+            {
+                'path': str(route.path),
+                'name': str(route.name),
+                'methods': sorted(getattr(route, 'methods', None) or []),
+                'tags': [str(tag) for tag in getattr(route, 'tags', [])],
+            }
+            for route in mod.router.routes
+        ])
+
+    def mount_module(self, app: FastAPI, manifest: dict, mod, module_name: str, module_path: str, replace=()):
+        """
+        Include the router of an imported addon file in the app and record its routes.
+
+        Args:
+            replace: Routes (e.g. lazy placeholders) the new routes take the place of.
+
+        Returns:
+            list: The mounted routes, or None when the file doesn't define a router.
+        """
+        routes = self.build_routes(app, mod, module_name)
+        if routes is None:
+            return None
+        record = self.modules.register(manifest)
+        self.modules.add_routes(app, record, routes, replace=replace)
+
+        self.record_stub(manifest['technical_name'], module_path, mod)
+        _logger.info(f"Registered router from module: {module_name} with dependencies {mod.dependency}")
+        return routes
+
+    def mount_lazy(self, app: FastAPI, manifest: dict, module_name: str, module_path: str, stub: list):
+        """ Register placeholder routes for an addon file from its route stub, without importing it. """
+        loader = LazyModuleLoader(self, app, manifest, module_name, module_path)
+        for route in stub:
+            loader.routes.append(LazyRoute(loader, route['path'], route['name'], route['methods'], route['tags']))
+        self.modules.add_routes(app, self.modules.register(manifest), loader.routes)
+        _logger.info(f"Registered lazy routes from module: {module_name}")
+
+
+    def enable_module(self, app: FastAPI, base_module: str) -> dict:
+        """
+        Enable a single module without touching the other addons.
+
+        A removed module whose files did not change gets its recorded routes mounted again.
+        Otherwise only the named addon is imported, its new routes are diffed against the
+        ones currently mounted for it and swapped in with one assignment of the route table.
+
         Args:
             app (FastAPI): The FastAPI application instance.
-            base_module (str): The Python import base path for the modules.
+            base_module (str): The technical name of the module.
+
+        Returns:
+            dict: The route diff and how long the swap took.
         """
-        addons_dir = os.path.join(os.path.dirname(__file__), '../../addons')
-        for root, dirs, files in os.walk(addons_dir):
-            # Skip 'tests' and 'config' directories
-            if 'tests' in dirs:
-                _logger.debug(f"Skipped test dir: {os.path.join(root, 'tests')}")
-                dirs.remove('tests')
-            if 'config' in dirs:
-                _logger.debug(f"Skipped config dir: {os.path.join(root, 'config')}")
-                dirs.remove('config')
-            for file in files:
-                if file.endswith('.py') and not file.startswith('__'):
-                    module_path = os.path.join(root, file)
-                    module_name = os.path.relpath(module_path, addons_dir).replace(os.sep, '.').rstrip('.py')
-                    try:
-                        # Dynamically import the module
-                        spec = importlib.util.spec_from_file_location(f"{base_module}.{module_name}", module_path)
-                        mod = importlib.util.module_from_spec(spec)
-                        spec.loader.exec_module(mod)
-                        # Load and validate the router
-                        if hasattr(mod, 'router') and hasattr(mod, 'dependency'):
-                            if isinstance(mod.router, APIRouter):
-                                app.include_router(
-                                    router=mod.router,
-                                    dependencies=mod.dependency + [
-                                        Depends(log_request_info),
-                                    ],
-                                )
-                                for route in mod.router.routes:
-                                    self.modules.append({
-                                        'module': module_name,
-                                        'route': {
-                                            'path': str(route.path),
-                                            'name': str(route.name),
-                                            'methods': str(route.methods),
-                                        },
-                                    })
-                                _logger.info(f"Registered router from module: {module_name}")
-                            else:
-                                _logger.error(f"Router is not of type APIRouter in module: {module_name}")
-                        else:
-                            _logger.warning(f"Module '{module_name}' does not have 'router' or 'dependency' attributes.")
-                    except ModuleNotFoundError as e:
-                        _logger.error(f"Module not found: {module_name}, error: {e}")
-                    except AttributeError as e:
-                        _logger.error(f"Error in module '{module_name}': {e}")
-                    except Exception as e:
-                        _logger.error(f"Error loading module '{module_name}': {e}")
-
-
-
-    def remove_module(self, app: FastAPI, base_module: str, loaded_modules):
-        addons_dir = os.path.join(os.path.dirname(__file__), '../../addons')
-
-        # Find the module by technical_name
-        module_to_remove = next((module for module in loaded_modules if base_module == module['technical_name']), None)
-        if not module_to_remove:
+        start = time.perf_counter()
+        entry = self.index.get(base_module)
+        if entry is None:
             raise HTTPException(status_code=404, detail=f"Module '{base_module}' not found")
+        manifest = ModuleIndex.manifest_of(entry)
+        if not manifest.get("installable", True):
+            raise HTTPException(status_code=400, detail=f"Module '{base_module}' is not installable")
+        missing = [dep for dep in manifest.get('depends', [])
+                   if dep not in self.modules or not self.modules.get(dep).active]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Module '{base_module}' depends on modules that are not enabled: {missing}")
+
+        record = self.modules.get(base_module)
+        old_routes = list(record.routes) if record is not None and record.active else []
+        unchanged_files = all(self.index.route_stub(file) is not None for file in entry['files'])
+
+        if record is not None and unchanged_files:
+            # Nothing changed on disk, the recorded routes are still valid
+            swap_start = time.perf_counter()
+            self.modules.enable(app, base_module)
+            swap_time = time.perf_counter() - swap_start
+            new_routes = record.routes
+        else:
+            new_routes = []
+            mods = []
+            for file in entry['files']:
+                mod = self.import_module(file['module_name'], file['path'])
+                routes = self.build_routes(app, mod, file['module_name'])
+                if routes is not None:
+                    new_routes.extend(routes)
+                    mods.append((file['path'], mod))
+            swap_start = time.perf_counter()
+            record = self.modules.register(manifest)
+            self.modules.reload(app, record, new_routes, manifest=manifest)
+            swap_time = time.perf_counter() - swap_start
+            for module_path, mod in mods:
+                self.record_stub(base_module, module_path, mod)
+            self.index.flush()
+
+        def route_key(route):
+            return f"{','.join(sorted(getattr(route, 'methods', None) or []))} {route.path}"
+
+        old_keys = {route_key(route) for route in old_routes}
+        new_keys = {route_key(route) for route in new_routes}
+        _logger.info(f"Enabled module {base_module} with {len(new_routes)} routes, swap took {swap_time * 1000:.3f} ms")
+        return {
+            "added_routes": sorted(new_keys - old_keys),
+            "removed_routes": sorted(old_keys - new_keys),
+            "unchanged_routes": sorted(old_keys & new_keys),
+            "swap_ms": round(swap_time * 1000, 3),
+            "total_ms": round((time.perf_counter() - start) * 1000, 3),
+        }
+
 
-        routes_to_remove = module_to_remove["routes"]
-        removed_routes = []
-        unmatched_routes = []
-
-        for route_entry in routes_to_remove:
-            # Extract the key and value for each route entry
-            if len(route_entry) != 1:
-                unmatched_routes.append(route_entry)
-                continue
-
-            route_path, route_details = next(iter(route_entry.items()))
-
-            # Ensure the route details contain the path and methods
-            module_path = route_details.get("path")
-            
-            # Safely convert methods to a set
-            try:
-                module_methods = ast.literal_eval(route_details.get("methods", "[]"))  # Convert string to set
-                if not isinstance(module_methods, set):  # Ensure it's a set
-                    module_methods = set(module_methods)
-            except (ValueError, SyntaxError):
-                unmatched_routes.append(route_entry)
-                continue
-
-            if not module_path or not module_methods:
-                unmatched_routes.append(route_entry)
-                continue
-
-            # Look for a matching route in app.router.routes
-            route_to_remove = next(
-                (
-                    route
-                    for route in app.router.routes
-                    if isinstance(route, APIRoute)
-                    and route.path == module_path
-                    and module_methods.issubset(route.methods)
-                ),
-                None,
-            )
-
-            if route_to_remove:
-                app.router.routes.remove(route_to_remove)
-                removed_routes.append(module_path)
-            else:
-                unmatched_routes.append(route_entry)
-
-        # Clear OpenAPI schema cache to reflect the removed routes
-        app.openapi_schema = None
+    def remove_module(self, app: FastAPI, base_module: str):
+        """
+        Unmount every route owned by the module with technical name `base_module`.
+        """
+        removed = self.modules.remove(app, base_module)
 
         return {
             "message": f"Routes from module '{base_module}' have been removed",
-            "removed_routes": removed_routes,
-            "unmatched_routes": unmatched_routes,
+            "removed_routes": [route.path for route in removed],
+            "unmatched_routes": [],
         }
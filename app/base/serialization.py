@@ -0,0 +1,178 @@
+# Standard library imports
+import functools
+import inspect
+import json
+import os
+from typing import Annotated, Any
+
+# Third-party imports
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from starlette.responses import JSONResponse, Response
+
+# Local application imports
+from app.base.routing_utils.registry import ModuleRecord, ModuleRegistry
+
+# orjson is a dependency, the json module only stands in when it is missing from the environment
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 'standard' serializes through FastAPI's jsonable_encoder and json.dumps, 'fast' encodes
+# responses in one pass, see FastJSON. Addons choose with 'json' in their manifest.
+JSON_MODE = os.environ.get("JSON_MODE", "standard").lower()
+JSON_MODES = ('standard', 'fast')
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode `content` to JSON bytes, objects the encoder doesn't know (models, dataclasses,
+    dates...) are converted by `jsonable_encoder`. orjson writes NaN and infinite floats
+    as null where the json module refuses them.
+
+    Raises:
+        TypeError, ValueError: When `content` can't be encoded.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            pass  # Integers over 64 bits among others, the json module has the last word
+    return json.dumps(content, default=jsonable_encoder, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """ JSONResponse encoded with `dumps`, the default response class of the app in fast mode. """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_mode(manifest: dict, default: str = JSON_MODE) -> str:
+    """ The serialization mode of an addon, the `json` entry of its manifest or `default`. """
+    mode = manifest.get('json', default)
+    return mode if mode in JSON_MODES else default
+
+
+def _uses_response_param(route: APIRoute) -> bool:
+    # Headers and status set on a `Response` parameter are only applied by FastAPI's own path
+    dependants = [route.dependant]
+    while dependants:
+        dependant = dependants.pop()
+        if dependant.response_param_name:
+            return True
+        dependants.extend(dependant.dependencies)
+    return False
+
+
+def can_serialize(route) -> bool:
+    """ Whether the responses of `route` can be encoded by FastJSON with the same result as FastAPI. """
+    if not isinstance(route, APIRoute) or route.dependant.call is None:
+        return False
+    response_class = route.response_class
+    if isinstance(response_class, DefaultPlaceholder):
+        response_class = response_class.value
+    if not issubclass(response_class, JSONResponse):
+        return False
+    if route.response_model_include is not None or route.response_model_exclude is not None:
+        return False
+    if route.status_code in (204, 304) or (route.status_code or 200) < 200:
+        return False
+    return not _uses_response_param(route)
+
+
+class RouteSerializer:
+    """
+    Encodes the return value of one route endpoint to a JSON response.
+
+    With a response model the value is validated like FastAPI does and dumped to JSON by
+    pydantic in one pass, instead of dumping it to python objects that are encoded again.
+    An instance of the response model itself is already validated and dumped directly.
+    Without one the value is encoded by `dumps`. Returns None when the value has to go
+    through FastAPI's own path, to get its error on an invalid response.
+    """
+
+    def __init__(self, route: APIRoute):
+        self.field = route.response_field
+        self.model = route.response_model if self.field is not None else None
+        self.status_code = route.status_code or 200
+        self.media_type = "application/json"
+        self.options = {
+            'by_alias': route.response_model_by_alias,
+            'exclude_unset': route.response_model_exclude_unset,
+            'exclude_defaults': route.response_model_exclude_defaults,
+            'exclude_none': route.response_model_exclude_none,
+        }
+        self._adapter = None
+
+    @property
+    def adapter(self) -> TypeAdapter:
+        # Built on first use, like FastAPI's ModelField, a few ms per model at startup otherwise
+        if self._adapter is None:
+            field_info = self.field.field_info
+            self._adapter = TypeAdapter(Annotated[field_info.annotation, field_info])
+        return self._adapter
+
+    def encode(self, value: Any) -> bytes:
+        if self.field is None:
+            try:
+                return dumps(value)
+            except (TypeError, ValueError):
+                return None
+        if not (isinstance(value, BaseModel) and type(value) is self.model):
+            try:
+                value = self.adapter.validate_python(value, from_attributes=True)
+            except ValidationError:
+                return None
+        return self.adapter.dump_json(value, **self.options)
+
+    def response(self, value: Any):
+        if isinstance(value, Response):
+            return value
+        body = self.encode(value)
+        if body is None:
+            return value
+        return Response(body, status_code=self.status_code, media_type=self.media_type)
+
+
+def _serialized(endpoint, serializer: RouteSerializer):
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            return serializer.response(await endpoint(*args, **kwargs))
+    else:
+        # Sync endpoints run in the threadpool, their response is encoded there too
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            return serializer.response(endpoint(*args, **kwargs))
+    wrapper.__serialized__ = endpoint
+    return wrapper
+
+
+class FastJSON:
+    """
+    Fast JSON serialization of the addon routes in `fast` mode, installed as a layer of the
+    module registry. The endpoint of each route FastAPI calls is wrapped so it returns the
+    encoded response, FastAPI then sends it as is and skips `jsonable_encoder` and
+    `json.dumps`. Routes whose result FastJSON can't reproduce exactly (a `Response`
+    parameter, include/exclude of the response model, another response class) are left
+    alone, see `can_serialize`.
+    """
+
+    def __init__(self, registry: ModuleRegistry, default_mode: str = JSON_MODE):
+        self.default_mode = default_mode
+        self.routes = 0
+        registry.add_route_layer(self._wrap_route)
+
+    def _wrap_route(self, record: ModuleRecord, route):
+        if json_mode(record.manifest, self.default_mode) != 'fast' or not can_serialize(route):
+            return
+        if hasattr(route.dependant.call, '__serialized__'):
+            return
+        # FastAPI reads the endpoint from the dependant on every request
+        route.dependant.call = _serialized(route.dependant.call, RouteSerializer(route))
+        self.routes += 1
@@ -0,0 +1,265 @@
+# Standard library imports
+import os
+import signal
+import threading
+import time
+from collections.abc import Mapping
+
+# Third-party imports
+from dotenv import dotenv_values
+
+# Local application imports
+from app.base.logger import logger as _logger
+from app.base.module_index import ADDONS_PATH
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Namespace of the settings in app/base/config
+BASE_NAMESPACE = 'base'
+BASE_CONFIG_DIR = os.path.join(ROOT_DIR, 'config')
+# Files read from the config directory of each namespace, the later ones override the earlier
+SETTINGS_FILES = ('.config.env', '.secrets.env')
+SECRETS_FILE = '.secrets.env'
+# Seconds between two checks of the settings files for changes, 0 only reloads on SIGHUP
+SETTINGS_WATCH_INTERVAL = float(os.environ.get("SETTINGS_WATCH_INTERVAL", 0))
+
+_TRUE = ("1", "true", "yes", "on")
+_FALSE = ("0", "false", "no", "off", "")
+
+
+def _stat_key(path: str):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class AddonSettings(Mapping):
+    """
+    The settings of one namespace (an addon, or `base`), read only. Values are the strings
+    of the env files; the typed getters parse a key once and keep the result, the object
+    is replaced as a whole when its files change so nothing is ever stale:
+
+        timeout = settings.get_float('TIMEOUT', 5.0)
+
+    `model` validates every setting into a pydantic model, field names match the keys
+    without regard to case.
+
+    Args:
+        namespace (str): Technical name of the addon.
+        values (dict): Key to string value.
+        secrets: Keys read from `.secrets.env`, hidden from `repr`.
+    """
+
+    def __init__(self, namespace: str, values: dict, secrets=frozenset()):
+        self.namespace = namespace
+        self._values = values
+        self._secrets = frozenset(secrets)
+        self._parsed = {}
+
+    def __getitem__(self, key: str) -> str:
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        values = {key: '***' if key in self._secrets else value for key, value in self._values.items()}
+        return f"AddonSettings({self.namespace!r}, {values})"
+
+    def _typed(self, key: str, parse, default):
+        cache_key = (key, parse)
+        try:
+            return self._parsed[cache_key]
+        except KeyError:
+            pass
+        value = self._values.get(key)
+        result = default if value is None else parse(value)
+        self._parsed[cache_key] = result
+        return result
+
+    def get_int(self, key: str, default: int = None) -> int:
+        return self._typed(key, int, default)
+
+    def get_float(self, key: str, default: float = None) -> float:
+        return self._typed(key, float, default)
+
+    def get_bool(self, key: str, default: bool = None) -> bool:
+        return self._typed(key, _parse_bool, default)
+
+    def get_list(self, key: str, default: tuple = ()) -> tuple:
+        """ A comma separated value as a tuple of stripped, non empty items. """
+        return self._typed(key, _parse_list, default)
+
+    def model(self, model):
+        """
+        The settings validated into the pydantic `model`, built once per version of the files.
+
+        Raises:
+            pydantic.ValidationError: When a setting doesn't fit the model.
+        """
+        cache_key = ('model', model)
+        result = self._parsed.get(cache_key)
+        if result is None:
+            lowered = {key.lower(): value for key, value in self._values.items()}
+            result = self._parsed[cache_key] = model.model_validate(lowered)
+        return result
+
+
+def _parse_bool(value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered in _TRUE:
+        return True
+    if lowered in _FALSE:
+        return False
+    raise ValueError(f"Not a boolean: {value!r}")
+
+
+def _parse_list(value: str) -> tuple:
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+class SettingsStore:
+    """
+    The settings of every addon, from the `config/.config.env` and `config/.secrets.env`
+    files of the addon, and of the app from app/base/config.
+
+    `load` scans the addons directory once. `reload` only stats the known files (and lists
+    the addons directory for new config directories) and re-parses the namespaces whose
+    files changed; the other namespaces keep their objects and parsed values. A reload is
+    requested by SIGHUP, `request_reload` or, with a watch `interval`, by the first lookup
+    after the interval; it runs on the next lookup, so the signal handler does no I/O.
+    A lookup is otherwise a dict access.
+    """
+
+    def __init__(self, addons_path: str = ADDONS_PATH, base_dir: str = BASE_CONFIG_DIR,
+                 interval: float = SETTINGS_WATCH_INTERVAL):
+        self.addons_path = addons_path
+        self.base_dir = base_dir
+        self.interval = interval
+        self.namespaces = {}
+        self.reloads = 0
+        self._signatures = {}
+        self._reload_requested = False
+        self._next_check = float('inf')
+        self._lock = threading.Lock()
+
+    def _config_dirs(self) -> dict:
+        dirs = {BASE_NAMESPACE: self.base_dir}
+        try:
+            entries = list(os.scandir(self.addons_path))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            config_dir = os.path.join(entry.path, 'config')
+            if entry.is_dir() and not entry.name.startswith(('.', '_')) and os.path.isdir(config_dir):
+                dirs[entry.name] = config_dir
+        return dirs
+
+    def _read(self, namespace: str, config_dir: str) -> AddonSettings:
+        values, secrets = {}, set()
+        for name in SETTINGS_FILES:
+            path = os.path.join(config_dir, name)
+            if not os.path.isfile(path):
+                continue
+            try:
+                parsed = {key: value for key, value in dotenv_values(path).items() if value is not None}
+            except (OSError, UnicodeDecodeError) as e:
+                _logger.error(f"Unreadable settings file {path}: {e}")
+                continue
+            values.update(parsed)
+            if name == SECRETS_FILE:
+                secrets.update(parsed)
+        return AddonSettings(namespace, values, secrets)
+
+    def _signature(self, config_dir: str) -> tuple:
+        return tuple(_stat_key(os.path.join(config_dir, name)) for name in SETTINGS_FILES)
+
+    def load(self) -> dict:
+        """ Read the settings of every namespace. """
+        with self._lock:
+            self._signatures = {}
+            self.namespaces = self._refresh({})
+        return self.namespaces
+
+    def reload(self) -> list:
+        """
+        Re-read the namespaces whose files changed, appeared or were removed.
+
+        Returns:
+            list: The names of the namespaces that changed.
+        """
+        with self._lock:
+            previous = self.namespaces
+            self.namespaces = self._refresh(previous)
+            self.reloads += 1
+        changed = [name for name in self.namespaces.keys() | previous.keys()
+                   if self.namespaces.get(name) is not previous.get(name)]
+        if changed:
+            _logger.info(f"Reloaded the settings of {', '.join(sorted(changed))}")
+        return changed
+
+    def _refresh(self, previous: dict) -> dict:
+        namespaces = {}
+        signatures = {}
+        for namespace, config_dir in self._config_dirs().items():
+            signature = signatures[namespace] = self._signature(config_dir)
+            if namespace in previous and self._signatures.get(namespace) == signature:
+                namespaces[namespace] = previous[namespace]
+            else:
+                namespaces[namespace] = self._read(namespace, config_dir)
+        self._signatures = signatures
+        self._reload_requested = False
+        self._next_check = time.monotonic() + self.interval if self.interval > 0 else float('inf')
+        return namespaces
+
+    def request_reload(self, *args):
+        """ Reload on the next lookup, also the SIGHUP handler. """
+        self._reload_requested = True
+
+    def install_signal_handler(self) -> bool:
+        """
+        Reload the settings on SIGHUP. Only possible from the main thread.
+
+        Under gunicorn the signal goes to the worker PIDs: the master restarts its workers on
+        SIGHUP, and every worker installs the handler again from the post_worker_init hook
+        of gunicorn.conf.py since the worker class resets the signals it inherits.
+        """
+        if not hasattr(signal, 'SIGHUP') or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signal.SIGHUP, self.request_reload)
+        return True
+
+    def get(self, namespace: str) -> AddonSettings:
+        """ The current settings of `namespace`, empty when it has no config files. """
+        if self._reload_requested or time.monotonic() >= self._next_check:
+            self.reload()
+        settings = self.namespaces.get(namespace)
+        if settings is None:
+            settings = AddonSettings(namespace, {})
+        return settings
+
+    def dependency(self, namespace: str, model=None):
+        """
+        A FastAPI dependency returning the current settings of `namespace`, or the settings
+        validated into `model`:
+
+            @router.get("/items")
+            async def items(settings: AddonSettings = Depends(settings.dependency('template_module'))): ...
+        """
+        # Async, a dict lookup doesn't need the threadpool (a pending reload only stats files)
+        if model is None:
+            async def addon_settings() -> AddonSettings:
+                return self.get(namespace)
+        else:
+            async def addon_settings():
+                return self.get(namespace).model(model)
+        addon_settings.__name__ = f"{namespace}_settings"
+        return addon_settings
+
+
+settings = SettingsStore()
@@ -0,0 +1,223 @@
+# Standard library imports
+import asyncio
+import os
+from urllib.parse import parse_qsl
+
+# Third-party imports
+from fastapi.routing import APIRoute
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Local application imports
+from app.base.logger import logger as _logger
+from app.base.response_cache import private_response
+from app.base.routing_utils.registry import ModuleRecord, ModuleRegistry
+
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+# Responses larger than this are not shared, the waiting requests run the handler themselves
+SINGLE_FLIGHT_MAX_BYTES = int(os.environ.get("SINGLE_FLIGHT_MAX_BYTES", 8 * 1024 * 1024))
+
+
+class SingleFlightPolicy:
+    """
+    How concurrent identical requests to one route are coalesced.
+
+    Args:
+        timeout (float): Seconds a request waits for the execution it joined before
+            running the handler itself.
+        vary_headers: Request headers that must be equal for two requests to be identical.
+    """
+
+    def __init__(self, timeout: float = 10, vary_headers=()):
+        self.timeout = float(timeout)
+        self.vary_headers = tuple(header.lower() for header in vary_headers)
+
+    @classmethod
+    def from_config(cls, config) -> "SingleFlightPolicy":
+        if isinstance(config, SingleFlightPolicy):
+            return config
+        if config is True:
+            return cls()
+        return cls(**config)
+
+
+def single_flight(timeout: float = 10, vary_headers=()):
+    """
+    Let concurrent identical GET requests of an addon route share one execution:
+
+        @router.get("/report")
+        @single_flight(timeout=5)
+        async def report(): ...
+    """
+    policy = SingleFlightPolicy(timeout, vary_headers)
+
+    def decorator(endpoint):
+        endpoint.__single_flight__ = policy
+        return endpoint
+
+    return decorator
+
+
+def policy_for(manifest: dict, route) -> SingleFlightPolicy:
+    """
+    The single-flight policy of a route: the `single_flight` decorator of its endpoint, else
+    the `single_flight` section of the addon manifest, either True for every GET route or
+    an entry per route name or path, e.g.
+
+        'single_flight': {'route1': {'timeout': 5, 'vary_headers': ['accept-language']}}
+    """
+    policy = getattr(route.endpoint, '__single_flight__', None)
+    if policy is not None:
+        return policy
+    config = manifest.get('single_flight')
+    if config is True:
+        return SingleFlightPolicy()
+    for key in (route.name, route.path):
+        if config and key in config:
+            return SingleFlightPolicy.from_config(config[key])
+    return None
+
+
+class FlightStats:
+    __slots__ = ('leaders', 'coalesced', 'timeouts', 'errors')
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _Flight:
+    __slots__ = ('future', 'waiters')
+
+    def __init__(self, loop):
+        self.future = loop.create_future()
+        self.waiters = 0
+
+
+class SingleFlightApp:
+    """
+    Wraps the ASGI app of a coalesced route.
+
+    The first GET/HEAD request for a key runs the route and records the ASGI messages it
+    sends. Identical requests arriving meanwhile wait for it and replay those messages, or
+    get the same exception when it failed. Requests with credentials (Authorization or
+    Cookie) run alone unless the policy varies on that header, and a response setting a
+    cookie or marked private/no-store is not replayed: the waiters run the route themselves.
+    """
+
+    def __init__(self, app: ASGIApp, policy: SingleFlightPolicy, stats: FlightStats):
+        self.app = app
+        self.policy = policy
+        self.stats = stats
+        self.flights = {}
+
+    def flight_key(self, scope: Scope, headers: Headers) -> tuple:
+        query = tuple(sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)))
+        return (scope["method"], scope["path"], query) + tuple(headers.get(name) for name in self.policy.vary_headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        headers = Headers(scope=scope)
+        credentials = ("authorization", "cookie")
+        if scope["method"] not in ("GET", "HEAD") or any(
+                name in headers and name not in self.policy.vary_headers for name in credentials):
+            # Requests of different users are never merged unless keyed on the credentials
+            await self.app(scope, receive, send)
+            return
+
+        key = self.flight_key(scope, headers)
+        flight = self.flights.get(key)
+        if flight is not None:
+            await self.join(flight, scope, receive, send)
+        else:
+            await self.lead(key, scope, receive, send)
+
+    async def join(self, flight: _Flight, scope: Scope, receive: Receive, send: Send):
+        self.stats.coalesced += 1
+        flight.waiters += 1
+        try:
+            messages = await asyncio.wait_for(asyncio.shield(flight.future), self.policy.timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            await self.app(scope, receive, send)
+            return
+        finally:
+            flight.waiters -= 1
+        if messages is None:
+            # The leader was cancelled or its response was private or too large to share
+            await self.app(scope, receive, send)
+            return
+        for message in messages:
+            await send(message)
+
+    async def lead(self, key: tuple, scope: Scope, receive: Receive, send: Send):
+        flight = self.flights[key] = _Flight(asyncio.get_running_loop())
+        self.stats.leaders += 1
+        messages = []
+        size = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal messages, size
+            if messages is not None:
+                size += len(message.get("body", b""))
+                if size > SINGLE_FLIGHT_MAX_BYTES:
+                    messages = None
+                elif message["type"] == "http.response.start" and private_response(Headers(raw=message["headers"])):
+                    # Never replay a cookie or a private response to another client
+                    messages = None
+                elif "headers" in message:
+                    # Middlewares above may edit the headers of the message in place
+                    messages.append({**message, "headers": list(message["headers"])})
+                else:
+                    messages.append(dict(message))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except asyncio.CancelledError:
+            flight.future.set_result(None)
+            raise
+        except Exception as e:
+            self.stats.errors += 1
+            if flight.waiters:
+                _logger.warning(f"Single-flight request {scope['path']} failed for {flight.waiters} waiting requests: {e}")
+            flight.future.set_exception(e)
+            # Mark the exception as retrieved, there may be nobody waiting for it
+            flight.future.exception()
+            raise
+        else:
+            flight.future.set_result(messages)
+        finally:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+
+class SingleFlight:
+    """
+    Request coalescing of addon routes, installed as a route layer of the module registry.
+
+    Only routes with a policy are wrapped. Installed after the response cache, it sits in
+    front of it, so a burst of misses for the same key fills the cache once.
+    """
+
+    def __init__(self, registry: ModuleRegistry):
+        self.stats = {}
+        registry.add_route_layer(self._wrap_route)
+
+    def _wrap_route(self, record: ModuleRecord, route):
+        if not isinstance(route, APIRoute) or not ({"GET", "HEAD"} & set(route.methods or ())):
+            return
+        policy = policy_for(record.manifest, route)
+        if policy is not None:
+            stats = self.stats.setdefault((record.technical_name, route.path), FlightStats())
+            route.app = SingleFlightApp(route.app, policy, stats)
+
+    def stats_by_route(self) -> list:
+        return [
+            {'module': technical_name, 'path': path, **stats.as_dict()}
+            for (technical_name, path), stats in sorted(self.stats.items())
+        ]
@@ -0,0 +1,165 @@
+# Standard library imports
+import importlib.abc
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Set STARTUP_PROFILE=true to time every import and startup phase of a worker, the
+# report goes to the log and to STARTUP_PROFILE_PATH
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE", "false").lower() in ("1", "true", "yes", "on")
+STARTUP_PROFILE_PATH = os.environ.get(
+    "STARTUP_PROFILE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'startup_profile.json'))
+# Number of modules listed in the logged summary
+STARTUP_PROFILE_TOP = int(os.environ.get("STARTUP_PROFILE_TOP", 15))
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """ Delegates to the real loader and times `exec_module`. """
+
+    def __init__(self, loader, profile):
+        self.loader = loader
+        self.profile = profile
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.profile._enter()
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profile._leave(module.__name__, time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+class StartupProfile(importlib.abc.MetaPathFinder):
+    """
+    Import-time and startup-phase breakdown of a worker.
+
+    While started it sits first on `sys.meta_path` and wraps the loader of every module
+    imported from then on, recording its cumulative and self time like `python -X importtime`
+    but from inside the process, so it also works under gunicorn and uvicorn. `phase` times
+    named steps of the app setup and `request_served` records the time to the first request.
+    Outside STARTUP_PROFILE it does nothing.
+    """
+
+    def __init__(self, enabled: bool = STARTUP_PROFILE, path: str = STARTUP_PROFILE_PATH):
+        self.enabled = enabled
+        self.path = path
+        self.started = None
+        self.imports = {}
+        self.phases = {}
+        self.addons = {}
+        self.first_request_ms = None
+        # Addon files are imported from several threads, each needs its own stack
+        self._local = threading.local()
+
+    def start(self):
+        if not self.enabled or self.started is not None:
+            return
+        self.started = time.perf_counter()
+        sys.meta_path.insert(0, self)
+
+    def stop(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self):
+        self._stack().append(0.0)
+
+    def _leave(self, name: str, elapsed: float):
+        stack = self._stack()
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        self.imports[name] = (elapsed, elapsed - children)
+
+    @contextmanager
+    def phase(self, name: str):
+        """ Time one named startup step. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.phases[name] = round((time.perf_counter() - start) * 1000, 3)
+
+    def request_served(self):
+        """ Record the time from the start of the profile to the first answered request. """
+        if self.enabled and self.first_request_ms is None and self.started is not None:
+            self.first_request_ms = round((time.perf_counter() - self.started) * 1000, 3)
+            self.write()
+
+    def report(self) -> dict:
+        packages = {}
+        for name, (_, own) in self.imports.items():
+            top = name.partition('.')[0]
+            packages[top] = packages.get(top, 0.0) + own
+        return {
+            'pid': os.getpid(),
+            'first_request_ms': self.first_request_ms,
+            'phases_ms': self.phases,
+            'addons': self.addons,
+            'packages_ms': {name: round(total * 1000, 3)
+                            for name, total in sorted(packages.items(), key=lambda item: -item[1])},
+            'imports_ms': {name: {'cumulative': round(total * 1000, 3), 'self': round(own * 1000, 3)}
+                           for name, (total, own) in sorted(self.imports.items(), key=lambda item: -item[1][0])},
+        }
+
+    def write(self):
+        """ Log a summary and write the full report as JSON. """
+        if not self.enabled:
+            return
+        from app.base.logger import logger as _logger
+
+        report = self.report()
+        top = list(report['imports_ms'].items())[:STARTUP_PROFILE_TOP]
+        _logger.info(
+            f"Startup profile: first request after {report['first_request_ms']} ms, phases {report['phases_ms']}, "
+            f"slowest imports: " + ", ".join(f"{name} {times['cumulative']:.1f} ms" for name, times in top)
+        )
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'w') as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            _logger.warning(f"Could not write startup profile {self.path}: {e}")
+
+
+class StartupProfileMiddleware:
+    """ Tells the startup profile about the first request, only installed with STARTUP_PROFILE. """
+
+    def __init__(self, app, profile: StartupProfile):
+        self.app = app
+        self.profile = profile
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+        if scope["type"] == "http" and self.profile.first_request_ms is None:
+            self.profile.request_served()
+
+
+startup_profile = StartupProfile()
@@ -0,0 +1,91 @@
+# Standard library imports
+import threading
+
+# Third-party imports
+from fastapi import FastAPI
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html, get_swagger_ui_oauth2_redirect_html
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+# Local application imports
+from app.base.compression import PrecompressedBody
+
+HTML = "text/html; charset=utf-8"
+
+
+class StaticPage:
+    """
+    A page whose content only depends on the root path the app is mounted at. It is
+    rendered and compressed once per root path, the one without a prefix at startup, and
+    then served from memory with its ETag, see PrecompressedBody.
+
+    Args:
+        render: `render(root_path)` returns the page as a str or bytes.
+        media_type (str): Content type of the page.
+    """
+
+    def __init__(self, render, media_type: str = HTML):
+        self.render = render
+        self.media_type = media_type
+        self._bodies = {}
+        self._lock = threading.Lock()
+        self.body("")
+
+    def body(self, root_path: str) -> PrecompressedBody:
+        body = self._bodies.get(root_path)
+        if body is None:
+            content = self.render(root_path)
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            body = PrecompressedBody(content, self.media_type)
+            with self._lock:
+                body = self._bodies.setdefault(root_path, body)
+        return body
+
+    def response(self, request: Request) -> Response:
+        return self.body(request.scope.get("root_path", "").rstrip("/")).response(request)
+
+    async def endpoint(self, request: Request) -> Response:
+        return self.response(request)
+
+
+class DocsPages:
+    """
+    Serves the Swagger UI and ReDoc pages of the app as static pages, FastAPI renders them
+    again on every request. The HTML is the same as FastAPI's, built from the settings
+    of the app.
+    """
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+        self.pages = {}
+        if app.openapi_url and app.docs_url:
+            self.pages[app.docs_url] = StaticPage(self._swagger_ui)
+            if app.swagger_ui_oauth2_redirect_url:
+                self.pages[app.swagger_ui_oauth2_redirect_url] = StaticPage(
+                    lambda root_path: get_swagger_ui_oauth2_redirect_html().body)
+        if app.openapi_url and app.redoc_url:
+            self.pages[app.redoc_url] = StaticPage(self._redoc)
+
+    def _swagger_ui(self, root_path: str) -> bytes:
+        app = self.app
+        oauth2_redirect_url = app.swagger_ui_oauth2_redirect_url
+        return get_swagger_ui_html(
+            openapi_url=root_path + app.openapi_url,
+            title=f"{app.title} - Swagger UI",
+            oauth2_redirect_url=root_path + oauth2_redirect_url if oauth2_redirect_url else None,
+            init_oauth=app.swagger_ui_init_oauth,
+            swagger_ui_parameters=app.swagger_ui_parameters,
+        ).body
+
+    def _redoc(self, root_path: str) -> bytes:
+        return get_redoc_html(openapi_url=root_path + self.app.openapi_url, title=f"{self.app.title} - ReDoc").body
+
+    def install(self):
+        """ Replace the routes FastAPI added for the docs pages by the static ones, in place. """
+        self.app.router.routes = [
+            Route(route.path, self.pages[route.path].endpoint, include_in_schema=False)
+            if getattr(route, 'path', None) in self.pages else route
+            for route in self.app.router.routes
+        ]
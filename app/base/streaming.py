@@ -0,0 +1,189 @@
+# Standard library imports
+import csv
+import io
+import os
+from typing import AsyncIterator
+
+# Third-party imports
+import anyio
+from pydantic import BaseModel
+from sqlalchemy.engine import Row
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+
+# Local application imports
+from app.base import db
+from app.base.logger import logger as _logger
+from app.base.serialization import dumps
+
+# Rows fetched from the database cursor, encoded and sent at a time
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", 1000))
+
+
+def _single_entity(statement) -> bool:
+    # Only a whole entity is unwrapped from its row, one column stays a named row
+    descriptions = getattr(statement, 'column_descriptions', None)
+    if descriptions is None or len(descriptions) != 1:
+        return False
+    entity = descriptions[0].get('entity')
+    return entity is not None and descriptions[0]['expr'] is entity
+
+
+async def stream_query(statement, batch_size: int = STREAM_BATCH_SIZE, session=None) -> AsyncIterator[list]:
+    """
+    Run `statement` on a server-side cursor and yield its rows in lists of at most
+    `batch_size`, so only one batch is in memory whatever the size of the result. A
+    statement selecting one entity yields the objects, others (one column included) yield
+    rows.
+
+    The next batch is only fetched once the previous one was consumed, the response
+    stream waits for the client to take each chunk. When the consumer stops early (the
+    client disconnected and the response was cancelled) the cursor is closed and the
+    transaction rolled back, ending the query.
+
+    Args:
+        session: An AsyncSession or Session kept open by the caller until the stream ends.
+            By default the stream opens and closes its own AsyncSession: the sessions of
+            the request dependencies are closed before a streamed body is sent.
+    """
+    statement = statement.execution_options(yield_per=batch_size)
+    if session is None:
+        async with db.async_session() as own_session:
+            async for batch in _stream_async(own_session, statement, batch_size):
+                yield batch
+    elif isinstance(session, Session):
+        async for batch in _stream_sync(session, statement, batch_size):
+            yield batch
+    else:
+        async for batch in _stream_async(session, statement, batch_size):
+            yield batch
+
+
+async def _stream_async(session, statement, batch_size: int) -> AsyncIterator[list]:
+    result = await session.stream(statement)
+    if _single_entity(statement):
+        result = result.scalars()
+    try:
+        async for batch in result.partitions(batch_size):
+            yield batch
+    finally:
+        # Also runs when the stream is cancelled, the cursor must be closed all the same
+        with anyio.CancelScope(shield=True):
+            await result.close()
+            if session.in_transaction():
+                await session.rollback()
+
+
+async def _stream_sync(session: Session, statement, batch_size: int) -> AsyncIterator[list]:
+    def execute():
+        result = session.execute(statement)
+        return result.scalars() if _single_entity(statement) else result
+
+    result = await run_in_threadpool(execute)
+    partitions = result.partitions(batch_size)
+    try:
+        while True:
+            batch = await run_in_threadpool(next, partitions, None)
+            if batch is None:
+                return
+            yield batch
+    finally:
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(result.close)
+
+
+def _row_dict(row) -> dict:
+    if isinstance(row, BaseModel):
+        return row.model_dump(mode='json')
+    if isinstance(row, Row):
+        return row._asdict()
+    if isinstance(row, dict):
+        return row
+    raise TypeError(f"Rows of type {type(row).__name__} can't be streamed")
+
+
+def _row_json(row) -> bytes:
+    if isinstance(row, BaseModel):
+        # One pass through pydantic's serializer, no intermediate dict
+        return row.__pydantic_serializer__.to_json(row)
+    return dumps(_row_dict(row))
+
+
+async def ndjson_chunks(batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """ One chunk of newline delimited JSON per batch of rows. """
+    async for batch in batches:
+        if batch:
+            yield b"\n".join(_row_json(row) for row in batch) + b"\n"
+
+
+def _columns(row) -> list:
+    if isinstance(row, BaseModel):
+        return list(type(row).model_fields)
+    if isinstance(row, Row):
+        return list(row._fields)
+    return list(_row_dict(row))
+
+
+async def csv_chunks(batches: AsyncIterator[list], columns: list = None) -> AsyncIterator[bytes]:
+    """
+    One chunk of CSV per batch of rows, after a header line. Without `columns` the header
+    is made of the fields of the first row.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    async for batch in batches:
+        if not batch:
+            continue
+        if columns is None:
+            columns = _columns(batch[0])
+            writer.writerow(columns)
+        for row in batch:
+            if isinstance(row, BaseModel):
+                writer.writerow([getattr(row, column, None) for column in columns])
+            else:
+                values = _row_dict(row)
+                writer.writerow([values.get(column) for column in columns])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+async def _logged(chunks: AsyncIterator[bytes], description: str) -> AsyncIterator[bytes]:
+    sent = 0
+    try:
+        async for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    except anyio.get_cancelled_exc_class():
+        _logger.info(f"Stream of {description} cancelled after {sent} bytes, the client went away")
+        raise
+
+
+def ndjson_response(statement, batch_size: int = STREAM_BATCH_SIZE, session=None, headers: dict = None) -> StreamingResponse:
+    """
+    Stream the rows of `statement` as newline delimited JSON (application/x-ndjson), see
+    `stream_query`:
+
+        @router.get("/export")
+        async def export():
+            return ndjson_response(select(Item).order_by(Item.id))
+    """
+    chunks = ndjson_chunks(stream_query(statement, batch_size, session))
+    return StreamingResponse(_logged(chunks, "NDJSON rows"), media_type="application/x-ndjson", headers=headers)
+
+
+def csv_response(statement, columns: list = None, filename: str = None, batch_size: int = STREAM_BATCH_SIZE,
+                 session=None, headers: dict = None) -> StreamingResponse:
+    """
+    Stream the rows of `statement` as CSV with a header line, see `stream_query`.
+
+    Args:
+        columns (list): Columns to write, in order. Defaults to every field of the rows.
+        filename (str): Sent as an attachment with this name when given.
+    """
+    headers = dict(headers or {})
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    chunks = csv_chunks(stream_query(statement, batch_size, session), columns)
+    return StreamingResponse(_logged(chunks, "CSV rows"), media_type="text/csv; charset=utf-8", headers=headers)
@@ -0,0 +1,25 @@
+from app.base.routing_utils.loader import resolve_load_order
+
+
+def test_load_order_levels():
+    levels, errors = resolve_load_order({
+        'sale': {'depends': ['product', 'partner']},
+        'product': {'depends': []},
+        'partner': {'depends': []},
+        'report': {'depends': ['sale']},
+    })
+    assert levels == [['partner', 'product'], ['sale'], ['report']]
+    assert errors == {}
+
+
+def test_load_order_reports_missing_and_cycles():
+    levels, errors = resolve_load_order({
+        'ok': {'depends': []},
+        'missing': {'depends': ['nowhere']},
+        'child': {'depends': ['missing']},
+        'a': {'depends': ['b']},
+        'b': {'depends': ['a']},
+    })
+    assert levels == [['ok']]
+    assert set(errors) == {'missing', 'child', 'a', 'b'}
+    assert 'cycle' in errors['a']
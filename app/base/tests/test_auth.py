@@ -0,0 +1,82 @@
+import json
+import time
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.base.auth import auth, passwords
+from app.base.auth.tokens import RevocationList, TokenError, TokenService, TokenSigner, VerifiedTokenCache
+
+
+def test_signer_rejects_tampered_expired_and_foreign_tokens():
+    signer = TokenSigner(b"secret")
+    token = signer.encode({"sub": "alice", "exp": time.time() + 60})
+    assert signer.decode(token)["sub"] == "alice"
+
+    header, payload, signature = token.split(".")
+    forged = signer.encode({"sub": "mallory", "exp": time.time() + 60}).split(".")[1]
+    for bad in (f"{header}.{forged}.{signature}", TokenSigner(b"other").encode({"exp": time.time() + 60}),
+                f"eyJhbGciOiJub25lIn0.{payload}.", "not-a-token", f"{header}.{payload}.{signature[:-1]}é"):
+        with pytest.raises(TokenError):
+            signer.decode(bad)
+    with pytest.raises(TokenError, match="expired"):
+        signer.decode(signer.encode({"exp": time.time() - 1}))
+
+
+def test_cache_and_revocation_shared_between_workers(tmp_path):
+    path = str(tmp_path / "revoked.json")
+    first = TokenService(b"secret", revocations=RevocationList(path, interval=0))
+    second = TokenService(b"secret", revocations=RevocationList(path, interval=0))
+    token, claims = first.issue("alice")
+
+    assert second.verify(token)["jti"] == claims["jti"]
+    assert second.verify(token)["jti"] == claims["jti"]
+    assert second.cache.stats()["hits"] == 1
+
+    first.revoke(claims)
+    for service in (first, second):
+        with pytest.raises(TokenError, match="revoked"):
+            service.verify(token)
+
+
+def test_cache_is_bounded_and_never_outlives_the_token():
+    cache = VerifiedTokenCache(max_size=2, ttl=60)
+    now = time.time()
+    cache.put("a", {"exp": now + 100}, now)
+    cache.put("b", {"exp": now + 5}, now)
+    cache.get("a", now)
+    cache.put("c", {"exp": now + 100}, now)
+    assert cache.get("b", now) is None
+    assert cache.get("a", now) is not None
+    assert cache.get("c", now + 61) is None
+
+
+def test_login_and_protected_route(tmp_path, monkeypatch):
+    monkeypatch.setattr(passwords, "AUTH_SCRYPT_N", 2 ** 10)
+    users_path = tmp_path / "users.json"
+    users_path.write_text(json.dumps({"alice": {"password_hash": passwords.hash_password("pw"), "scopes": ["read"]}}))
+    monkeypatch.setattr(auth, "users", passwords.UserStore(str(users_path)))
+    monkeypatch.setattr(auth, "token_service", TokenService(b"secret", revocations=RevocationList(None)))
+
+    protected = APIRouter(prefix="/private", dependencies=[auth.require_token])
+
+    @protected.get("/me")
+    async def me(request: auth.Request):
+        return request.state.token
+
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/auth")
+    app.include_router(protected)
+    client = TestClient(app)
+
+    login = {"hostname": "host", "username": "alice"}
+    assert client.post("/auth/login", json={**login, "password": "wrong"}).status_code == 401
+    assert client.post("/auth/login", json={**login, "username": "bob", "password": "pw"}).status_code == 401
+    token = client.post("/auth/login", json={**login, "password": "pw"}).json()["access_token"]
+
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/private/me").status_code == 401
+    assert client.get("/private/me", headers=headers).json()["scopes"] == ["read"]
+    assert client.post("/auth/logout", headers=headers).status_code == 200
+    assert client.get("/private/me", headers=headers).status_code == 401
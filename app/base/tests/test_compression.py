@@ -0,0 +1,100 @@
+import gzip
+import json
+import zlib
+
+import brotli
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.base.middleware.compression import CompressionMiddleware
+from app.base.static_pages import DocsPages
+
+ITEMS = [{"id": i, "name": f"item {i}"} for i in range(200)]
+
+
+def make_app():
+    app = FastAPI(docs_url="/docs/")
+
+    @app.get("/items")
+    async def items():
+        return ITEMS
+
+    @app.get("/small")
+    async def small():
+        return {"id": 1}
+
+    @app.get("/binary")
+    async def binary():
+        return Response(b"x" * 4096, media_type="application/octet-stream")
+
+    @app.get("/tagged")
+    async def tagged():
+        return PlainTextResponse("y" * 4096, headers={"ETag": '"abc"'})
+
+    @app.get("/stream")
+    async def stream():
+        async def lines():
+            for item in ITEMS:
+                yield f'{item["id"]},{item["name"]}\n'
+        return StreamingResponse(lines(), media_type="text/csv")
+
+    app.add_middleware(CompressionMiddleware, min_size=500)
+    return app
+
+
+def test_compresses_allowed_types_over_threshold():
+    client = TestClient(make_app())
+    response = client.get("/items", headers={"accept-encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(response.content) // 4
+    assert response.json() == ITEMS
+
+    assert "content-encoding" not in client.get("/small", headers={"accept-encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/binary", headers={"accept-encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/items", headers={"accept-encoding": "identity"}).headers
+
+    tagged = client.get("/tagged", headers={"accept-encoding": "gzip"})
+    assert tagged.headers["etag"] == 'W/"abc"' and tagged.text == "y" * 4096
+
+
+def test_streamed_body_is_compressed_per_chunk():
+    client = TestClient(make_app())
+    with client.stream("GET", "/stream", headers={"accept-encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        raw = b"".join(response.iter_raw())
+    assert gzip.decompress(raw).decode().splitlines()[-1] == "199,item 199"
+    # Every chunk was flushed: the first line decodes from the start of the stream
+    assert zlib.decompressobj(31).decompress(raw[:40]).startswith(b"0,item 0\n")
+
+
+def test_docs_pages_served_from_memory():
+    reference = TestClient(make_app()).get("/docs/")
+    app = make_app()
+    DocsPages(app).install()
+    client = TestClient(app)
+
+    response = client.get("/docs/", headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200 and response.text == reference.text
+    assert response.headers["content-encoding"] == "gzip" and response.headers["etag"]
+    etag = response.headers["etag"]
+    assert client.get("/docs/", headers={"accept-encoding": "gzip", "if-none-match": etag}).status_code == 304
+    assert client.get("/docs/", headers={"accept-encoding": "identity", "if-none-match": etag}).status_code == 200
+    assert client.get("/redoc").status_code == 200
+
+
+def test_brotli_preferred_when_accepted():
+    client = TestClient(make_app())
+    with client.stream("GET", "/items", headers={"accept-encoding": "gzip, br"}) as response:
+        assert response.headers["content-encoding"] == "br"
+        raw = b"".join(response.iter_raw())
+    assert json.loads(brotli.decompress(raw)) == ITEMS
+
+    app = make_app()
+    DocsPages(app).install()
+    with TestClient(app).stream("GET", "/docs/", headers={"accept-encoding": "br"}) as response:
+        assert response.headers["content-encoding"] == "br" and response.headers["etag"].endswith('-br"')
+        raw = b"".join(response.iter_raw())
+    assert b"swagger-ui" in brotli.decompress(raw)
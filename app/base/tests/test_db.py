@@ -0,0 +1,49 @@
+import asyncio
+from typing import Optional
+
+import pytest
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlmodel import Field, SQLModel, select
+
+from app.base import db
+
+
+class DbTestItem(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+
+
+def test_async_session_against_sqlite(tmp_path, monkeypatch):
+    pytest.importorskip("aiosqlite")
+    monkeypatch.setattr(db, "DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    db.dispose_engines()
+    assert str(db.get_async_engine().url).startswith("sqlite+aiosqlite://")
+    asyncio.run(db.init_async_db())
+
+    app = FastAPI()
+
+    @app.post("/items")
+    async def create_item(name: str, session: db.AsyncSessionDep):
+        item = DbTestItem(name=name)
+        session.add(item)
+        await session.commit()
+        return item
+
+    # The way an addon gets a session through its `dependency` list
+    router = APIRouter(prefix="/addon")
+
+    @router.get("/items")
+    async def list_items(request: Request):
+        result = await request.state.db.exec(select(DbTestItem))
+        return [item.name for item in result.all()]
+
+    app.include_router(router, dependencies=[db.use_async_session])
+
+    client = TestClient(app)
+    assert client.post("/items", params={"name": "first"}).json()["name"] == "first"
+    assert client.get("/addon/items").json() == ["first"]
+
+    with db.Session(db.get_engine()) as session:
+        assert session.exec(select(DbTestItem)).one().name == "first"
+    db.dispose_engines()
@@ -0,0 +1,61 @@
+import os
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.base.routing_utils.routing import Routing
+
+MANIFEST = """{
+    'name': '%s',
+    'version': '1.0.0',
+    'description': 'Enable',
+    'depends': [],
+    'installable': True,
+}
+"""
+
+ROUTE = """
+from fastapi.routing import APIRouter
+
+router = APIRouter(prefix="/%(name)s")
+dependency = []
+
+@router.get("/%(path)s")
+async def %(name)s_%(path)s():
+    return {"path": "%(path)s"}
+"""
+
+
+def write_addon(addons_dir, name, path):
+    routes_dir = addons_dir / name / "routes"
+    routes_dir.mkdir(parents=True, exist_ok=True)
+    (addons_dir / name / "__manifest__.py").write_text(MANIFEST % name)
+    route_file = routes_dir / "route.py"
+    route_file.write_text(ROUTE % {'name': name, 'path': path})
+    # Make sure the change is seen even within the mtime resolution of the file system
+    os.utime(route_file, ns=(0, hash(path) & 0xFFFFFFFF))
+
+
+def test_enable_only_loads_named_module(tmp_path):
+    addons_dir = tmp_path / "addons"
+    write_addon(addons_dir, "first", "one")
+    app = FastAPI()
+    routing = Routing(str(addons_dir))
+    routing.index.index_path = str(tmp_path / "index.json")
+    routing.register_routes(app)
+    first_routes = list(routing.modules.get("first").routes)
+
+    write_addon(addons_dir, "second", "two")
+    result = routing.enable_module(app, "second")
+    assert result["added_routes"] == ["GET /second/two"]
+    assert routing.modules.get("first").routes == first_routes
+    assert len(app.router.routes) == len(FastAPI().router.routes) + 2
+
+    write_addon(addons_dir, "second", "three")
+    result = routing.enable_module(app, "second")
+    assert result["added_routes"] == ["GET /second/three"]
+    assert result["removed_routes"] == ["GET /second/two"]
+
+    client = TestClient(app)
+    assert client.get("/second/three").json() == {"path": "three"}
+    assert client.get("/second/two").status_code == 404
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.routing import NoMatchFound
+
+from app.base.routing_utils import routing as routing_module
+from app.base.routing_utils.lazy import LazyRoute
+from app.base.routing_utils.routing import Routing
+
+MANIFEST = """{
+    'name': 'Lazy Module',
+    'version': '1.0.0',
+    'description': 'Lazy',
+    'depends': [],
+    'installable': True,
+}
+"""
+
+ROUTE = """
+from fastapi.routing import APIRouter
+
+with open({log!r}, 'a') as f:
+    f.write('imported\\n')
+
+router = APIRouter(prefix="/lazy", tags=["Lazy"])
+dependency = []
+
+@router.get("/item/{{item_id}}")
+async def lazy_item(item_id: int):
+    return {{"item_id": item_id}}
+"""
+
+
+def make_routing(tmp_path):
+    addons_dir = tmp_path / "addons"
+    routes_dir = addons_dir / "lazy_module" / "routes"
+    routes_dir.mkdir(parents=True)
+    (addons_dir / "lazy_module" / "__manifest__.py").write_text(MANIFEST)
+    (routes_dir / "route.py").write_text(ROUTE.format(log=str(tmp_path / "imports.log")))
+    routing = Routing(str(addons_dir))
+    routing.index.index_path = str(tmp_path / "index.json")
+    return routing
+
+
+def import_count(tmp_path):
+    log = tmp_path / "imports.log"
+    return len(log.read_text().splitlines()) if log.exists() else 0
+
+
+def lazy_routing(tmp_path, monkeypatch):
+    monkeypatch.setattr(routing_module, "ADDONS_LOAD_MODE", "lazy")
+    app = FastAPI()
+    routing = Routing(str(tmp_path / "addons"))
+    routing.index.index_path = str(tmp_path / "index.json")
+    routing.register_routes(app)
+    return app, routing
+
+
+def test_lazy_mode_imports_on_first_hit(tmp_path, monkeypatch):
+    # First start is eager and records the route stub in the index
+    make_routing(tmp_path).register_routes(FastAPI())
+    assert import_count(tmp_path) == 1
+
+    app, routing = lazy_routing(tmp_path, monkeypatch)
+    assert import_count(tmp_path) == 1
+    assert any(isinstance(route, LazyRoute) for route in app.router.routes)
+    assert len(routing.modules.get("lazy_module").routes) == 1
+
+    client = TestClient(app)
+    responses = []
+    threads = [
+        threading.Thread(target=lambda: responses.append(client.get("/lazy/item/3")))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [r.json() for r in responses] == [{"item_id": 3}] * 5
+    assert import_count(tmp_path) == 2
+    assert not any(isinstance(route, LazyRoute) for route in app.router.routes)
+    assert not any(isinstance(route, LazyRoute) for route in routing.modules.get("lazy_module").routes)
+    assert client.post("/lazy/item/3").status_code == 405
+
+
+def test_lazy_module_without_router(tmp_path, monkeypatch):
+    make_routing(tmp_path).register_routes(FastAPI())
+    app, routing = lazy_routing(tmp_path, monkeypatch)
+    with pytest.raises(NoMatchFound):
+        app.url_path_for("lazy_item", item_id=3)
+
+    # The file no longer defines a router when it is finally imported
+    monkeypatch.setattr(routing, "build_routes", lambda *args: None)
+    client = TestClient(app)
+    assert client.get("/lazy/item/3").status_code == 404
+    assert not any(isinstance(route, LazyRoute) for route in app.router.routes)
+    assert client.get("/lazy/item/3").status_code == 404
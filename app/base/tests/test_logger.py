@@ -0,0 +1,23 @@
+import json
+import logging
+import queue
+
+from app.base.logger import JSONFormatter, NonBlockingQueueHandler
+
+
+def test_queue_handler_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=2))
+    log = logging.getLogger("test.queue")
+    for i in range(5):
+        handler.handle(log.makeRecord(log.name, logging.INFO, __file__, 0, "message %s", (i,), None))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_json_formatter_keeps_request_fields():
+    log = logging.getLogger("test.json")
+    record = log.makeRecord(log.name, logging.INFO, __file__, 0, "GET %s", ("/x",), None,
+                            extra={"request": {"status": 200, "path": "/x"}})
+    data = json.loads(JSONFormatter().format(record))
+    assert data["message"] == "GET /x"
+    assert data["request"] == {"status": 200, "path": "/x"}
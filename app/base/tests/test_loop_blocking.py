@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import httpx
+from fastapi import APIRouter, Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.base.loop_lag import BlockingDetector
+from app.base.metrics import MetricsCollector
+from app.base.routing_utils.registry import ModuleRegistry
+from app.base.threadpool import AddonThreadPools, uses_threadpool
+
+
+def sync_dependency():
+    return 1
+
+
+def make_app(manifest: dict):
+    app = FastAPI()
+    router = APIRouter(prefix="/blocking")
+
+    @router.get("/sleepy")
+    async def blocking_sleepy():
+        time.sleep(0.3)
+        return {}
+
+    @router.get("/sync")
+    def blocking_sync():
+        time.sleep(0.3)
+        return {}
+
+    @router.get("/depends")
+    async def blocking_depends(value: int = Depends(sync_dependency)):
+        return {}
+
+    @router.get("/async")
+    async def blocking_async():
+        return {}
+
+    staging = APIRouter()
+    staging.include_router(router)
+    registry = ModuleRegistry()
+    registry.add_routes(app, registry.register({'technical_name': 'blocking', **manifest}), staging.routes)
+    return app, registry
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_watchdog_pins_blocking_on_route():
+    app, registry = make_app({})
+    detector = BlockingDetector(registry, collector=MetricsCollector(metrics_dir=None), mode='watchdog', threshold=0.05)
+    try:
+        client = TestClient(app)
+        assert client.get("/blocking/async").status_code == 200
+        assert client.get("/blocking/sleepy").status_code == 200
+        assert wait_for(lambda: detector.events)
+    finally:
+        detector.close()
+
+    event = detector.events[-1]
+    assert (event['addon'], event['route'], event['source']) == ('blocking', '/blocking/sleepy', 'watchdog')
+    assert event['duration_ms'] >= 200
+    assert any('blocking_sleepy' in line for line in event['stack'])
+    assert detector.by_addon['blocking']['count'] == 1
+    assert 'app_loop_blocked_total{addon="blocking"} 1' in detector.collector.render_prometheus()
+
+
+def test_debug_mode_times_callbacks():
+    app, registry = make_app({})
+    detector = BlockingDetector(registry, mode='debug', threshold=0.05)
+    try:
+        assert TestClient(app).get("/blocking/sleepy").status_code == 200
+        assert wait_for(lambda: any(event['source'] == 'callback' for event in detector.events))
+    finally:
+        detector.close()
+
+    event = next(event for event in detector.events if event['source'] == 'callback')
+    assert (event['addon'], event['route']) == ('blocking', '/blocking/sleepy')
+    # The watchdog saw it too, but it is only counted once
+    assert detector.by_addon['blocking']['count'] == 1
+
+
+def test_addon_thread_limit():
+    app, registry = make_app({'threadpool': {'max_threads': 1, 'timeout': 0.1}})
+    pools = AddonThreadPools(registry)
+    routes = {route.path: route for route in registry.get('blocking').routes}
+    assert uses_threadpool(routes['/blocking/depends']) and not uses_threadpool(routes['/blocking/async'])
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.get("/blocking/sync") for _ in range(3)),
+                                        client.get("/blocking/async"))
+
+    responses = asyncio.run(burst())
+    assert sorted(response.status_code for response in responses[:3]) == [200, 503, 503]
+    # Fully async routes don't wait for a thread
+    assert responses[3].status_code == 200
+    assert pools.stats()['blocking'] == {'max_threads': 1, 'in_use': 0, 'waiting': 0, 'timeouts': 2}
@@ -0,0 +1,41 @@
+import json
+
+from app.base.metrics import MetricsCollector
+
+
+def test_collect_sums_worker_files(tmp_path):
+    collector = MetricsCollector(metrics_dir=str(tmp_path))
+    collector.observe("shop", "/items/{id}", "GET", 0.002, False)
+    collector.observe("shop", "/items/{id}", "GET", 0.3, True)
+    # Snapshot of another worker
+    other = {'pid': 1, 'stats': [["shop", "/items/{id}", "GET", 3, 0, 0.03, [3] + [0] * 11]],
+             'log': {'queued': 4, 'dropped': 2}}
+    (tmp_path / "metrics.1.json").write_text(json.dumps(other))
+
+    merged, log = collector.collect()
+    stats = merged[("shop", "/items/{id}", "GET")]
+    assert (stats.count, stats.errors) == (5, 1)
+    assert log['dropped'] == 2
+    assert collector.module_stats("shop")["GET /items/{id}"]["count"] == 5
+
+    # The totals of an exited worker are retained, counters never go down
+    collector.remove_worker(1)
+    assert not (tmp_path / "metrics.1.json").exists()
+    merged, log = collector.collect()
+    assert merged[("shop", "/items/{id}", "GET")].count == 5
+    assert log == {'queued': 0, 'dropped': 2}
+
+    collector.reset()
+    assert not list(tmp_path.glob("metrics.*"))
+
+
+def test_prometheus_histogram_is_cumulative():
+    collector = MetricsCollector(metrics_dir=None)
+    collector.observe("shop", "/items", "GET", 0.002, False)
+    collector.observe("shop", "/items", "GET", 20.0, False)
+    text = collector.render_prometheus()
+    labels = 'addon="shop",route="/items",method="GET"'
+    assert f'app_requests_total{{{labels}}} 2' in text
+    assert f'app_request_duration_seconds_bucket{{{labels},le="0.005"}} 1' in text
+    assert f'app_request_duration_seconds_bucket{{{labels},le="10.0"}} 1' in text
+    assert f'app_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
@@ -0,0 +1,45 @@
+import os
+
+from app.base.module_index import ModuleIndex
+
+MANIFEST = """{
+    'name': 'Indexed Module',
+    'version': '1.0.0',
+    'description': 'Indexed',
+    'license': 'LGPL-3',
+    'depends': [],
+    'installable': True,
+}
+"""
+
+
+def make_addon(addons_dir, name):
+    routes_dir = addons_dir / name / "routes"
+    routes_dir.mkdir(parents=True)
+    (addons_dir / name / "__manifest__.py").write_text(MANIFEST)
+    (routes_dir / "route.py").write_text("")
+
+
+def test_index_reuses_unchanged_addons(tmp_path):
+    addons_dir = tmp_path / "addons"
+    make_addon(addons_dir, "first")
+    make_addon(addons_dir, "second")
+    index_path = str(tmp_path / "index.json")
+
+    index = ModuleIndex(str(addons_dir), index_path)
+    entries = index.scan()
+    assert [e['technical_name'] for e in entries] == ["first", "second"]
+    assert entries[0]['files'][0]['module_name'] == "first.routes.route"
+    assert (index.hits, index.misses) == (0, 2)
+
+    index = ModuleIndex(str(addons_dir), index_path)
+    index.scan()
+    assert (index.hits, index.misses) == (2, 0)
+
+    manifest = addons_dir / "second" / "__manifest__.py"
+    manifest.write_text(MANIFEST.replace("1.0.0", "1.0.1"))
+    os.utime(manifest, ns=(0, 0))
+    index = ModuleIndex(str(addons_dir), index_path)
+    entries = index.scan()
+    assert (index.hits, index.misses) == (1, 1)
+    assert entries[1]['manifest']['version'] == "1.0.1"
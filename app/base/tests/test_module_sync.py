@@ -0,0 +1,49 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.base.routing_utils.module_sync import ModuleStateStore, ModuleSync, ModuleSyncMiddleware
+from app.base.routing_utils.routing import Routing
+from app.base.tests.test_enable_module import write_addon
+
+
+def make_worker(tmp_path, store, name):
+    app = FastAPI()
+    routing = Routing(str(tmp_path / "addons"))
+    routing.index.index_path = str(tmp_path / f"index.{name}.json")
+    routing.register_routes(app)
+    sync = ModuleSync(routing, app, store, interval=0, server=1)
+    app.add_middleware(ModuleSyncMiddleware, sync=sync)
+    return app, routing, sync
+
+
+def test_workers_converge_on_published_changes(tmp_path):
+    write_addon(tmp_path / "addons", "shared", "one")
+    store = ModuleStateStore(str(tmp_path / "state.json"))
+    store.reset(server=1)
+    app_a, routing_a, sync_a = make_worker(tmp_path, store, "a")
+    app_b, routing_b, sync_b = make_worker(tmp_path, store, "b")
+    client_b = TestClient(app_b)
+    assert client_b.get("/shared/one").status_code == 200
+
+    routing_a.remove_module(app_a, "shared")
+    sync_a.publish("shared", active=False)
+    # The next request to the other worker applies the change before it is routed
+    assert client_b.get("/shared/one").status_code == 404
+    assert sync_a.check() == []
+
+    routing_a.enable_module(app_a, "shared")
+    sync_a.publish("shared", active=True)
+    assert client_b.get("/shared/one").status_code == 200
+    assert sync_b.generation == sync_a.generation == 2
+
+
+def test_state_of_another_server_is_ignored(tmp_path):
+    write_addon(tmp_path / "addons", "shared", "one")
+    store = ModuleStateStore(str(tmp_path / "state.json"))
+    store.reset(server=2)
+    app, routing, sync = make_worker(tmp_path, store, "a")
+    assert store.publish(2, "shared", False) == 1
+    assert sync.check() == []
+    assert routing.modules.get("shared").active
+    sync.publish("shared", active=False)
+    assert store.read()['generation'] == 1
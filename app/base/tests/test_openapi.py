@@ -0,0 +1,32 @@
+from fastapi.testclient import TestClient
+
+from app.base.api_init import FastAPIWrapper
+
+
+def test_openapi_is_cached_per_module_and_served_with_etag():
+    wrapper = FastAPIWrapper()
+    app = wrapper.fastapi_app
+    client = TestClient(app)
+
+    response = client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "/test/route1" in response.json()["paths"]
+    assert "/auth/login" in response.json()["paths"]
+    etag = response.headers["etag"]
+
+    assert client.get("/openapi.json", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 304
+    # The identity variant is other bytes with another tag
+    identity = client.get("/openapi.json", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert identity.status_code == 200 and identity.headers["etag"] != etag
+
+    base_fragment = wrapper.openapi_cache._base
+    wrapper.routing.remove_module(app, "template_module")
+    assert "template_module" not in wrapper.openapi_cache._fragments
+    response = client.get("/openapi.json", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "/test/route1" not in response.json()["paths"]
+    assert wrapper.openapi_cache._base is base_fragment
+
+    wrapper.routing.enable_module(app, "template_module")
+    assert "/test/route1" in app.openapi()["paths"]
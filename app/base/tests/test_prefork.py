@@ -0,0 +1,17 @@
+import gc
+
+from sqlmodel import create_engine
+
+from app.base import db
+from app.base.logger import pipeline
+from app.base.prefork import after_fork
+
+
+def test_after_fork_resets_unshareable_state(monkeypatch):
+    monkeypatch.setattr(db, "_engine", create_engine("sqlite://"))
+    old_listener = pipeline.listener
+    gc.disable()
+    after_fork()
+    assert db._engine is None
+    assert pipeline.listener is not old_listener and pipeline.listener._thread.is_alive()
+    assert gc.isenabled()
@@ -0,0 +1,54 @@
+import asyncio
+import os
+import threading
+import time
+
+from app.base.profiler import SamplingProfiler
+
+
+def busy_addon_code(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profile_keeps_stacks_of_addon_code():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_addon_code, args=(stop,), name="busy")
+    worker.start()
+    try:
+        session = asyncio.run(SamplingProfiler(interval=0.001).run(0.2, addon_dir=os.path.dirname(__file__)))
+    finally:
+        stop.set()
+        worker.join()
+
+    assert session.samples > 0
+    busy = [line for line in session.collapsed().splitlines() if "busy_addon_code" in line]
+    assert busy and all(line.startswith("thread:busy;") for line in busy)
+
+
+def test_request_mode_only_samples_tagged_tasks():
+    profiler = SamplingProfiler(interval=0.001)
+
+    async def spin():
+        deadline = time.monotonic() + 0.1
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0)
+            sum(range(1000))
+
+    async def tagged_request():
+        profiler.session.tasks.add(asyncio.current_task())
+        await spin()
+
+    async def other_request():
+        await spin()
+
+    async def main():
+        profile = asyncio.create_task(profiler.run(0.3, routes=[]))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(tagged_request(), other_request())
+        return await profile
+
+    session = asyncio.run(main())
+    text = session.collapsed()
+    assert "tagged_request" in text
+    assert "other_request" not in text
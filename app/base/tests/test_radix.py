@@ -0,0 +1,63 @@
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.base.routing_utils.radix import RadixDispatcher
+from app.base.routing_utils.registry import ModuleRegistry
+
+
+def make_app():
+    app = FastAPI()
+    registry = ModuleRegistry()
+    dispatcher = RadixDispatcher.install(app, registry)
+
+    @app.get("/items/special")
+    async def special():
+        return {"route": "special"}
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"route": "item", "item_id": item_id}
+
+    @app.get("/files/{file_path:path}")
+    async def files(file_path: str):
+        return {"route": "files", "file_path": file_path}
+
+    return app, registry, dispatcher
+
+
+def test_radix_dispatch_matches_starlette_behaviour():
+    app, registry, dispatcher = make_app()
+    client = TestClient(app)
+    assert client.get("/items/special").json() == {"route": "special"}
+    assert client.get("/items/4").json() == {"route": "item", "item_id": 4}
+    assert client.get("/items/x").status_code == 422
+    assert client.get("/files/a/b/c.txt").json() == {"route": "files", "file_path": "a/b/c.txt"}
+    assert client.post("/items/4").status_code == 405
+    assert client.get("/items/4/", follow_redirects=False).status_code == 307
+    assert client.get("/nowhere").status_code == 404
+    assert client.get("/docs").status_code == 200
+
+
+def test_radix_tree_follows_registry_changes():
+    app, registry, dispatcher = make_app()
+    client = TestClient(app)
+    client.get("/items/1")
+    tree = dispatcher.tree
+
+    router = APIRouter(prefix="/mod")
+
+    @router.get("/{name}")
+    async def mod_name(name: str):
+        return {"route": "mod", "name": name}
+
+    staging = APIRouter()
+    staging.include_router(router)
+    record = registry.register({'technical_name': 'mod', 'name': 'Mod'})
+    registry.add_routes(app, record, staging.routes)
+    assert tree.source is app.router.routes
+    assert client.get("/mod/abc").json() == {"route": "mod", "name": "abc"}
+
+    registry.remove(app, "mod")
+    assert tree.source is app.router.routes
+    assert client.get("/mod/abc").status_code == 404
+    assert dispatcher.tree is tree
@@ -0,0 +1,117 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.base import rate_limit as rate_limit_module
+from app.base.metrics import MetricsCollector
+from app.base.rate_limit import (LoadShedder, RateLimit, RateLimiter, RateLimitMiddleware, client_id,
+                                 rate_limit)
+from app.base.routing_utils.registry import ModuleRegistry
+
+
+class FixedLag:
+    def __init__(self, lag):
+        self.lag = lag
+
+    def current(self):
+        return self.lag
+
+    def stats(self):
+        return {}
+
+
+def make_app(shedder=None, client_limit=None):
+    app = FastAPI()
+    router = APIRouter(prefix="/limited")
+
+    @router.get("/open")
+    async def limited_open():
+        return {}
+
+    @router.get("/strict")
+    @rate_limit(per_client={'rate': 0.01, 'burst': 1})
+    async def limited_strict():
+        return {}
+
+    @router.get("/slow")
+    async def limited_slow():
+        await asyncio.sleep(0.05)
+        return {}
+
+    staging = APIRouter()
+    staging.include_router(router)
+    registry = ModuleRegistry()
+    limiter = RateLimiter(registry, collector=MetricsCollector(metrics_dir=None))
+    manifest = {'technical_name': 'limited', 'rate_limit': {'per_client': {'rate': 0.01, 'burst': 3}}}
+    registry.add_routes(app, registry.register(manifest), staging.routes)
+    if shedder is not None:
+        app.add_middleware(RateLimitMiddleware, limiter=limiter, shedder=shedder, client_limit=client_limit)
+    return app, limiter, registry
+
+
+def test_addon_and_route_limits_per_client():
+    app, limiter, registry = make_app()
+    client = TestClient(app)
+
+    assert client.get("/limited/strict").status_code == 200
+    response = client.get("/limited/strict")
+    assert response.status_code == 429 and int(response.headers["retry-after"]) >= 1
+    # The rejected request took no token from the addon bucket, 2 of 3 are left
+    assert [client.get("/limited/open").status_code for _ in range(3)] == [200, 200, 429]
+    assert limiter.counts['rejected']['limited'] == {'route_client': 1, 'addon_client': 1}
+    assert 'app_rate_limited_total{addon="limited",limit="route_client"} 1' in limiter.collector.render_prometheus()
+
+    # Another client has its own buckets
+    async def from_other_client():
+        transport = httpx.ASGITransport(app=app, client=("10.0.0.2", 1234))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as other:
+            return await other.get("/limited/open")
+
+    assert asyncio.run(from_other_client()).status_code == 200
+
+    # Reloading the module starts over with full buckets
+    record = registry.get('limited')
+    registry.reload(app, record, list(record.routes))
+    assert client.get("/limited/open").status_code == 200
+
+
+def test_load_shedding_on_inflight_and_loop_lag():
+    shedder = LoadShedder(FixedLag(0.0), max_inflight=2, max_lag=0.2)
+    app, limiter, _ = make_app(shedder)
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.get("/limited/slow") for _ in range(4)))
+
+    statuses = sorted(response.status_code for response in asyncio.run(burst()))
+    assert statuses == [200, 200, 503, 503]
+    assert shedder.inflight == 0
+
+    shedder.monitor.lag = 1.0
+    response = TestClient(app).get("/limited/slow")
+    assert response.status_code == 503 and response.headers["retry-after"] == "1"
+    assert limiter.counts['shed'] == {'inflight': 2, 'loop_lag': 1}
+
+
+def test_global_client_limit():
+    app, limiter, _ = make_app(LoadShedder(FixedLag(0.0), max_inflight=0, max_lag=0), RateLimit(0.01, 2))
+    client = TestClient(app)
+    assert [client.get("/limited/slow").status_code for _ in range(3)] == [200, 200, 429]
+    assert limiter.counts['rejected'][''] == {'client': 1}
+
+
+def test_client_id_trusts_only_the_proxies(monkeypatch):
+    monkeypatch.setattr(rate_limit_module, "RATE_LIMIT_CLIENT_HEADER", "x-forwarded-for")
+    scope = {"type": "http", "client": ("10.0.0.1", 1),
+             "headers": [(b"x-forwarded-for", b"1.1.1.1, 203.0.113.7, 10.0.0.2")]}
+    # The leftmost entry is whatever the client sent
+    assert client_id(scope, trusted_proxies=1) == "10.0.0.2"
+    assert client_id(scope, trusted_proxies=2) == "203.0.113.7"
+    assert client_id(scope, trusted_proxies=4) == "10.0.0.1"
+
+    with pytest.raises(ValueError):
+        RateLimit(0)
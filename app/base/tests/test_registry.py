@@ -0,0 +1,43 @@
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.base.routing_utils.registry import ModuleRegistry
+
+
+def make_app():
+    app = FastAPI()
+    router = APIRouter(prefix="/reg")
+
+    @router.get("/one")
+    async def reg_one():
+        return {"route": 1}
+
+    @router.post("/two")
+    async def reg_two():
+        return {"route": 2}
+
+    staging = APIRouter()
+    staging.include_router(router)
+    registry = ModuleRegistry()
+    record = registry.register({'technical_name': 'reg_module', 'name': 'Registry Module'})
+    registry.add_routes(app, record, staging.routes)
+    return app, registry
+
+
+def test_remove_and_enable_module():
+    app, registry = make_app()
+    client = TestClient(app)
+    record = registry.get_by_name("Registry Module")
+    assert record is registry.get("reg_module")
+    assert registry.owner_of(record.routes[0]) is record
+    assert record.as_dict()['routes'][1] == {'/reg/two': {'path': '/reg/two', 'name': 'reg_two', 'methods': ['POST']}}
+
+    assert client.get("/reg/one").status_code == 200
+    removed = registry.remove(app, "reg_module")
+    assert [route.path for route in removed] == ["/reg/one", "/reg/two"]
+    assert client.get("/reg/one").status_code == 404
+    assert registry.remove(app, "reg_module") == []
+
+    registry.enable(app, "reg_module")
+    assert client.get("/reg/one").json() == {"route": 1}
+    assert client.post("/reg/two").json() == {"route": 2}
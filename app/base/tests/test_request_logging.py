@@ -0,0 +1,58 @@
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.base.middleware.request_logging import RequestLoggingMiddleware
+from app.base.routing_utils.registry import ModuleRegistry
+
+
+def make_client(manifest_config):
+    app = FastAPI()
+    registry = ModuleRegistry()
+
+    @app.get("/logged/{item_id}")
+    async def logged(item_id: int):
+        return {"item_id": item_id}
+
+    record = registry.register({'technical_name': 'logged_module', 'request_logging': manifest_config})
+    registry.add_routes(app, record, [app.router.routes.pop()])
+    app.add_middleware(RequestLoggingMiddleware, registry=registry)
+    return TestClient(app)
+
+
+def test_request_is_logged_with_fields(caplog):
+    client = make_client({'include_headers': True})
+    with caplog.at_level(logging.INFO, logger="app.requests"):
+        client.get("/logged/3", headers={"Authorization": "Bearer secret", "X-Trace": "abc"})
+    [record] = [r for r in caplog.records if r.name == "app.requests"]
+    fields = record.request
+    assert fields["status"] == 200
+    assert fields["route"] == "/logged/{item_id}"
+    assert fields["addon"] == "logged_module"
+    assert fields["headers"]["authorization"] == "[redacted]"
+    assert fields["headers"]["x-trace"] == "abc"
+
+
+def test_request_logging_sampling_and_disabled_logger(caplog):
+    client = make_client({'sample_rate': 0.0})
+    with caplog.at_level(logging.INFO, logger="app.requests"):
+        client.get("/logged/3")
+        client.get("/nowhere")
+    assert [r.request["path"] for r in caplog.records if r.name == "app.requests"] == ["/nowhere"]
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="app.requests"):
+        client.get("/nowhere")
+    assert not [r for r in caplog.records if r.name == "app.requests"]
+
+
+def test_bad_manifest_config_is_ignored(caplog):
+    client = make_client({'sample_rate': 1.0, 'include_header': True})
+    with caplog.at_level(logging.INFO):
+        client.get("/logged/3")
+        client.get("/logged/4")
+    logged = [r.request for r in caplog.records if r.name == "app.requests"]
+    assert [fields["path"] for fields in logged] == ["/logged/3", "/logged/4"]
+    assert "headers" not in logged[-1]
+    assert sum("unknown 'request_logging' keys" in r.getMessage() for r in caplog.records) == 1
@@ -0,0 +1,117 @@
+import time
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.base.response_cache import (CachedResponse, MemoryCacheStore, ResponseCache, SQLiteCacheStore,
+                                     cached)
+from app.base.routing_utils.registry import ModuleRegistry
+
+
+def make_app(store):
+    app = FastAPI()
+    router = APIRouter(prefix="/cached")
+    calls = []
+
+    @router.get("/items")
+    @cached(ttl=60, vary_query=["page"])
+    async def cached_items(page: int = 1, debug: bool = False):
+        calls.append(page)
+        return {"page": page, "call": len(calls)}
+
+    @router.get("/localized")
+    @cached(ttl=60, vary_headers=["accept-language", "cookie"])
+    async def cached_localized():
+        calls.append("localized")
+        return {"call": len(calls)}
+
+    @router.get("/manifest")
+    async def cached_by_manifest():
+        calls.append("manifest")
+        return {"call": len(calls)}
+
+    staging = APIRouter()
+    staging.include_router(router)
+    registry = ModuleRegistry()
+    ResponseCache(registry, store)
+    record = registry.register({'technical_name': 'cache_module', 'cache': {'cached_by_manifest': 60}})
+    registry.add_routes(app, record, staging.routes)
+    return app, registry, calls
+
+
+def test_hits_etags_and_invalidation_on_module_change():
+    app, registry, calls = make_app(MemoryCacheStore())
+    client = TestClient(app)
+
+    first = client.get("/cached/items?page=2")
+    assert first.headers["x-cache"] == "MISS"
+    # Parameters outside vary_query share the entry
+    again = client.get("/cached/items?debug=true&page=2")
+    assert again.headers["x-cache"] == "HIT" and again.json() == first.json()
+    assert client.get("/cached/items?page=3").headers["x-cache"] == "MISS"
+    assert client.get("/cached/manifest").headers["x-cache"] == "MISS"
+    assert client.get("/cached/manifest").headers["x-cache"] == "HIT"
+    assert calls == [2, 3, "manifest"]
+    assert "vary" not in first.headers
+
+    not_modified = client.get("/cached/items?page=2", headers={"If-None-Match": first.headers["etag"]})
+    assert not_modified.status_code == 304 and not_modified.content == b""
+    # Authenticated requests are not served from the shared cache
+    assert "x-cache" not in client.get("/cached/items?page=2", headers={"Authorization": "Bearer x"}).headers
+    assert "x-cache" not in client.get("/cached/items?page=2", headers={"Cookie": "session=x"}).headers
+
+    # The headers of the key are announced, a cookie in the key gets its own entry
+    localized = client.get("/cached/localized", headers={"Cookie": "session=a"})
+    assert localized.headers["vary"] == "accept-language, cookie"
+    assert client.get("/cached/localized", headers={"Cookie": "session=a"}).headers["x-cache"] == "HIT"
+    assert client.get("/cached/localized", headers={"Cookie": "session=b"}).headers["x-cache"] == "MISS"
+
+    registry.remove(app, "cache_module")
+    registry.enable(app, "cache_module")
+    assert client.get("/cached/items?page=2").headers["x-cache"] == "MISS"
+
+
+def entry(body: bytes, ttl: float = 60) -> CachedResponse:
+    now = time.time()
+    return CachedResponse(200, [("content-type", "text/plain")], body, '"etag"', now, now + ttl)
+
+
+def test_memory_store_evicts_least_recently_used_by_size():
+    size = entry(b"x" * 100).size
+    store = MemoryCacheStore(max_bytes=size * 2)
+    store.set("m:a", entry(b"x" * 100))
+    store.set("m:b", entry(b"x" * 100))
+    assert store.get("m:a") is not None
+    store.set("m:c", entry(b"x" * 100))
+    assert store.get("m:b") is None
+    assert store.get("m:a") is not None and store.size == size * 2
+
+    store.set("m:old", entry(b"x", ttl=-1))
+    assert store.get("m:old") is None
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    writer, reader = SQLiteCacheStore(path), SQLiteCacheStore(path)
+    writer.set("shop:a", entry(b"body"))
+    writer.set("other:a", entry(b"body"))
+    cached_entry = reader.get("shop:a")
+    assert cached_entry.body == b"body" and cached_entry.headers == [("content-type", "text/plain")]
+
+    reader.invalidate("shop:")
+    assert writer.get("shop:a") is None
+    assert writer.get("other:a") is not None
+
+
+def test_sqlite_store_tracks_size_and_batches_hits(tmp_path):
+    store = SQLiteCacheStore(str(tmp_path / "cache.sqlite3"), max_bytes=entry(b"x" * 100).size * 2)
+    store.set("m:a", entry(b"x" * 100))
+    store.set("m:b", entry(b"x" * 100))
+    store.set("m:b", entry(b"x" * 100))
+    assert store.stats()['bytes'] == entry(b"x" * 100).size * 2
+    # The hit on a is only pending, it is written before the eviction needs it
+    assert store.get("m:a") is not None and store._accessed
+    store.set("m:c", entry(b"x" * 100))
+    assert store.get("m:b") is None and store.get("m:a") is not None
+    store.invalidate("m:")
+    assert store.stats()['bytes'] == 0
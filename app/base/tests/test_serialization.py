@@ -0,0 +1,81 @@
+import datetime
+import json
+from dataclasses import dataclass
+from typing import Optional
+
+import pytest
+from fastapi import APIRouter, FastAPI, Response
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, Field
+
+from app.base.routing_utils.registry import ModuleRegistry
+from app.base.serialization import FastJSON, dumps
+
+
+class Item(BaseModel):
+    id: int
+    name: str = Field(alias="itemName")
+    note: Optional[str] = None
+
+
+@dataclass
+class Point:
+    x: int
+    at: datetime.date
+
+
+def make_app(mode: str):
+    app = FastAPI()
+    router = APIRouter(prefix="/json")
+
+    @router.get("/items", response_model=list[Item])
+    async def json_items():
+        return [{"id": i, "itemName": f"item {i}"} for i in range(3)]
+
+    @router.get("/item", response_model=Item, response_model_exclude_none=True)
+    def json_item():
+        return Item(id=1, itemName="one")
+
+    @router.get("/plain")
+    async def json_plain():
+        return {"point": Point(1, datetime.date(2024, 5, 1)), "item": Item(id=2, itemName="two"), 3: "int key"}
+
+    @router.get("/invalid", response_model=Item)
+    async def json_invalid():
+        return {"id": "not an int"}
+
+    @router.get("/headers")
+    async def json_headers(response: Response):
+        response.headers["x-extra"] = "1"
+        return {}
+
+    staging = APIRouter()
+    staging.include_router(router)
+    registry = ModuleRegistry()
+    fast_json = FastJSON(registry, default_mode='standard')
+    registry.add_routes(app, registry.register({'technical_name': 'json', 'json': mode}), staging.routes)
+    return app, fast_json
+
+
+@pytest.mark.parametrize("path", ["/json/items", "/json/item", "/json/plain", "/json/headers"])
+def test_fast_mode_matches_standard(path):
+    standard, _ = make_app('standard')
+    fast, fast_json = make_app('fast')
+    expected = TestClient(standard).get(path)
+    response = TestClient(fast).get(path)
+    assert response.status_code == expected.status_code == 200
+    assert response.headers["content-type"] == expected.headers["content-type"]
+    assert json.loads(response.content) == json.loads(expected.content)
+    # Every route but the one with a Response parameter is encoded by FastJSON
+    assert fast_json.routes == 4
+    assert response.headers.get("x-extra") == expected.headers.get("x-extra")
+
+
+def test_invalid_response_keeps_fastapi_error():
+    fast, _ = make_app('fast')
+    with pytest.raises(Exception, match="validation error"):
+        TestClient(fast).get("/json/invalid")
+
+
+def test_dumps_falls_back_on_large_integers():
+    assert json.loads(dumps({"big": 2 ** 70, "at": datetime.date(2024, 1, 2)})) == {"big": 2 ** 70, "at": "2024-01-02"}
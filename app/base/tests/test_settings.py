@@ -0,0 +1,96 @@
+import os
+import signal
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from app.base.settings import AddonSettings, SettingsStore
+from app.base.threadpool import uses_threadpool
+
+
+class ShopSettings(BaseModel):
+    timeout: float
+    currencies: str = "EUR"
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+    # A rewrite within the same clock tick must still be seen
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+@pytest.fixture
+def store(tmp_path):
+    write(str(tmp_path / "base" / ".config.env"), "DEBUG=true\n")
+    write(str(tmp_path / "addons" / "shop" / "config" / ".config.env"), "TIMEOUT=2.5\nAPI_KEY=public\n")
+    write(str(tmp_path / "addons" / "shop" / "config" / ".secrets.env"), "API_KEY=s3cret\n")
+    write(str(tmp_path / "addons" / "blog" / "config" / ".config.env"), "PAGE_SIZE=20\nTAGS=a, b,,c\n")
+    os.makedirs(tmp_path / "addons" / "empty")
+    store = SettingsStore(addons_path=str(tmp_path / "addons"), base_dir=str(tmp_path / "base"))
+    store.load()
+    return store
+
+
+def test_namespaced_typed_settings(store):
+    assert sorted(store.namespaces) == ["base", "blog", "shop"]
+    shop = store.get("shop")
+    # Secrets override the config and stay out of repr
+    assert shop["API_KEY"] == "s3cret" and "s3cret" not in repr(shop)
+    assert shop.get_float("TIMEOUT") == 2.5 and shop.get_int("RETRIES", 3) == 3
+    assert store.get("base").get_bool("DEBUG") is True
+    assert store.get("blog").get_list("TAGS") == ("a", "b", "c")
+    assert shop.model(ShopSettings) is shop.model(ShopSettings)
+    assert shop.model(ShopSettings).timeout == 2.5
+    assert store.get("unknown") == AddonSettings("unknown", {})
+
+
+def test_reload_only_changed_files(store, tmp_path):
+    shop, blog = store.get("shop"), store.get("blog")
+    write(str(tmp_path / "addons" / "blog" / "config" / ".config.env"), "PAGE_SIZE=50\n")
+    write(str(tmp_path / "addons" / "news" / "config" / ".config.env"), "FEED=rss\n")
+    assert sorted(store.reload()) == ["blog", "news"]
+    assert store.get("shop") is shop
+    assert store.get("blog") is not blog and store.get("blog").get_int("PAGE_SIZE") == 50
+    assert store.get("news")["FEED"] == "rss"
+
+
+def test_sighup_reloads_on_next_lookup(store, tmp_path):
+    assert store.install_signal_handler()
+    try:
+        write(str(tmp_path / "addons" / "shop" / "config" / ".config.env"), "TIMEOUT=9\n")
+        assert store.get("shop").get_float("TIMEOUT") == 2.5
+        os.kill(os.getpid(), signal.SIGHUP)
+        assert store.get("shop").get_float("TIMEOUT") == 9.0
+    finally:
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+
+def test_settings_dependency(store, tmp_path):
+    app = FastAPI()
+
+    @app.get("/timeout")
+    async def timeout(config: ShopSettings = Depends(store.dependency("shop", ShopSettings))):
+        return {"timeout": config.timeout}
+
+    client = TestClient(app)
+    assert client.get("/timeout").json() == {"timeout": 2.5}
+    write(str(tmp_path / "addons" / "shop" / "config" / ".config.env"), "TIMEOUT=4\n")
+    store.request_reload()
+    assert client.get("/timeout").json() == {"timeout": 4.0}
+
+
+def test_settings_dependency_stays_off_the_threadpool(store):
+    app = FastAPI()
+
+    @app.get("/settings")
+    async def shop_settings(shop: AddonSettings = Depends(store.dependency("shop")),
+                            config: ShopSettings = Depends(store.dependency("shop", ShopSettings))):
+        return {"timeout": config.timeout, "api_key": shop["API_KEY"]}
+
+    assert not uses_threadpool(app.router.routes[-1])
+    assert TestClient(app).get("/settings").json() == {"timeout": 2.5, "api_key": "s3cret"}
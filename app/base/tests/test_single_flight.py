@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+from fastapi import APIRouter, FastAPI, Response
+
+from app.base.routing_utils.registry import ModuleRegistry
+from app.base.single_flight import SingleFlight, single_flight
+
+
+def make_app():
+    app = FastAPI()
+    router = APIRouter(prefix="/flight")
+    calls = []
+
+    @router.get("/slow")
+    @single_flight(timeout=5)
+    async def flight_slow(q: str = ""):
+        calls.append(q)
+        await asyncio.sleep(0.05)
+        return {"q": q, "call": len(calls)}
+
+    @router.get("/fail")
+    @single_flight()
+    async def flight_fail():
+        calls.append("fail")
+        await asyncio.sleep(0.05)
+        raise RuntimeError("boom")
+
+    @router.get("/session")
+    @single_flight()
+    async def flight_session(response: Response):
+        calls.append("session")
+        await asyncio.sleep(0.05)
+        response.set_cookie("session", str(len(calls)))
+        return {"call": len(calls)}
+
+    @router.get("/stuck")
+    @single_flight(timeout=0.01)
+    async def flight_stuck():
+        calls.append("stuck")
+        await asyncio.sleep(0.1)
+        return {"call": len(calls)}
+
+    staging = APIRouter()
+    staging.include_router(router)
+    registry = ModuleRegistry()
+    layer = SingleFlight(registry)
+    registry.add_routes(app, registry.register({'technical_name': 'flight_module'}), staging.routes)
+    return app, layer, calls
+
+
+def stats_of(layer, path):
+    return next(stats for stats in layer.stats_by_route() if stats['path'] == path)
+
+
+def run(app, *urls, headers=None):
+    async def main():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.get(url, headers=headers[i] if headers else None) for i, url in enumerate(urls)
+            ))
+    return asyncio.run(main())
+
+
+def test_identical_requests_share_one_execution():
+    app, layer, calls = make_app()
+    responses = run(app, "/flight/slow?q=a", "/flight/slow?q=a", "/flight/slow?q=a", "/flight/slow?q=b")
+    assert [r.json()["q"] for r in responses] == ["a", "a", "a", "b"]
+    assert len({r.json()["call"] for r in responses[:3]}) == 1
+    assert sorted(calls) == ["a", "b"]
+    assert stats_of(layer, "/flight/slow") == {'module': 'flight_module', 'path': '/flight/slow',
+                                               'leaders': 2, 'coalesced': 2, 'timeouts': 0, 'errors': 0}
+
+
+def test_errors_reach_every_waiter_and_timeouts_run_alone():
+    app, layer, calls = make_app()
+    assert [r.status_code for r in run(app, "/flight/fail", "/flight/fail")] == [500, 500]
+    assert calls.count("fail") == 1
+    assert stats_of(layer, "/flight/fail")['errors'] == 1
+
+    assert [r.status_code for r in run(app, "/flight/stuck", "/flight/stuck")] == [200, 200]
+    assert calls.count("stuck") == 2
+    assert stats_of(layer, "/flight/stuck")['timeouts'] == 1
+
+
+def test_cookies_are_never_shared():
+    app, layer, calls = make_app()
+    run(app, "/flight/slow?q=c", "/flight/slow?q=c", headers=[{"Cookie": "session=a"}, {"Cookie": "session=b"}])
+    assert calls == ["c", "c"] and stats_of(layer, "/flight/slow")['leaders'] == 0
+
+    # A response setting a cookie is not replayed, the waiter runs the route itself
+    responses = run(app, "/flight/session", "/flight/session")
+    assert calls.count("session") == 2 and stats_of(layer, "/flight/session")['coalesced'] == 1
+    assert len({r.headers["set-cookie"] for r in responses}) == 2
@@ -0,0 +1,42 @@
+import importlib
+import json
+import sys
+
+from app.base.startup import StartupProfile
+
+
+def test_startup_profile_times_imports_and_phases(tmp_path, monkeypatch):
+    (tmp_path / "startup_outer.py").write_text("import startup_inner\n")
+    (tmp_path / "startup_inner.py").write_text("import time\ntime.sleep(0.02)\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    profile = StartupProfile(enabled=True, path=str(tmp_path / "profile.json"))
+    profile.start()
+    try:
+        with profile.phase("import"):
+            importlib.import_module("startup_outer")
+    finally:
+        profile.stop()
+        sys.modules.pop("startup_outer", None)
+        sys.modules.pop("startup_inner", None)
+
+    outer, outer_self = profile.imports["startup_outer"]
+    inner, _ = profile.imports["startup_inner"]
+    assert inner >= 0.02 and outer >= inner
+    # The inner import is not counted in the self time of the outer one
+    assert outer_self < inner
+    assert profile.phases["import"] >= 20
+
+    profile.request_served()
+    report = json.loads((tmp_path / "profile.json").read_text())
+    assert report["first_request_ms"] >= 20
+    assert "startup_outer" in report["imports_ms"]
+
+
+def test_disabled_profile_does_nothing():
+    profile = StartupProfile(enabled=False)
+    profile.start()
+    assert profile not in sys.meta_path
+    with profile.phase("step"):
+        pass
+    assert profile.phases == {}
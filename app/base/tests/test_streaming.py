@@ -0,0 +1,119 @@
+import asyncio
+import csv
+import io
+import json
+from typing import Optional
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Field, Session, SQLModel, create_engine, select
+from starlette.background import BackgroundTask
+
+from app.base import db
+from app.base.streaming import csv_response, ndjson_response
+
+ROWS = 2500
+
+
+class StreamItem(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    price: float
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = tmp_path / "stream.db"
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine, tables=[StreamItem.__table__])
+    with Session(engine) as session:
+        session.add_all(StreamItem(name=f"item, {i}", price=i / 4) for i in range(ROWS))
+        session.commit()
+    monkeypatch.setattr(db, "ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{path}")
+    db.dispose_engines()
+    yield engine
+    # The pooled connections belong to the closed event loops of the tests, only forget them
+    db.dispose_engines(close=False)
+    engine.dispose()
+
+
+def make_app(engine):
+    app = FastAPI()
+
+    @app.get("/items.ndjson")
+    async def items_ndjson():
+        return ndjson_response(select(StreamItem).order_by(StreamItem.id), batch_size=1000)
+
+    @app.get("/names.ndjson")
+    async def names_ndjson():
+        return ndjson_response(select(StreamItem.name).order_by(StreamItem.id))
+
+    @app.get("/names.csv")
+    async def names_csv():
+        return csv_response(select(StreamItem.name).order_by(StreamItem.id))
+
+    @app.get("/items.csv")
+    def items_csv():
+        session = Session(engine)
+        response = csv_response(select(StreamItem.id, StreamItem.name).order_by(StreamItem.id),
+                                filename="items.csv", batch_size=500, session=session)
+        response.background = BackgroundTask(session.close)
+        return response
+
+    return app
+
+
+def test_ndjson_export(database):
+    pytest.importorskip("aiosqlite")
+    response = TestClient(make_app(database)).get("/items.ndjson")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert len(lines) == ROWS
+    assert json.loads(lines[-1]) == {"id": ROWS, "name": f"item, {ROWS - 1}", "price": (ROWS - 1) / 4}
+
+
+def test_csv_export_with_sync_session(database):
+    response = TestClient(make_app(database)).get("/items.csv")
+    assert response.headers["content-disposition"] == 'attachment; filename="items.csv"'
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["id", "name"] and rows[1] == ["1", "item, 0"] and len(rows) == ROWS + 1
+
+
+def test_single_column_export(database):
+    pytest.importorskip("aiosqlite")
+    client = TestClient(make_app(database))
+    lines = client.get("/names.ndjson").text.splitlines()
+    assert len(lines) == ROWS and json.loads(lines[0]) == {"name": "item, 0"}
+    rows = list(csv.reader(io.StringIO(client.get("/names.csv").text)))
+    assert rows[:2] == [["name"], ["item, 0"]] and len(rows) == ROWS + 1
+
+
+def test_disconnect_cancels_the_query(database):
+    pytest.importorskip("aiosqlite")
+    app = make_app(database)
+    chunks = []
+    requested = []
+    disconnected = asyncio.Event()
+
+    async def receive():
+        if not requested:
+            requested.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            chunks.append(message["body"])
+            disconnected.set()
+            # A slow client, the next batch is only fetched once this one is sent
+            await asyncio.sleep(0.05)
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": "/items.ndjson", "raw_path": b"/items.ndjson", "root_path": "", "query_string": b"",
+             "headers": [], "client": ("127.0.0.1", 1), "server": ("test", 80)}
+    asyncio.run(app(scope, receive, send))
+    assert len(chunks) == 1 and chunks[0].count(b"\n") == 1000
+    # The cursor was closed and the connection went back to the pool
+    assert db.get_async_engine().pool.checkedout() == 0
@@ -0,0 +1,154 @@
+# Standard library imports
+import math
+import os
+
+# Third-party imports
+import anyio
+from fastapi.dependencies.utils import is_async_gen_callable, is_coroutine_callable
+from fastapi.routing import APIRoute
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Local application imports
+from app.base.logger import logger as _logger
+from app.base.routing_utils.registry import ModuleRecord, ModuleRegistry
+
+ADDON_THREADS_ENABLED = os.environ.get("ADDON_THREADS_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+# Requests of one addon running sync code in the threadpool at once, for addons without a
+# `threadpool` section in their manifest, 0 for no limit
+ADDON_MAX_THREADS = int(os.environ.get("ADDON_MAX_THREADS", 0))
+# Seconds a request waits for a thread of its addon before it is answered 503
+ADDON_THREAD_TIMEOUT = float(os.environ.get("ADDON_THREAD_TIMEOUT", 30))
+
+
+def uses_threadpool(route) -> bool:
+    """ Whether FastAPI runs the endpoint or one of the dependencies of `route` in the threadpool. """
+    if not isinstance(route, APIRoute):
+        return False
+    dependants = [route.dependant]
+    while dependants:
+        dependant = dependants.pop()
+        call = dependant.call
+        if call is not None and not (is_coroutine_callable(call) or is_async_gen_callable(call)):
+            return True
+        dependants.extend(dependant.dependencies)
+    return False
+
+
+def addon_threads(manifest: dict) -> tuple:
+    """
+    The (max_threads, timeout) of an addon, from the `threadpool` section of its manifest:
+
+        'threadpool': {'max_threads': 4, 'timeout': 10}
+
+    `max_threads` is 0 when the addon is not limited.
+    """
+    config = manifest.get('threadpool') or {}
+    return int(config.get('max_threads', ADDON_MAX_THREADS)), float(config.get('timeout', ADDON_THREAD_TIMEOUT))
+
+
+class AddonThreads:
+    """ The threads one addon may use and how they are used. """
+
+    def __init__(self, max_threads: int, timeout: float):
+        self.max_threads = max_threads
+        self.timeout = timeout
+        self.waiting = 0
+        self.timeouts = 0
+        self._limiter = None
+
+    @property
+    def limiter(self) -> anyio.CapacityLimiter:
+        # Created on first use, the limiter needs a running event loop
+        if self._limiter is None:
+            self._limiter = anyio.CapacityLimiter(self.max_threads)
+        return self._limiter
+
+    def stats(self) -> dict:
+        return {
+            'max_threads': self.max_threads,
+            'in_use': self._limiter.borrowed_tokens if self._limiter is not None else 0,
+            'waiting': self.waiting,
+            'timeouts': self.timeouts,
+        }
+
+
+class ThreadLimitedApp:
+    """ Wraps the ASGI app of an addon route running sync code, holds a thread of its addon while it runs. """
+
+    def __init__(self, app: ASGIApp, pool: "AddonThreadPools", technical_name: str, threads: AddonThreads):
+        self.app = app
+        self.pool = pool
+        self.technical_name = technical_name
+        self.threads = threads
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        threads = self.threads
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limiter = threads.limiter
+        # Each request borrows its own token, one task may serve several requests
+        borrower = object()
+        acquired = False
+        threads.waiting += 1
+        try:
+            with anyio.move_on_after(threads.timeout):
+                await limiter.acquire_on_behalf_of(borrower)
+                acquired = True
+        finally:
+            threads.waiting -= 1
+        if not acquired:
+            self.pool.timed_out(self.technical_name, threads)
+            response = JSONResponse({"detail": "Too many requests waiting for this addon"}, status_code=503,
+                                    headers={"Retry-After": str(max(1, math.ceil(threads.timeout)))})
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release_on_behalf_of(borrower)
+
+
+class AddonThreadPools:
+    """
+    Per-addon limits on the threadpool, so the sync handlers of one addon can't take every
+    thread of the worker. Installed as a route layer of the module registry: the routes
+    whose endpoint or dependencies are plain functions hold one of the `max_threads` of
+    their addon while they run, other requests wait for one up to `timeout` seconds and
+    are then answered 503. Routes that are fully async are not wrapped.
+
+    The threads themselves still come from the shared threadpool of anyio, the limits only
+    split it between the addons.
+    """
+
+    def __init__(self, registry: ModuleRegistry, collector=None):
+        self.addons = {}
+        self.collector = collector
+        if collector is not None:
+            collector.describe("app_thread_wait_timeouts_total",
+                               "Requests answered 503 after waiting for a thread of their addon, per addon.")
+        registry.add_route_layer(self._wrap_route)
+
+    def _wrap_route(self, record: ModuleRecord, route):
+        if not hasattr(route, 'app') or not uses_threadpool(route):
+            return
+        name = record.technical_name
+        max_threads, timeout = addon_threads(record.manifest)
+        if max_threads <= 0:
+            return
+        threads = self.addons.get(name)
+        if threads is None or (threads.max_threads, threads.timeout) != (max_threads, timeout):
+            # New limits of a reloaded manifest, requests running now release into the old limiter
+            threads = self.addons[name] = AddonThreads(max_threads, timeout)
+        route.app = ThreadLimitedApp(route.app, self, name, threads)
+
+    def timed_out(self, technical_name: str, threads: AddonThreads):
+        threads.timeouts += 1
+        _logger.warning(f"A request of '{technical_name}' waited {threads.timeout}s for one of its "
+                        f"{threads.max_threads} threads")
+        if self.collector is not None:
+            self.collector.increment("app_thread_wait_timeouts_total", addon=technical_name)
+
+    def stats(self) -> dict:
+        return {name: threads.stats() for name, threads in self.addons.items()}
@@ -1,12 +1,16 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
-import importlib
-import sys
-import os
+from fastapi import Request
+import logging
 
 from .logger import logger as _logger
 
     
 async def log_request_info(request: Request):
+    """
+    Debug dump of a request. Request logging is done by RequestLoggingMiddleware,
+    this dependency is kept for addons that still list it.
+    """
+    if not _logger.isEnabledFor(logging.DEBUG):
+        return
     _logger.debug(
         f"{request.method} request to {request.url} metadata\n"
         f"\tHeaders: {request.headers}\n"
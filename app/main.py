@@ -1,29 +1,28 @@
+# Started first so the startup profile sees every import
+from app.base.startup import startup_profile
+startup_profile.start()
+
+import os
+
 from fastapi.applications import FastAPI
-from starlette.routing import BaseRoute
-from app.base.logger import logger as _logger
+from app.base.logger import logger as _logger, pipeline as log_pipeline
 from app.base.api_init import FastAPIWrapper
+from app.base.metrics import collector as metrics_collector
+from app.base.profiler import profiler
+from app.base.loop_lag import loop_lag
+from app.base.static_pages import StaticPage
+from app.base.settings import settings
 
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
-
-from fastapi.responses import JSONResponse
-from fastapi import Request, HTTPException
-from fastapi.routing import APIRoute
+from fastapi.responses import HTMLResponse, PlainTextResponse
+from fastapi import HTTPException, Request
 
 # Initialize the wrapper
 wrapper = FastAPIWrapper()
 app: FastAPI = wrapper.fastapi_app  
 
 loaded_modules = wrapper.routing.modules
-available_modules = wrapper.routing.modules
-deactivated = []
 
-@app.get("/", response_class=HTMLResponse)
-def root():
-    """
-    Root get will return a basic website to serve the auto generated docs
-    """
-    return f"""
+LANDING_PAGE = """
             <!DOCTYPE html>
             <html>
             <head>
@@ -52,6 +51,16 @@ def root():
             </html>
     """
 
+landing_page = StaticPage(lambda root_path: LANDING_PAGE)
+
+
+@app.get("/", response_class=HTMLResponse)
+async def root(request: Request):
+    """
+    Root get will return a basic website to serve the auto generated docs
+    """
+    return landing_page.response(request)
+
 
 @app.delete("/remove-module")
 async def remove_module(technical_name: str):
@@ -66,8 +75,9 @@ async def remove_module(technical_name: str):
     """
     try:
         _logger.info(f"Remove module from technical_name: {technical_name}")
-        rec = wrapper.routing.remove_module(app, technical_name,loaded_modules)
-        app.openapi_schema = None
+        rec = wrapper.routing.remove_module(app, technical_name)
+        if wrapper.module_sync is not None:
+            wrapper.module_sync.publish(technical_name, active=False)
 
         return rec
     except Exception as e:
@@ -85,26 +95,138 @@ def enable_module(technical_name: str):
     """
     try:
         _logger.info(f"Enabling module from technical_name: {technical_name}")
-        wrapper.routing.enable_module(app, technical_name)
-        app.openapi_schema = None
+        rec = wrapper.routing.enable_module(app, technical_name)
+        if wrapper.module_sync is not None:
+            wrapper.module_sync.publish(technical_name, active=True)
 
-        return {"status": "success", "message": f"Module at '{technical_name}' has been enabled."}
+        return {"status": "success", "message": f"Module at '{technical_name}' has been enabled.", **rec}
     except Exception as e:
         _logger.error(f"Failed to enable module at '{technical_name}': {e}")
         return {"status": "error", "message": str(e)}
 
+def _profiled_addon(technical_name: str):
+    record = loaded_modules.get(technical_name)
+    if record is None or not record.active:
+        raise HTTPException(status_code=404, detail=f"Module '{technical_name}' is not enabled")
+    return record, os.path.join(wrapper.routing.index.addons_dir, technical_name)
+
+def _profile_response(session) -> PlainTextResponse:
+    return PlainTextResponse(session.collapsed(), headers={
+        "X-Profile-Worker": str(os.getpid()),
+        "X-Profile-Samples": str(session.samples),
+    })
+
+@app.post("/profile", response_class=PlainTextResponse)
+async def profile_worker(seconds: float = 5, technical_name: str = None, idle: bool = False):
+    """
+    Sample the stacks of the worker answering this request for `seconds` and return them
+    in the collapsed format read by flamegraph.pl and speedscope.
+
+    Args:
+        seconds (float): Duration of the profile.
+        technical_name (str): Only keep the stacks running code of this addon.
+        idle (bool): Also keep the samples of threads that are only waiting.
+    """
+    addon_dir = _profiled_addon(technical_name)[1] if technical_name else None
+    return _profile_response(await profiler.run(seconds, addon_dir=addon_dir, idle=idle))
+
+@app.post("/profile/requests", response_class=PlainTextResponse)
+async def profile_requests(technical_name: str, seconds: float = 5):
+    """
+    Like /profile, but only sample the requests to the routes of one addon.
+    """
+    record, addon_dir = _profiled_addon(technical_name)
+    return _profile_response(await profiler.run(seconds, addon_dir=addon_dir, routes=list(record.routes)))
+
 @app.get("/routes/reload-docs")
 async def reload_docs():
-    app.openapi_schema = None  # Clear the cached schema
+    wrapper.openapi_cache.invalidate()  # Clear every cached schema fragment
     return {"message": "OpenAPI schema reloaded"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """ Size and hit counts of the response cache of addon routes. """
+    if wrapper.response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **wrapper.response_cache.store.stats()}
+
+@app.post("/cache/invalidate")
+async def cache_invalidate(technical_name: str = None):
+    """ Drop the cached responses of one module, or of every module when no name is given. """
+    if wrapper.response_cache is not None:
+        wrapper.response_cache.invalidate(technical_name)
+    return {"message": f"Response cache cleared for {technical_name or 'all modules'}"}
+
+@app.get("/single-flight/stats")
+async def single_flight_stats():
+    """ Executions, coalesced requests, timeouts and errors of every coalesced route. """
+    if wrapper.single_flight is None:
+        return {"enabled": False}
+    return {"enabled": True, "routes": wrapper.single_flight.stats_by_route()}
+
+@app.get("/rate-limit/stats")
+async def rate_limit_stats():
+    """ Requests in flight, event loop lag, and requests rejected (429) or shed (503) by this worker. """
+    if wrapper.rate_limiter is None:
+        return {"enabled": False}
+    return {"enabled": True, **wrapper.load_shedder.stats(), **wrapper.rate_limiter.counts}
+
+@app.get("/loop/stats")
+async def loop_stats():
+    """ Event loop lag, and the times an addon blocked the loop of this worker with its last stalls. """
+    if wrapper.blocking_detector is None:
+        return {"enabled": False, **loop_lag.stats()}
+    return {"enabled": True, **loop_lag.stats(), **wrapper.blocking_detector.stats()}
+
+@app.get("/threadpool/stats")
+async def threadpool_stats():
+    """ Threads used and awaited by the addons with a thread limit in this worker. """
+    if wrapper.addon_threads is None:
+        return {"enabled": False}
+    return {"enabled": True, "addons": wrapper.addon_threads.stats()}
+
+@app.post("/settings/reload")
+def reload_settings():
+    """ Re-read the settings files that changed, like SIGHUP does. Returns the namespaces that changed. """
+    return {"changed": settings.reload()}
+
+@app.post("/module/rebuild-index")
+def rebuild_index():
+    """
+    Re-parse every addon manifest and rewrite the on-disk addon index.
+    Takes effect for the routes on the next startup or module enable.
+    """
+    entries = wrapper.routing.index.rebuild()
+    return {
+        "status": "success",
+        "addons": [entry['technical_name'] for entry in entries],
+        "index_path": wrapper.routing.index.index_path,
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Request count, errors and latency per addon route, and log queue metrics, in the
+    Prometheus text format. Summed over all workers when METRICS_DIR is set.
+    """
+    return metrics_collector.render_prometheus()
+
+@app.get("/logging/metrics")
+async def logging_metrics():
+    """
+    Records waiting in this worker's log queue and records dropped because it was full.
+    """
+    return log_pipeline.metrics()
+
 @app.get("/module/get_loaded_modules")
 async def get_loaded_modules() -> list:
-    return loaded_modules
+    return loaded_modules.manifests()
 
 @app.get("/module/get_module")
-async def get_module(name : str):
-    if len([module for module in loaded_modules if module['name'] == name]) != 0:
-        return [module for module in loaded_modules if module['name'] == name][0]
+def get_module(name : str):
+    # Sync, the stats are read from the metrics files of every worker
+    record = loaded_modules.get_by_name(name)
+    if record is not None:
+        return {**record.as_dict(), 'stats': metrics_collector.module_stats(record.technical_name)}
     raise HTTPException(status_code=404, detail="Module not found")
     
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Per-request cost of token authentication.
+
+`verify` is timed on its own with a cold cache (signature checked every time) and a warm
+one, then requests go through the ASGI interface of an app with the same route without
+authentication, with `require_token` and a warm cache, and with the cache disabled.
+Finally concurrent logins run next to a ticker task, to show the event loop keeps running
+while scrypt hashes in the threadpool (the largest gap between two ticks is reported).
+
+    python -m benchmarks.bench_auth [--requests 5000] [--logins 20]
+"""
+# Standard library imports
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+# Third-party imports
+from fastapi import APIRouter, FastAPI
+
+# Local application imports
+from app.base.auth import auth, passwords
+from app.base.auth.tokens import RevocationList, TokenService, VerifiedTokenCache
+from benchmarks.bench_suite import asgi_request
+
+
+def time_verify(service: TokenService, tokens: list, repeat: int) -> float:
+    """ Mean microseconds per `verify`. """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for token in tokens:
+            service.verify(token)
+    return (time.perf_counter() - start) / (repeat * len(tokens)) * 1e6
+
+
+def build_app() -> FastAPI:
+    app = FastAPI(openapi_url=None)
+    app.include_router(auth.router, prefix="/auth")
+    for prefix, dependencies in (("/open", []), ("/private", [auth.require_token])):
+        router = APIRouter(prefix=prefix, dependencies=dependencies)
+
+        @router.get("/items/{item_id}", name=f"{prefix[1:]}_item")
+        async def item(item_id: int):
+            return {"id": item_id}
+
+        app.include_router(router)
+    return app
+
+
+async def time_requests(app: FastAPI, path: str, token: str, requests: int) -> float:
+    """ Median microseconds per request. """
+    headers = ((b"authorization", f"Bearer {token}".encode()),)
+    samples = []
+    for i in range(requests):
+        start = time.perf_counter()
+        status, _ = await asgi_request(app, "GET", f"{path}/{i}", headers=headers)
+        samples.append(time.perf_counter() - start)
+        assert status == 200, status
+    return statistics.median(samples) * 1e6
+
+
+async def concurrent_logins(app: FastAPI, logins: int) -> dict:
+    body = json.dumps({"hostname": "bench", "username": "bench", "password": "bench"}).encode()
+    headers = ((b"content-type", b"application/json"),)
+    gaps = []
+    done = asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    async def login():
+        status, _ = await asgi_request(app, "POST", "/auth/login", body=body, headers=headers)
+        assert status == 200, status
+
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    return {'logins_per_s': round(logins / elapsed, 1), 'max_loop_gap_ms': round(max(gaps) * 1000, 2)}
+
+
+def run(requests: int = 5000, logins: int = 20) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="bench_auth_")
+    users_path = os.path.join(work_dir, 'users.json')
+    with open(users_path, 'w') as f:
+        json.dump({"bench": {"password_hash": passwords.hash_password("bench")}}, f)
+    auth.users = passwords.UserStore(users_path)
+
+    results = {}
+    cold = TokenService(b"bench", cache=VerifiedTokenCache(max_size=0), revocations=RevocationList(None))
+    warm = TokenService(b"bench", revocations=RevocationList(None))
+    tokens = [warm.issue(f"user{i}")[0] for i in range(100)]
+    results['verify_cold_us'] = round(time_verify(cold, tokens, requests // 100), 2)
+    time_verify(warm, tokens, 1)
+    results['verify_cached_us'] = round(time_verify(warm, tokens, requests // 100), 2)
+
+    app = build_app()
+    for name, service in (('warm_cache', warm), ('no_cache', cold)):
+        auth.token_service = service
+        token = tokens[0]
+        asyncio.run(time_requests(app, "/private/items", token, 50))
+        results[f'request_open_us'] = round(asyncio.run(time_requests(app, "/open/items", token, requests)), 1)
+        results[f'request_token_{name}_us'] = round(
+            asyncio.run(time_requests(app, "/private/items", token, requests)), 1)
+    results['auth_overhead_us'] = round(results['request_token_warm_cache_us'] - results['request_open_us'], 1)
+    results.update(asyncio.run(concurrent_logins(app, logins)))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--logins', type=int, default=20)
+    args = parser.parse_args()
+    for key, value in run(args.requests, args.logins).items():
+        print(f"{key:32} {value}")
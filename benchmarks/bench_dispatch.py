@@ -0,0 +1,81 @@
+"""
+Dispatch latency of the linear Starlette router against the radix tree dispatcher.
+
+Each app has N addon-style routes (`/modX/routeY/{item_id}`), the request targets the
+last registered route, which is the worst case for the linear scan. Only routing is
+measured: requests go straight to `app.router` with a trivial endpoint.
+
+    python -m benchmarks.bench_dispatch [--sizes 100 1000 10000] [--requests 2000]
+"""
+# Standard library imports
+import argparse
+import asyncio
+import time
+
+# Third-party imports
+from fastapi import FastAPI
+from starlette.responses import Response
+from starlette.routing import Route
+
+# Local application imports
+from app.base.routing_utils.radix import RadixDispatcher
+
+ROUTES_PER_MODULE = 10
+
+
+async def endpoint(request):
+    return Response(b"")
+
+
+def build_app(size: int, radix: bool) -> FastAPI:
+    app = FastAPI(openapi_url=None)
+    routes = list(app.router.routes)
+    for i in range(size):
+        routes.append(Route(f"/mod{i // ROUTES_PER_MODULE}/route{i % ROUTES_PER_MODULE}/{{item_id}}", endpoint))
+    app.router.routes = routes
+    if radix:
+        RadixDispatcher.install(app)
+    return app
+
+
+async def dispatch(app: FastAPI, path: str, requests: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def make_scope():
+        return {
+            "type": "http", "method": "GET", "path": path, "root_path": "", "scheme": "http",
+            "query_string": b"", "headers": [], "server": ("test", 80),
+        }
+
+    # Warm up, the radix tree is built on the first request
+    await app.router(make_scope(), receive, send)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app.router(make_scope(), receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def run(sizes=(100, 1000, 10000), requests: int = 2000) -> dict:
+    results = {}
+    for size in sizes:
+        last = size - 1
+        path = f"/mod{last // ROUTES_PER_MODULE}/route{last % ROUTES_PER_MODULE}/42"
+        results[size] = {
+            mode: round(asyncio.run(dispatch(build_app(size, mode == 'radix'), path, requests)), 2)
+            for mode in ('linear', 'radix')
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    print(f"{'routes':>8} {'linear us/req':>14} {'radix us/req':>13}")
+    for size, result in run(args.sizes, args.requests).items():
+        print(f"{size:>8} {result['linear']:>14} {result['radix']:>13}")
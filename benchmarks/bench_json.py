@@ -0,0 +1,110 @@
+"""
+Cost of serializing addon responses in the standard and the fast JSON mode.
+
+List payloads of about 1 KB, 100 KB and 10 MB are returned by two routes, one with a
+response model returning model instances, one returning plain dicts without a model.
+Each is requested through the ASGI interface of an app in each mode: the median time
+per request gives the throughput, and one more request under tracemalloc gives the peak
+memory allocated while it was served.
+
+    python -m benchmarks.bench_json [--sizes 1 100 10000] [--seconds 1]
+"""
+# Standard library imports
+import argparse
+import asyncio
+import datetime
+import statistics
+import time
+import tracemalloc
+
+# Third-party imports
+from fastapi import APIRouter, FastAPI
+from pydantic import BaseModel
+
+# Local application imports
+from app.base.routing_utils.registry import ModuleRegistry
+from app.base.serialization import FastJSON, orjson
+from benchmarks.bench_suite import asgi_request
+
+
+class Record(BaseModel):
+    id: int
+    name: str
+    price: float
+    tags: list[str]
+    created: datetime.datetime
+    active: bool
+
+
+def records(size_kb: int) -> list:
+    """ About `size_kb` KB of JSON, a record encodes to ~130 bytes. """
+    created = datetime.datetime(2024, 1, 1, 12, 30)
+    return [Record(id=i, name=f"record number {i}", price=i * 1.25, tags=["alpha", "beta"],
+                   created=created, active=i % 2 == 0) for i in range(max(1, size_kb * 1024 // 130))]
+
+
+def build_app(mode: str, payload: list) -> FastAPI:
+    app = FastAPI(openapi_url=None)
+    dicts = [record.model_dump() for record in payload]
+    router = APIRouter(prefix="/bench")
+
+    @router.get("/models", response_model=list[Record])
+    async def bench_models():
+        return payload
+
+    @router.get("/dicts")
+    async def bench_dicts():
+        return dicts
+
+    staging = APIRouter()
+    staging.include_router(router)
+    registry = ModuleRegistry()
+    FastJSON(registry, default_mode=mode)
+    registry.add_routes(app, registry.register({'technical_name': 'bench'}), staging.routes)
+    return app
+
+
+async def time_route(app: FastAPI, path: str, seconds: float) -> dict:
+    samples = []
+    size = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline or len(samples) < 3:
+        start = time.perf_counter()
+        status, body = await asgi_request(app, "GET", path)
+        samples.append(time.perf_counter() - start)
+        assert status == 200, status
+        size = len(body)
+    tracemalloc.start()
+    await asgi_request(app, "GET", path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    median = statistics.median(samples)
+    return {
+        'body_kb': round(size / 1024, 1),
+        'req_per_s': round(1 / median, 1),
+        'mb_per_s': round(size / median / 1e6, 1),
+        'peak_alloc_kb': round(peak / 1024, 1),
+    }
+
+
+def run(sizes=(1, 100, 10000), seconds: float = 1.0) -> dict:
+    results = {}
+    for size_kb in sizes:
+        payload = records(size_kb)
+        for mode in ('standard', 'fast'):
+            app = build_app(mode, payload)
+            for path in ('/bench/models', '/bench/dicts'):
+                key = f"{size_kb}KB {path.rsplit('/', 1)[1]:6} {mode}"
+                results[key] = asyncio.run(time_route(app, path, seconds))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='*', default=[1, 100, 10000], help="Payload sizes in KB")
+    parser.add_argument('--seconds', type=float, default=1.0, help="Time spent on each route and mode")
+    args = parser.parse_args()
+    print(f"orjson: {'yes' if orjson is not None else 'no, json module'}")
+    print(f"{'payload':28} {'body_kb':>9} {'req/s':>9} {'MB/s':>7} {'peak_alloc_kb':>14}")
+    for key, value in run(args.sizes, args.seconds).items():
+        print(f"{key:28} {value['body_kb']:9} {value['req_per_s']:9} {value['mb_per_s']:7} {value['peak_alloc_kb']:14}")
@@ -0,0 +1,129 @@
+"""
+Memory of the gunicorn workers with and without GUNICORN_PRELOAD.
+
+Starts the app under gunicorn with UvicornWorker twice, once importing it in every worker
+and once preloading it in the master (see gunicorn.conf.py), sends a few requests to
+every worker and reads RSS, PSS and the shared/private split of the master and each
+worker from /proc/<pid>/smaps_rollup. PSS divides shared pages between the processes
+sharing them, so its sum is what the server really costs. Linux only.
+
+    python -m benchmarks.bench_memory [--workers 3] [--requests 50] [--json results.json]
+"""
+# Standard library imports
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def memory_of(pid: int) -> dict:
+    """ The smaps_rollup fields of a process, in KiB. """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in FIELDS:
+                values[name] = int(rest.split()[0])
+    return values
+
+
+def children_of(pid: int) -> list:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def wait_ready(port: int, master: int, workers: int, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if len(children_of(master)) == workers:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1).read()
+                return
+            except OSError:
+                pass
+        time.sleep(0.2)
+    raise RuntimeError(f"gunicorn did not start {workers} workers within {timeout}s")
+
+
+def measure(preload: bool, workers: int, requests: int) -> dict:
+    port = free_port()
+    env = {
+        **os.environ,
+        "GUNICORN_PRELOAD": "true" if preload else "false",
+        "LOG_SINK": "stderr",
+        "METRICS_DIR": "",
+    }
+    command = [
+        sys.executable, "-m", "gunicorn", "app.main:app",
+        "-c", os.path.join(ROOT_DIR, "gunicorn.conf.py"),
+        "--workers", str(workers),
+        "--worker-class", "uvicorn.workers.UvicornWorker",
+        "--bind", f"127.0.0.1:{port}",
+        "--log-level", "warning",
+    ]
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT_DIR, env=env, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port, server.pid, workers)
+        boot = time.perf_counter() - started
+        # Several connections, so the requests are spread over the workers
+        for _ in range(requests):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/module/get_loaded_modules", timeout=5).read()
+        master = memory_of(server.pid)
+        worker_memory = [memory_of(pid) for pid in children_of(server.pid)]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    return {
+        'preload': preload,
+        'boot_s': round(boot, 3),
+        'master': master,
+        'workers': worker_memory,
+        'total_pss_kib': master['Pss'] + sum(worker['Pss'] for worker in worker_memory),
+    }
+
+
+def report(result: dict):
+    mode = "preload" if result['preload'] else "per-worker import"
+    print(f"\n{mode}: boot {result['boot_s']}s, total PSS {result['total_pss_kib'] / 1024:.1f} MiB")
+    print(f"{'process':<10}" + "".join(f"{field:>15}" for field in FIELDS))
+    rows = [('master', result['master'])] + [(f"worker {i}", worker) for i, worker in enumerate(result['workers'])]
+    for name, values in rows:
+        print(f"{name:<10}" + "".join(f"{values.get(field, 0) / 1024:>12.1f}MiB" for field in FIELDS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = [measure(preload, args.workers, args.requests) for preload in (False, True)]
+    for result in results:
+        report(result)
+    without, with_preload = results
+    saved = without['total_pss_kib'] - with_preload['total_pss_kib']
+    print(f"\nPreload saves {saved / 1024:.1f} MiB PSS over {args.workers} workers")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
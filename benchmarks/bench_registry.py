@@ -0,0 +1,109 @@
+"""
+Remove/enable latency of a module with 10k registered routes.
+
+Compares the ModuleRegistry against the previous linear scan, which looked up every
+route of the module in `app.router.routes` by path and `ast.literal_eval`-ed methods.
+
+    python -m benchmarks.bench_registry [--modules 100] [--routes 100] [--repeat 20]
+"""
+# Standard library imports
+import argparse
+import ast
+import statistics
+import time
+
+# Third-party imports
+from fastapi import APIRouter, FastAPI
+from fastapi.routing import APIRoute
+
+# Local application imports
+from app.base.routing_utils.registry import ModuleRegistry
+
+
+def build_app(modules: int, routes_per_module: int):
+    app = FastAPI()
+    registry = ModuleRegistry()
+    legacy_manifests = []
+
+    async def endpoint():
+        return {}
+
+    for m in range(modules):
+        router = APIRouter(prefix=f"/mod{m}")
+        for r in range(routes_per_module):
+            router.add_api_route(f"/route{r}/{{item_id}}", endpoint, methods=["GET"], name=f"mod{m}_route{r}")
+        staging = APIRouter()
+        staging.include_router(router)
+        record = registry.register({'technical_name': f"mod{m}", 'name': f"Module {m}"})
+        registry.add_routes(app, record, staging.routes)
+        legacy_manifests.append({
+            'technical_name': f"mod{m}",
+            'routes': [{route.path: {'path': route.path, 'methods': str(route.methods)}} for route in staging.routes],
+        })
+    return app, registry, legacy_manifests
+
+
+def legacy_remove(app: FastAPI, technical_name: str, loaded_modules: list):
+    """ The removal algorithm used before the registry, kept for comparison. """
+    module = next(module for module in loaded_modules if module['technical_name'] == technical_name)
+    removed = []
+    for route_entry in module['routes']:
+        _, details = next(iter(route_entry.items()))
+        methods = set(ast.literal_eval(details['methods']))
+        route = next(
+            (r for r in app.router.routes
+             if isinstance(r, APIRoute) and r.path == details['path'] and methods.issubset(r.methods)),
+            None,
+        )
+        if route:
+            app.router.routes.remove(route)
+            removed.append(route)
+    return removed
+
+
+def run(modules: int = 100, routes_per_module: int = 100, repeat: int = 20) -> dict:
+    app, registry, legacy_manifests = build_app(modules, routes_per_module)
+    target = f"mod{modules // 2}"
+
+    remove_samples = []
+    enable_samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        registry.remove(app, target)
+        remove_samples.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        registry.enable(app, target)
+        enable_samples.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        registry.get_by_name(f"Module {modules // 2}")
+    lookup_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    # Legacy removal only runs a few times, every run re-adds the routes at the end
+    legacy_samples = []
+    record = registry.get(target)
+    for _ in range(min(repeat, 3)):
+        start = time.perf_counter()
+        legacy_remove(app, target, legacy_manifests)
+        legacy_samples.append((time.perf_counter() - start) * 1000)
+        app.router.routes.extend(record.routes)
+
+    return {
+        'routes': len(app.router.routes),
+        'module_routes': routes_per_module,
+        'registry_remove_ms': round(statistics.median(remove_samples), 3),
+        'registry_enable_ms': round(statistics.median(enable_samples), 3),
+        'registry_lookup_ms': round(lookup_ms, 5),
+        'legacy_remove_ms': round(statistics.median(legacy_samples), 3),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modules', type=int, default=100)
+    parser.add_argument('--routes', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    for key, value in run(args.modules, args.routes, args.repeat).items():
+        print(f"{key:32} {value}")
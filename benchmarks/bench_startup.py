@@ -0,0 +1,79 @@
+"""
+Cold start of a worker: time to import `app.main` and time to the first answered request.
+
+`import` runs `python -c "import app.main"` in a fresh interpreter. `first request`
+starts uvicorn with the app and polls it until GET / answers, which is what a gunicorn
+worker pays after every (re)spawn. Both are repeated and the median is reported.
+
+    python -m benchmarks.bench_startup [--runs 5] [--json results.json]
+"""
+# Standard library imports
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV = {**os.environ, "LOG_SINK": "stderr", "LOG_LEVEL": "WARNING"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_import() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app.main"], cwd=ROOT_DIR, env=ENV, check=True,
+                   stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def time_first_request(timeout: float = 30) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=ENV, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1).read()
+                return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError(f"No answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    # One unmeasured run so every run finds the bytecode and addon index caches warm
+    time_import()
+    results = {
+        'import_ms': [round(time_import() * 1000, 1) for _ in range(args.runs)],
+        'first_request_ms': [round(time_first_request() * 1000, 1) for _ in range(args.runs)],
+    }
+    for name, values in results.items():
+        print(f"{name:<18} median {statistics.median(values):8.1f}  min {min(values):8.1f}  runs {values}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({name: {'median': statistics.median(values), 'runs': values} for name, values in results.items()},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
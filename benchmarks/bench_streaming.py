@@ -0,0 +1,114 @@
+"""
+Memory and time of exporting a table as one JSON list and as a streamed NDJSON response.
+
+A SQLite table of `rows` rows is exported through the ASGI interface of an app: once by
+a route loading every row with the session and returning the list, once by
+`ndjson_response` on a server-side cursor. The peak memory allocated while serving is
+measured with tracemalloc, the body is counted and dropped as it arrives, like a client
+writing it to disk would.
+
+    python -m benchmarks.bench_streaming [--rows 10000 100000] [--batch-size 1000]
+"""
+# Standard library imports
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Optional
+
+# Third-party imports
+from fastapi import FastAPI
+from sqlmodel import Field, Session, SQLModel, create_engine, insert, select
+
+# Local application imports
+from app.base import db
+from app.base.streaming import ndjson_response
+
+
+class ExportRow(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    description: str
+    price: float
+
+
+def build_database(path: str, rows: int):
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine, tables=[ExportRow.__table__])
+    with Session(engine) as session:
+        for start in range(0, rows, 10000):
+            session.execute(insert(ExportRow), [
+                {"name": f"row {i}", "description": "x" * 100, "price": i / 4}
+                for i in range(start, min(rows, start + 10000))
+            ])
+        session.commit()
+    return engine
+
+
+def build_app(engine, batch_size: int) -> FastAPI:
+    app = FastAPI(openapi_url=None)
+
+    @app.get("/list")
+    def export_list():
+        with Session(engine) as session:
+            return session.exec(select(ExportRow)).all()
+
+    @app.get("/stream")
+    async def export_stream():
+        return ndjson_response(select(ExportRow), batch_size=batch_size)
+
+    return app
+
+
+async def measure(app: FastAPI, path: str) -> dict:
+    size = 0
+    done = asyncio.Event()
+
+    async def receive():
+        if not done.is_set():
+            done.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+             "headers": [], "client": ("127.0.0.1", 1), "server": ("bench", 80)}
+    tracemalloc.start()
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'body_mb': round(size / 1e6, 1), 'seconds': round(elapsed, 2), 'peak_alloc_mb': round(peak / 1e6, 1)}
+
+
+def run(rows=(10000, 100000), batch_size: int = 1000) -> dict:
+    results = {}
+    for count in rows:
+        path = os.path.join(tempfile.mkdtemp(prefix="bench_streaming_"), "export.db")
+        engine = build_database(path, count)
+        db.ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{path}"
+        db.dispose_engines(close=False)
+        app = build_app(engine, batch_size)
+        for route in ('list', 'stream'):
+            results[f"{count} rows {route}"] = asyncio.run(measure(app, f"/{route}"))
+        db.dispose_engines(close=False)
+        engine.dispose()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='*', default=[10000, 100000])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    print(f"{'export':22} {'body_mb':>8} {'seconds':>8} {'peak_alloc_mb':>14}")
+    for key, value in run(args.rows, args.batch_size).items():
+        print(f"{key:22} {value['body_mb']:8} {value['seconds']:8} {value['peak_alloc_mb']:14}")
@@ -0,0 +1,386 @@
+"""
+Benchmark suite of the framework's hot paths, with JSON baselines to catch regressions.
+
+Requests go through the ASGI interface of the app in this process, no server and no
+network: addon routes (async and sync endpoints), POST /auth/login, /openapi.json served
+from the cache and regenerated, /remove-module and /enable-module. Each scenario reports
+requests per second and p50/p99 latency. The app serves a synthetic addon tree written to
+a temporary directory and passed with ADDONS_PATH.
+
+Cold startup is measured in fresh interpreters for trees of several sizes: the time to
+import `app.main` and to answer the first request, the first run with an empty addon
+index and the median of the others with the index built.
+
+    python -m benchmarks.bench_suite [--modules 100] [--sizes 10 100 1000] [--requests 2000]
+        [--concurrency 16] [--save benchmarks/baselines/suite.json] [--compare benchmarks/baselines/suite.json]
+
+`--compare` prints the change of every metric against the baseline and exits with 1 when
+one got worse by more than `--tolerance` (0.25 by default, timings are noisy).
+"""
+# Standard library imports
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# The app reads ADDONS_PATH and friends when imported, app.main is only imported by
+# `run_http` once the environment points at the synthetic tree
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTES_PER_MODULE = 3
+# Every tenth module is a base the next nine depend on, so the load order has levels
+DEPENDENCY_STRIDE = 10
+
+MANIFEST = """{
+    'name': 'Synthetic %(index)d',
+    'version': '1.0.0',
+    'description': 'Generated by benchmarks.bench_suite',
+    'depends': %(depends)r,
+    'installable': True,
+}
+"""
+
+ROUTE = """
+from fastapi.routing import APIRouter
+from pydantic import BaseModel
+
+router = APIRouter(prefix="/%(name)s", tags=["%(name)s"])
+dependency = []
+
+
+class Item(BaseModel):
+    name: str
+    quantity: int = 1
+
+
+@router.get("/items/{item_id}")
+async def %(name)s_get_item(item_id: int, detail: bool = False):
+    return {"id": item_id, "module": "%(name)s", "detail": detail}
+
+
+@router.post("/items")
+async def %(name)s_create_item(item: Item):
+    return {"module": "%(name)s", **item.model_dump()}
+
+
+@router.get("/status")
+def %(name)s_status():
+    return {"module": "%(name)s", "ok": True}
+"""
+
+STARTUP_SCRIPT = """
+import asyncio, json, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+from benchmarks.bench_suite import asgi_request
+status, _ = asyncio.run(asgi_request(app.main.app, "GET", "/synth_0/items/1"))
+assert status == 200, status
+print(json.dumps({"import_ms": (imported - start) * 1000, "first_request_ms": (time.perf_counter() - start) * 1000}))
+"""
+
+
+def synthetic_addons(addons_dir: str, modules: int):
+    """ Write `modules` addons named synth_<i> with ROUTES_PER_MODULE routes each. """
+    for i in range(modules):
+        name = f"synth_{i}"
+        routes_dir = os.path.join(addons_dir, name, 'routes')
+        os.makedirs(routes_dir, exist_ok=True)
+        depends = [] if i % DEPENDENCY_STRIDE == 0 else [f"synth_{i - i % DEPENDENCY_STRIDE}"]
+        with open(os.path.join(addons_dir, name, '__manifest__.py'), 'w') as f:
+            f.write(MANIFEST % {'index': i, 'depends': depends})
+        with open(os.path.join(routes_dir, 'route.py'), 'w') as f:
+            f.write(ROUTE % {'name': name})
+
+
+def bench_env(work_dir: str, addons_dir: str) -> dict:
+    """ Environment of the benchmarked app, everything it writes stays in `work_dir`. """
+    return {
+        "ADDONS_PATH": addons_dir,
+        "ADDONS_INDEX_PATH": os.path.join(work_dir, 'addons_index.json'),
+        "ADDONS_LOAD_REPORT": os.path.join(work_dir, 'addon_load_report.json'),
+        "LOG_DIR": os.path.join(work_dir, 'logs'),
+        "METRICS_DIR": "",
+        "AUTH_USERS_PATH": os.path.join(work_dir, 'users.json'),
+        "AUTH_SECRET_PATH": os.path.join(work_dir, 'auth_secret'),
+        "AUTH_REVOCATION_PATH": os.path.join(work_dir, 'revoked_tokens.json'),
+        # One process, there is no other worker to share module changes with
+        "MODULE_SYNC_ENABLED": "false",
+        # The clients run on the event loop of the app, which then always looks late
+        "SHED_MAX_LAG": "0",
+    }
+
+
+async def asgi_request(app, method: str, path: str, query: bytes = b"", body: bytes = b"", headers=()):
+    """
+    Send one request to an ASGI app.
+
+    Returns:
+        tuple: The status code and the response body.
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query,
+        "headers": [(b"host", b"bench"), (b"content-length", str(len(body)).encode()), *headers],
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+    request_sent = False
+    response = {"status": None, "body": []}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Nothing more to read, wait like a connection that stays open
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], b"".join(response["body"])
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+def summary(latencies: list, elapsed: float, concurrency: int) -> dict:
+    return {
+        'requests': len(latencies),
+        'concurrency': concurrency,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+    }
+
+
+async def load(app, make_request, requests: int, concurrency: int, before=None) -> dict:
+    """
+    Send `requests` requests from `concurrency` concurrent clients.
+
+    Args:
+        make_request (callable): Returns the (method, path, query, body, headers) of the i-th request.
+        before (callable): Called before every request, outside the measured time.
+    """
+    latencies = []
+    counter = iter(range(requests))
+
+    async def client():
+        for i in counter:
+            if before is not None:
+                before()
+            method, path, query, body, headers = make_request(i)
+            start = time.perf_counter()
+            status, _ = await asgi_request(app, method, path, query, body, headers)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                raise RuntimeError(f"{method} {path} answered {status}")
+
+    # Warm up every code path (lazy imports, caches built on the first request) before measuring
+    for i in range(min(requests, 20)):
+        if before is not None:
+            before()
+        await asgi_request(app, *make_request(i))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summary(latencies, time.perf_counter() - start, concurrency)
+
+
+async def module_toggle(app, technical_name: str, repeat: int) -> dict:
+    """ Alternate /remove-module and /enable-module of one module, one request at a time. """
+    query = f"technical_name={technical_name}".encode()
+    timings = {'remove_module': [], 'enable_module': []}
+    for _ in range(repeat):
+        for name, method, path in (('remove_module', "DELETE", "/remove-module"),
+                                   ('enable_module', "POST", "/enable-module")):
+            start = time.perf_counter()
+            status, body = await asgi_request(app, method, path, query)
+            timings[name].append(time.perf_counter() - start)
+            if status != 200 or json.loads(body).get('status') == 'error':
+                raise RuntimeError(f"{method} {path} failed: {body[:200]}")
+    return {name: summary(values, sum(values), 1) for name, values in timings.items()}
+
+
+def run_http(modules: int, requests: int, concurrency: int) -> dict:
+    # Local application imports, the environment is set by the caller
+    import app.main as main
+    from app.base.auth import passwords
+
+    app = main.app
+    target = f"synth_{modules // 2}"
+    login = json.dumps({"hostname": "bench", "username": "bench", "password": "bench"}).encode()
+    item = json.dumps({"name": "bench", "quantity": 3}).encode()
+    json_headers = ((b"content-type", b"application/json"),)
+
+    def route(i):
+        return "GET", f"/synth_{i % modules}/items/{i}", b"detail=true", b"", ()
+
+    scenarios = {
+        'addon_get_async': (route, None),
+        'addon_get_sync': (lambda i: ("GET", f"/synth_{i % modules}/status", b"", b"", ()), None),
+        'addon_post_body': (lambda i: ("POST", f"/synth_{i % modules}/items", b"", item, json_headers), None),
+        'openapi_cached': (lambda i: ("GET", "/openapi.json", b"", b"", ()), None),
+    }
+    results = {}
+    for name, (make_request, before) in scenarios.items():
+        results[name] = asyncio.run(load(app, make_request, requests, concurrency, before))
+
+    # A login hashes the password with scrypt on purpose, far fewer requests
+    with open(os.environ["AUTH_USERS_PATH"], 'w') as f:
+        json.dump({"bench": {"password_hash": passwords.hash_password("bench")}}, f)
+    results['auth_login'] = asyncio.run(load(
+        app, lambda i: ("POST", "/auth/login", b"", login, json_headers), max(10, requests // 50), concurrency))
+
+    # A regeneration is much slower, fewer requests and no concurrency
+    regenerate_requests = max(10, requests // 100)
+    results['openapi_regenerate'] = asyncio.run(load(
+        app, scenarios['openapi_cached'][0], regenerate_requests, 1, before=main.wrapper.openapi_cache.invalidate))
+    results.update(asyncio.run(module_toggle(app, target, max(5, requests // 200))))
+    return results
+
+
+def run_startup(sizes: list, runs: int, base_env: dict) -> dict:
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="bench_startup_") as work_dir:
+            addons_dir = os.path.join(work_dir, 'addons')
+            synthetic_addons(addons_dir, size)
+            env = {**base_env, **bench_env(work_dir, addons_dir)}
+            samples = []
+            # The first run builds the addon index and the bytecode of the addons
+            for _ in range(runs + 1):
+                start = time.perf_counter()
+                output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=ROOT_DIR, env=env, check=True,
+                                        capture_output=True, text=True).stdout
+                sample = json.loads(output.strip().splitlines()[-1])
+                sample['process_ms'] = (time.perf_counter() - start) * 1000
+                samples.append(sample)
+        cold, warm = samples[0], samples[1:]
+        results[str(size)] = {
+            'routes': size * ROUTES_PER_MODULE,
+            'cold_index_first_request_ms': round(cold['first_request_ms'], 1),
+            **{key: round(statistics.median(sample[key] for sample in warm), 1)
+               for key in ('import_ms', 'first_request_ms', 'process_ms')},
+        }
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Metrics where a higher value is better, every other one is a duration
+HIGHER_IS_BETTER = ('rps',)
+COMPARED = ('rps', 'p50_ms', 'p99_ms', 'import_ms', 'first_request_ms')
+# Durations that moved by less than this are noise whatever the relative change
+NOISE_FLOOR_MS = 0.25
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Print every metric next to its baseline value.
+
+    Returns:
+        list: The (section, scenario, metric, change) that got worse by more than `tolerance`.
+    """
+    regressions = []
+    for section in ('http', 'startup'):
+        for scenario, metrics in results.get(section, {}).items():
+            old_metrics = baseline.get(section, {}).get(scenario)
+            if old_metrics is None:
+                continue
+            for metric in COMPARED:
+                if metric not in metrics or not old_metrics.get(metric):
+                    continue
+                change = metrics[metric] / old_metrics[metric] - 1
+                if metric in HIGHER_IS_BETTER:
+                    worse = -change
+                else:
+                    worse = change if metrics[metric] - old_metrics[metric] >= NOISE_FLOOR_MS else 0
+                flag = "  REGRESSION" if worse > tolerance else ""
+                print(f"{section:<8} {scenario:<20} {metric:<17} {old_metrics[metric]:>10} -> {metrics[metric]:>10}"
+                      f" {change:+7.1%}{flag}")
+                if flag:
+                    regressions.append((section, scenario, metric, round(change, 3)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", type=int, default=100, help="Addons in the tree of the request benchmarks")
+    parser.add_argument("--sizes", type=int, nargs='*', default=[10, 100, 1000], help="Addon tree sizes for startup")
+    parser.add_argument("--startup-runs", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--save", help="Write the results to this baseline file")
+    parser.add_argument("--compare", help="Compare the results with this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'modules': args.modules,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+        },
+    }
+    base_env = dict(os.environ)
+    results['startup'] = run_startup(args.sizes, args.startup_runs, base_env)
+
+    work_dir = tempfile.mkdtemp(prefix="bench_suite_")
+    addons_dir = os.path.join(work_dir, 'addons')
+    synthetic_addons(addons_dir, args.modules)
+    os.environ.update(bench_env(work_dir, addons_dir))
+    sys.path.insert(0, ROOT_DIR)
+    results['http'] = run_http(args.modules, args.requests, args.concurrency)
+
+    print(f"{'scenario':<20} {'rps':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, metrics in results['http'].items():
+        print(f"{name:<20} {metrics['rps']:>10} {metrics['p50_ms']:>9} {metrics['p99_ms']:>9}")
+    print(f"\n{'modules':<8} {'import ms':>10} {'first request ms':>17} {'cold index ms':>14}")
+    for size, metrics in results['startup'].items():
+        print(f"{size:<8} {metrics['import_ms']:>10} {metrics['first_request_ms']:>17} "
+              f"{metrics['cold_index_first_request_ms']:>14}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nAgainst {args.compare} (commit {baseline.get('meta', {}).get('commit')}):")
+        regressions = compare(results, baseline, args.tolerance)
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or '.', exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Gunicorn settings and server hooks, loaded by the `gunicorn` launcher with `-c`.
+
+GUNICORN_PRELOAD=true imports the app and discovers the addons once in the master. The
+GC is kept off while loading, the loaded heap is frozen before the workers are forked
+and the workers re-create what can't cross a fork, so they share the master's pages
+copy-on-write instead of each building its own copy.
+"""
+# Standard library imports
+import gc
+import os
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "false").lower() in ("1", "true", "yes", "on")
+
+if preload_app:
+    # Collections while importing would only touch pages the workers are about to share
+    gc.disable()
+
+
+def on_starting(server):
+    # Module enable/remove decisions are shared by the workers of this master only
+    from app.base.routing_utils.module_sync import ModuleStateStore
+    ModuleStateStore().reset(os.getpid())
+    # Metrics files left by a previous run would be summed with this one
+    from app.base.metrics import collector
+    collector.reset()
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app.base.prefork import freeze
+        freeze()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app.base.prefork import after_fork
+        after_fork()
+
+
+def post_worker_init(worker):
+    # The worker reset every signal it inherited (UvicornWorker.init_signals), so the settings
+    # SIGHUP handler installed while the master preloaded the app is gone. Reload settings
+    # with `kill -HUP <worker pid>`; a SIGHUP to the master restarts the workers instead.
+    from app.base.settings import settings
+    settings.install_signal_handler()
+    # A worker forked by a preloaded master starts with the master's copy, which may be old
+    settings.request_reload()
+
+
+def child_exit(server, worker):
+    from app.base.metrics import collector
+    collector.remove_worker(worker.pid)